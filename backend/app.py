@@ -28,6 +28,7 @@ from routes.cybersecurity_routes import cybersecurity_bp
 from routes.emergency_routes import emergency_bp
 from routes.admin_routes import admin_bp
 from routes.chatbot_routes import chatbot_bp
+from routes.map_routes import map_bp
 from sse import create_sse_blueprint
 
 # Register blueprints
@@ -38,8 +39,25 @@ app.register_blueprint(cybersecurity_bp, url_prefix='/api/cybersecurity')
 app.register_blueprint(emergency_bp, url_prefix='/api/emergency')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
 app.register_blueprint(chatbot_bp, url_prefix='/api/chatbot')
+app.register_blueprint(map_bp, url_prefix='/api/map')
 app.register_blueprint(create_sse_blueprint(), url_prefix='/api/sse')
 
+# Send queued SOS alerts, including any left over from before a restart
+from services.alert_dispatcher import alert_relay
+# Live location fixes are kept in memory and written to the database in batches
+from services.location_buffer import location_buffer
+
+
+def start_background_threads():
+    """Start this process's alert relay and location writer"""
+    alert_relay.start(app)
+    location_buffer.start(app)
+
+
+# Under gunicorn every worker starts its own from post_worker_init (with preload the master imports this module)
+if os.getenv('BACKGROUND_THREADS_START') != 'post_worker_init':
+    start_background_threads()
+
 
 # Authentication routes
 @app.route('/api/auth/register/woman', methods=['POST'])
@@ -95,6 +113,17 @@ def health_check():
     return jsonify({'status': 'healthy', 'message': 'SafeSpace API is running'}), 200
 
 
+@app.route('/api/health/memory', methods=['GET'])
+def memory_check():
+    """Memory usage of the worker serving this request"""
+    from services.shared_layers import process_memory
+    from services.city_registry import city_registry
+    return jsonify({
+        'memory': process_memory(),
+        'cities': city_registry.status()
+    }), 200
+
+
 # Create database tables and default admin
 def init_database():
     """Initialize database with tables and default admin"""
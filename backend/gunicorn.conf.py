@@ -0,0 +1,72 @@
+"""
+Gunicorn configuration for the SafeSpace backend.
+
+Run with: gunicorn app:app
+(gunicorn picks up this file automatically from the working directory)
+
+The master process builds the safety layer arrays and grid indexes once and
+places them in shared memory before forking; workers attach to those segments
+instead of each parsing the CSVs again. Check /api/health/memory on several
+workers to confirm: shared layers show up under RssShmem, not RssAnon.
+
+The master also runs a Unix-socket hub (EVENT_BROKER=socket, the default
+here) so an SOS published on one worker reaches SSE subscribers on all of
+them.
+
+Workers default to gevent: an open SSE stream is a parked greenlet rather
+than an OS thread, so dashboards cannot starve the SOS endpoints. Set
+GUNICORN_WORKER_CLASS=sync to go back to one request per process.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Workers inherit this; set EVENT_BROKER=local for a single worker
+os.environ.setdefault('EVENT_BROKER', 'socket')
+# Background threads start in post_worker_init, never in the master (which imports the app when preloading)
+os.environ['BACKGROUND_THREADS_START'] = 'post_worker_init'
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+# Concurrent connections (including SSE subscribers) per gevent worker
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 2000))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+
+def on_starting(server):
+    """Export shared layers and start the event hub in the master before any worker exists"""
+    from services.city_registry import city_registry
+    from services.broker import start_hub
+    city_registry.share_layers()
+    start_hub()
+
+
+def post_fork(server, worker):
+    from services.shared_layers import process_memory
+    memory = process_memory()
+    server.log.info(
+        "Worker %s started: rss=%s kB pss=%s kB shmem=%s kB",
+        worker.pid, memory.get('rss_kb'), memory.get('pss_kb'), memory.get('rssshmem_kb')
+    )
+
+
+def post_worker_init(worker):
+    """Start the worker's background threads once its app is loaded (and gevent has patched threading)"""
+    from app import start_background_threads
+    start_background_threads()
+
+
+def worker_exit(server, worker):
+    """Write any buffered location fixes before the worker goes away"""
+    from services.location_buffer import location_buffer
+    written = location_buffer.flush()
+    if written:
+        server.log.info("Worker %s flushed %s buffered location fix(es)", worker.pid, written)
+
+
+def on_exit(server):
+    from services.shared_layers import release_shared_layers
+    from services.broker import stop_hub
+    release_shared_layers()
+    stop_hub()
@@ -84,6 +84,7 @@ class SOSEvent(db.Model):
     
     # Relationship for location updates
     location_updates = db.relationship('LocationUpdate', backref='sos_event', lazy=True, cascade='all, delete-orphan')
+    alerts = db.relationship('AlertOutbox', backref='sos_event', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -122,6 +123,48 @@ class LocationUpdate(db.Model):
         }
 
 
+class AlertOutbox(db.Model):
+    """SMS/WhatsApp alerts to send, written in the same transaction as the SOS event"""
+    __tablename__ = 'alert_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    dispatch_id = db.Column(db.String(32), nullable=False, index=True)
+    sos_event_id = db.Column(db.Integer, db.ForeignKey('sos_events.id'), nullable=False)
+    woman_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    channel = db.Column(db.String(20), nullable=False)  # SMS, WHATSAPP
+    kind = db.Column(db.String(20), default='SOS')  # SOS, FOLLOW_UP (repeat trigger: still active / new location)
+    contact_name = db.Column(db.String(100))
+    contact_phone = db.Column(db.String(20), nullable=False)
+    woman_name = db.Column(db.String(100))
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    battery_percentage = db.Column(db.Integer)
+    status = db.Column(db.String(20), default='PENDING', index=True)  # PENDING, SENDING, SENT, FAILED
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    latency_ms = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'channel': self.channel,
+            'kind': self.kind,
+            'contact': self.contact_name,
+            'phone': self.contact_phone,
+            'status': self.status,
+            'attempts': self.attempts,
+            'latency_ms': self.latency_ms,
+            'last_error': self.last_error,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.status == 'PENDING' and self.next_attempt_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+
 class FlaggedZone(db.Model):
     """High-risk zones flagged by police"""
     __tablename__ = 'flagged_zones'
@@ -0,0 +1,58 @@
+from flask import Blueprint, request, jsonify, Response
+from auth import token_required, role_required
+from services.city_registry import city_registry
+from services.map_tiles import TILE_FORMATS, TILE_MAX_AGE, valid_tile, tile_etag, get_tile, tile_cache
+
+map_bp = Blueprint('map', __name__)
+
+
+@map_bp.route('/layers', methods=['GET'])
+def list_tile_layers():
+    """Cities and layers available as map tiles, with URL templates"""
+    return jsonify({
+        'success': True,
+        'cities': [
+            {
+                'slug': city.slug,
+                'name': city.name,
+                'bounds': city.bounds,
+                'layers': [spec.name for spec in city.layer_specs],
+                'tiles': {
+                    fmt: f"{request.script_root}/api/map/tiles/{city.slug}/{{layer}}/{{z}}/{{x}}/{{y}}.{fmt}"
+                    for fmt in TILE_FORMATS
+                }
+            }
+            for city in city_registry.cities.values()
+        ]
+    }), 200
+
+
+@map_bp.route('/tiles/<city_slug>/<layer_name>/<int:z>/<int:x>/<int:y>.<fmt>', methods=['GET'])
+def get_layer_tile(city_slug, layer_name, z, x, y, fmt):
+    """Slippy-map tile of a safety layer as PNG or JSON vector data"""
+    city = city_registry.cities.get(city_slug)
+    if city is None or fmt not in TILE_FORMATS or not valid_tile(z, x, y):
+        return jsonify({'error': 'Tile not found'}), 404
+
+    layers = city_registry.get_layers(city)
+    if layer_name not in layers:
+        return jsonify({'error': 'Layer not found'}), 404
+
+    # Tiles only change with the layer data, so revalidation is a hash compare
+    etag = tile_etag(layers[layer_name])
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(get_tile(city, layers, layer_name, z, x, y, fmt), mimetype=TILE_FORMATS[fmt])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = TILE_MAX_AGE
+    return response
+
+
+@map_bp.route('/tiles/stats', methods=['GET'])
+@token_required
+@role_required('ADMIN')
+def tile_cache_stats(current_user):
+    """Tile cache usage of the worker serving this request"""
+    return jsonify({'success': True, 'cache': tile_cache.stats()}), 200
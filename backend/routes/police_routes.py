@@ -1,10 +1,16 @@
 from flask import Blueprint, request, jsonify
 from models import db, SOSEvent, FlaggedZone, ChatMessage, Issue
 from auth import token_required, role_required
+from services.response_cache import response_cache, cached_response
+from services.location_buffer import location_buffer
+from services.columnar import encode_columns, wants_columnar, MIMETYPE as COLUMNAR_MIMETYPE
+from sqlalchemy import func
 from datetime import datetime
 
 police_bp = Blueprint('police', __name__)
 
+RISK_LEVELS = ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+
 
 @police_bp.route('/sos-feed', methods=['GET'])
 @token_required
@@ -16,7 +22,7 @@ def get_sos_feed(current_user):
     
     return jsonify({
         'success': True,
-        'sos_events': [event.to_dict() for event in active_sos]
+        'sos_events': [location_buffer.overlay(event.to_dict()) for event in active_sos]
     }), 200
 
 
@@ -35,7 +41,7 @@ def get_sos_details(current_user, sos_id):
     
     return jsonify({
         'success': True,
-        'sos_event': sos_event.to_dict(),
+        'sos_event': location_buffer.overlay(sos_event.to_dict()),
         'location_updates': location_updates
     }), 200
 
@@ -54,8 +60,7 @@ def flag_zone(current_user):
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
     # Validate risk level
-    valid_risk_levels = ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
-    if data['risk_level'] not in valid_risk_levels:
+    if data['risk_level'] not in RISK_LEVELS:
         return jsonify({'error': 'Invalid risk level'}), 400
     
     # Create flagged zone
@@ -84,17 +89,43 @@ def flag_zone(current_user):
 @role_required('POLICE', 'WOMAN')
 def get_flagged_zones(current_user):
     """Get all flagged zones (active only for women, all for police)"""
-    if current_user.role == 'WOMAN':
-        # Women only see active zones
-        zones = FlaggedZone.query.filter_by(is_active=True).order_by(FlaggedZone.timestamp.desc()).all()
-    else:
-        # Police see all zones
-        zones = FlaggedZone.query.order_by(FlaggedZone.timestamp.desc()).all()
+    active_only = current_user.role == 'WOMAN'
+    binary = wants_columnar()
+    
+    def build():
+        if active_only:
+            # Women only see active zones
+            zones = FlaggedZone.query.filter_by(is_active=True).order_by(FlaggedZone.timestamp.desc()).all()
+        else:
+            # Police see all zones
+            zones = FlaggedZone.query.order_by(FlaggedZone.timestamp.desc()).all()
+        if binary:
+            # Map markers only: risk levels as indexes into RISK_LEVELS, text fields omitted
+            return encode_columns({
+                'id': [zone.id for zone in zones],
+                'lat': [zone.latitude for zone in zones],
+                'lon': [zone.longitude for zone in zones],
+                'risk': [RISK_LEVELS.index(zone.risk_level) if zone.risk_level in RISK_LEVELS else -1 for zone in zones],
+                'active': [1 if zone.is_active else 0 for zone in zones]
+            }, {'success': True, 'risk_levels': RISK_LEVELS}, types={'id': 'u', 'risk': 'i', 'active': 'u'})
+        return {
+            'success': True,
+            'zones': [zone.to_dict() for zone in zones]
+        }
     
-    return jsonify({
-        'success': True,
-        'zones': [zone.to_dict() for zone in zones]
-    }), 200
+    entry = response_cache.get(('flagged-zones', active_only, binary), flagged_zones_version(), build,
+                               COLUMNAR_MIMETYPE if binary else 'application/json')
+    return cached_response(entry, public=False)
+
+
+def flagged_zones_version():
+    """Cheap aggregate that changes whenever a zone is flagged, unmarked or deleted"""
+    return tuple(str(value) for value in db.session.query(
+        func.count(FlaggedZone.id),
+        func.max(FlaggedZone.id),
+        func.max(FlaggedZone.timestamp),
+        func.max(FlaggedZone.unmarked_at)
+    ).one())
 
 
 @police_bp.route('/flagged-zones/<int:zone_id>/unmark', methods=['PUT'])
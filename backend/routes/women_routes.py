@@ -1,13 +1,22 @@
 from flask import Blueprint, request, jsonify
 from models import db, EmergencyContact, SOSEvent, LocationUpdate, AbuseMonitoring, FlaggedZone
 from auth import token_required, role_required
-from services.sms_service import send_bulk_emergency_sms
-from services.whatsapp_service import send_bulk_emergency_whatsapp
+from services.alert_dispatcher import enqueue_alerts, schedule_follow_up, dispatch_status, alert_relay
 from services.routes_service import calculate_safe_routes
-from datetime import datetime
+from services.location_ingest import parse_fixes, MAX_LOCATION_BATCH
+from services.location_buffer import location_buffer, LOCATION_WRITE_BEHIND
+from sse import publish_new_sos, publish_location_update, publish_sos_resolved
+from sqlalchemy import func
+from datetime import datetime, timedelta
+import numpy as np
+import os
 
 women_bp = Blueprint('women', __name__)
 
+# Repeat SOS triggers within this many seconds of an active SOS's last trigger or location fix update it
+# instead of starting another
+SOS_COALESCE_WINDOW = int(os.getenv('SOS_COALESCE_WINDOW', 120))
+
 
 @women_bp.route('/emergency-contacts', methods=['GET'])
 @token_required
@@ -108,6 +117,13 @@ def trigger_sos(current_user):
     if not contacts:
         return jsonify({'error': 'Please add emergency contacts before triggering SOS'}), 400
     
+    open_event = SOSEvent.query.filter_by(
+        woman_id=current_user.id,
+        status='ACTIVE'
+    ).order_by(SOSEvent.id.desc()).first()
+    if open_event and last_activity(open_event) >= datetime.utcnow() - timedelta(seconds=SOS_COALESCE_WINDOW):
+        return coalesce_sos(current_user, open_event, data, contacts)
+    
     # Create SOS event
     sos_event = SOSEvent(
         woman_id=current_user.id,
@@ -128,36 +144,79 @@ def trigger_sos(current_user):
         monitoring.sos_count += 1
         monitoring.last_updated = datetime.utcnow()
     
-    db.session.commit()
+    # SMS and WhatsApp alerts are queued in the same transaction and sent by the relay
+    dispatch_id = enqueue_alerts(sos_event, current_user, contacts)
     
-    # Send SMS and WhatsApp alerts to all emergency contacts
-    contact_list = [{'contact_name': c.contact_name, 'contact_phone': c.contact_phone} for c in contacts]
+    db.session.commit()
+    alert_relay.notify()
+    publish_new_sos(sos_event, current_user)
     
-    sms_results = send_bulk_emergency_sms(
-        contact_list,
-        current_user.name,
-        data['latitude'],
-        data['longitude'],
-        data.get('battery_percentage', 0)
+    return jsonify({
+        'success': True,
+        'message': 'SOS triggered successfully',
+        'sos_event': sos_event.to_dict(),
+        'dispatch_id': dispatch_id,
+        'alerts': dispatch_status(dispatch_id)
+    }), 201
+
+
+def last_activity(sos_event):
+    """When the phone last reported on this SOS: the trigger, a repeat trigger or a location fix"""
+    last_update = db.session.query(func.max(LocationUpdate.timestamp)).filter(
+        LocationUpdate.sos_event_id == sos_event.id
+    ).scalar()
+    times = [sos_event.timestamp, last_update, location_buffer.last_fix_time(sos_event.id)]
+    return max(time for time in times if time is not None)
+
+
+def coalesce_sos(current_user, sos_event, data, contacts):
+    """Attach a repeat trigger to the open SOS as a location update with one follow-up alert"""
+    location_update = LocationUpdate(
+        sos_event_id=sos_event.id,
+        latitude=data['latitude'],
+        longitude=data['longitude'],
+        battery_percentage=data.get('battery_percentage', 0),
+        timestamp=datetime.utcnow()
     )
     
-    whatsapp_results = send_bulk_emergency_whatsapp(
-        contact_list,
-        current_user.name,
-        data['latitude'],
-        data['longitude'],
-        data.get('battery_percentage', 0)
-    )
+    # The follow-up alert takes its position from the SOS, so that is still updated here
+    sos_event.latitude = data['latitude']
+    sos_event.longitude = data['longitude']
+    sos_event.battery_percentage = data.get('battery_percentage', 0)
+    
+    dispatch_id = schedule_follow_up(sos_event, current_user, contacts)
+    if not LOCATION_WRITE_BEHIND:
+        db.session.add(location_update)
+    
+    db.session.commit()
+    if LOCATION_WRITE_BEHIND:
+        location_buffer.add(location_update)
+    publish_location_update(sos_event, location_update, current_user)
     
     return jsonify({
         'success': True,
-        'message': 'SOS triggered successfully',
+        'message': 'SOS already active; location updated',
+        'coalesced': True,
         'sos_event': sos_event.to_dict(),
-        'alerts_sent': {
-            'sms': sms_results,
-            'whatsapp': whatsapp_results
-        }
-    }), 201
+        'dispatch_id': dispatch_id,
+        'alerts': dispatch_status(dispatch_id)
+    }), 200
+
+
+@women_bp.route('/sos/alerts/<dispatch_id>', methods=['GET'])
+@token_required
+@role_required('WOMAN')
+def get_alert_dispatch(current_user, dispatch_id):
+    """Delivery status of the SMS and WhatsApp alerts for an SOS"""
+    alerts = dispatch_status(dispatch_id, woman_id=current_user.id)
+    
+    if not alerts:
+        return jsonify({'error': 'Alert dispatch not found'}), 404
+    
+    return jsonify({
+        'success': True,
+        'alerts': alerts
+    }), 200
 
 
 @women_bp.route('/sos/<int:sos_id>/location', methods=['POST'])
@@ -183,16 +242,22 @@ def update_sos_location(current_user, sos_id):
         sos_event_id=sos_id,
         latitude=data['latitude'],
         longitude=data['longitude'],
-        battery_percentage=data.get('battery_percentage', 0)
+        battery_percentage=data.get('battery_percentage', 0),
+        timestamp=datetime.utcnow()
     )
     
-    # Update SOS event with latest location
-    sos_event.latitude = data['latitude']
-    sos_event.longitude = data['longitude']
-    sos_event.battery_percentage = data.get('battery_percentage', 0)
-    
-    db.session.add(location_update)
-    db.session.commit()
+    if LOCATION_WRITE_BEHIND:
+        # Stored with the next batch; subscribers and the police feed see it right away
+        location_buffer.add(location_update)
+    else:
+        # Update SOS event with latest location
+        sos_event.latitude = data['latitude']
+        sos_event.longitude = data['longitude']
+        sos_event.battery_percentage = data.get('battery_percentage', 0)
+        
+        db.session.add(location_update)
+        db.session.commit()
+    publish_location_update(sos_event, location_update, current_user)
     
     return jsonify({
         'success': True,
@@ -200,6 +265,83 @@ def update_sos_location(current_user, sos_id):
     }), 200
 
 
+@women_bp.route('/sos/<int:sos_id>/locations', methods=['POST'])
+@token_required
+@role_required('WOMAN')
+def upload_sos_locations(current_user, sos_id):
+    """Store a batch of timestamped fixes buffered on the phone, with the live fixes or in one insert"""
+    sos_event = SOSEvent.query.filter_by(id=sos_id, woman_id=current_user.id).first()
+
+    if not sos_event:
+        return jsonify({'error': 'SOS event not found'}), 404
+
+    if sos_event.status != 'ACTIVE':
+        return jsonify({'error': 'SOS is not active'}), 400
+
+    data = request.get_json(silent=True) or {}
+    fixes = data.get('fixes')
+
+    if not isinstance(fixes, list) or not fixes or not all(isinstance(fix, dict) for fix in fixes):
+        return jsonify({'error': 'fixes must be a non-empty list of locations'}), 400
+
+    if len(fixes) > MAX_LOCATION_BATCH:
+        return jsonify({'error': f'At most {MAX_LOCATION_BATCH} fixes per batch'}), 400
+
+    latitudes, longitudes, batteries, times, rejected = parse_fixes(fixes, sos_event.timestamp, datetime.utcnow())
+
+    # Fixes already stored or still in this worker's buffer (a retried upload) are skipped; the buffer
+    # is read first so a flush finishing in between is seen by the query, which covers the batch's time range
+    known = []
+    if len(times):
+        known = location_buffer.unsaved_times(sos_id)
+        known += [row.timestamp for row in db.session.query(LocationUpdate.timestamp).filter(
+            LocationUpdate.sos_event_id == sos_id,
+            LocationUpdate.timestamp >= times[0].item()
+        )]
+    stored = np.array(known, dtype='datetime64[us]')
+    new = ~np.isin(times, stored)
+
+    rows = [{
+        'sos_event_id': sos_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'battery_percentage': battery,
+        'timestamp': timestamp
+    } for latitude, longitude, battery, timestamp in zip(
+        latitudes[new].tolist(), longitudes[new].tolist(), batteries[new].tolist(), times[new].tolist()
+    )]
+
+    # The SOS only moves if the batch holds its newest fix (an old buffer can arrive after live updates,
+    # including ones another worker has not written yet)
+    newest_live = location_buffer.last_fix_time(sos_id)
+    latest = rows[-1] if rows and not (stored > np.datetime64(rows[-1]['timestamp'], 'us')).any() else None
+    if latest and newest_live is not None and newest_live > latest['timestamp']:
+        latest = None
+
+    if LOCATION_WRITE_BEHIND:
+        # Written with the next flush, which also moves the SOS to ``latest``
+        location_buffer.add_rows(rows, latest)
+    else:
+        if rows:
+            db.session.execute(LocationUpdate.__table__.insert(), rows)
+        if latest:
+            sos_event.latitude = latest['latitude']
+            sos_event.longitude = latest['longitude']
+            sos_event.battery_percentage = latest['battery_percentage']
+        db.session.commit()
+
+    if latest:
+        publish_location_update(sos_event, LocationUpdate(**latest), current_user)
+
+    return jsonify({
+        'success': True,
+        'message': f'{len(rows)} location(s) stored',
+        'accepted': len(rows),
+        'duplicates': len(fixes) - len(rejected) - len(rows),
+        'rejected': rejected.tolist()
+    }), 200
+
+
 @women_bp.route('/sos/<int:sos_id>/cancel', methods=['PUT'])
 @token_required
 @role_required('WOMAN')
@@ -214,6 +356,7 @@ def cancel_sos(current_user, sos_id):
     sos_event.resolved_at = datetime.utcnow()
     
     db.session.commit()
+    publish_sos_resolved(sos_event, current_user)
     
     return jsonify({
         'success': True,
@@ -0,0 +1,275 @@
+import os
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import or_, and_
+from models import db, AlertOutbox
+from services.process_local import PerProcess
+from services.provider_client import StubClient
+from services.sms_service import sms_client, FAST2SMS_BATCH_SIZE
+from services.whatsapp_service import whatsapp_client
+
+# live: Fast2SMS and WhatsApp; stub: log and succeed (or fail at ALERT_STUB_FAILURE_RATE) offline
+ALERT_PROVIDER = os.getenv('ALERT_PROVIDER', 'live')
+ALERT_STUB_FAILURE_RATE = float(os.getenv('ALERT_STUB_FAILURE_RATE', 0))
+# Provider requests in flight at once, across all SOS events in this process
+ALERT_WORKERS = int(os.getenv('ALERT_WORKERS', 8))
+# Outbox rows claimed per relay pass
+ALERT_BATCH_SIZE = int(os.getenv('ALERT_BATCH_SIZE', 50))
+# Seconds between outbox polls when nothing wakes the relay
+ALERT_RELAY_INTERVAL = float(os.getenv('ALERT_RELAY_INTERVAL', 2))
+# A SENDING row whose claim is older than this (its worker died) is claimed again
+ALERT_CLAIM_TIMEOUT = int(os.getenv('ALERT_CLAIM_TIMEOUT', 60))
+# Repeat triggers are batched into one follow-up sent this many seconds after the first repeat
+SOS_FOLLOWUP_DELAY = float(os.getenv('SOS_FOLLOWUP_DELAY', 30))
+
+CHANNELS = ('SMS', 'WHATSAPP')
+
+
+def retry_policy(channel):
+    """(max attempts, first backoff seconds, max backoff seconds), overridable per channel"""
+    def setting(name, default):
+        return float(os.getenv(f'ALERT_{channel}_{name}', os.getenv(f'ALERT_{name}', default)))
+    return int(setting('MAX_ATTEMPTS', 5)), setting('BACKOFF_BASE', 2), setting('BACKOFF_MAX', 300)
+
+
+RETRY_POLICIES = {channel: retry_policy(channel) for channel in CHANNELS}
+
+
+PROVIDERS = {
+    'live': {'SMS': sms_client, 'WHATSAPP': whatsapp_client},
+    'stub': {
+        'SMS': StubClient('SMS', ALERT_STUB_FAILURE_RATE, max_batch=FAST2SMS_BATCH_SIZE),
+        'WHATSAPP': StubClient('WhatsApp', ALERT_STUB_FAILURE_RATE)
+    },
+}
+
+
+def enqueue_alerts(sos_event, woman, contacts, kind='SOS', delay=0):
+    """Add an outbox row per contact and channel to the current session; returns the dispatch id.
+
+    The caller commits them together with the SOS event, then calls
+    ``alert_relay.notify()``.
+    """
+    dispatch_id = uuid.uuid4().hex
+    send_at = datetime.utcnow() + timedelta(seconds=delay)
+    for contact in contacts:
+        for channel in CHANNELS:
+            db.session.add(AlertOutbox(
+                dispatch_id=dispatch_id,
+                sos_event=sos_event,
+                woman_id=woman.id,
+                channel=channel,
+                kind=kind,
+                contact_name=contact.contact_name,
+                contact_phone=contact.contact_phone,
+                woman_name=woman.name,
+                latitude=sos_event.latitude,
+                longitude=sos_event.longitude,
+                battery_percentage=sos_event.battery_percentage,
+                status='PENDING',
+                attempts=0,
+                next_attempt_at=send_at
+            ))
+    return dispatch_id
+
+
+def schedule_follow_up(sos_event, woman, contacts):
+    """Queue (or refresh) the single "still active" follow-up for a repeat trigger; returns its dispatch id.
+
+    While a follow-up for this SOS is still waiting to be sent, later repeats
+    only move its location, so a burst of triggers costs one message per contact.
+    """
+    pending = AlertOutbox.query.filter_by(sos_event_id=sos_event.id, kind='FOLLOW_UP', status='PENDING').all()
+    if pending:
+        updated = AlertOutbox.query.filter(
+            AlertOutbox.id.in_([row.id for row in pending]), AlertOutbox.status == 'PENDING'
+        ).update({
+            'latitude': sos_event.latitude,
+            'longitude': sos_event.longitude,
+            'battery_percentage': sos_event.battery_percentage
+        }, synchronize_session=False)
+        if updated == len(pending):
+            return pending[0].dispatch_id
+    return enqueue_alerts(sos_event, woman, contacts, kind='FOLLOW_UP', delay=SOS_FOLLOWUP_DELAY)
+
+
+def dispatch_status(dispatch_id, woman_id=None):
+    """Delivery summary of one dispatch, or None if it does not exist (or is not this woman's)"""
+    query = AlertOutbox.query.filter_by(dispatch_id=dispatch_id)
+    if woman_id is not None:
+        query = query.filter_by(woman_id=woman_id)
+    rows = query.order_by(AlertOutbox.id).all()
+    if not rows:
+        return None
+
+    counts = {status: 0 for status in ('PENDING', 'SENDING', 'SENT', 'FAILED')}
+    for row in rows:
+        counts[row.status] = counts.get(row.status, 0) + 1
+    return {
+        'dispatch_id': dispatch_id,
+        'sos_id': rows[0].sos_event_id,
+        'complete': counts['PENDING'] + counts['SENDING'] == 0,
+        'pending': counts['PENDING'] + counts['SENDING'],
+        'sent': counts['SENT'],
+        'failed': counts['FAILED'],
+        'deliveries': [row.to_dict() for row in rows]
+    }
+
+
+class AlertRelay(PerProcess):
+    """Background thread that drains the alert outbox.
+
+    Each pass claims a batch of due rows (PENDING and past next_attempt_at, or
+    SENDING with an expired claim) by stamping them with a claim token in one
+    UPDATE, so several workers can relay the same table without sending a row
+    twice. Claimed rows carrying the same message on the same channel are
+    handed to the provider client together (Fast2SMS sends them in one
+    request) on the relay's pool; results are written back by the sending
+    thread, and failures are retried with exponential backoff until the
+    channel's attempt limit. Each provider request (one WhatsApp contact, or
+    up to a Fast2SMS batch of numbers) is its own task, so they go out in
+    parallel up to the provider client's concurrency limit.
+    """
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._app = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _init_process(self):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=ALERT_WORKERS, thread_name_prefix='alerts')
+        threading.Thread(target=self._run, name='alert-relay', daemon=True).start()
+
+    def start(self, app):
+        """Start this process's relay thread; called once per gunicorn worker"""
+        self._app = app
+        self.ensure_process()
+
+    def notify(self):
+        """Wake the relay now instead of at its next poll"""
+        if self._app is not None:
+            # A worker forked after start() without calling it again gets its own relay here
+            self.ensure_process()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(ALERT_RELAY_INTERVAL)
+            self._wake.clear()
+            with self._app.app_context():
+                try:
+                    while self.relay_once() == ALERT_BATCH_SIZE:
+                        pass
+                except Exception as e:
+                    print(f"Alert relay error: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _due(self, now):
+        return or_(
+            and_(AlertOutbox.status == 'PENDING', AlertOutbox.next_attempt_at <= now),
+            and_(AlertOutbox.status == 'SENDING',
+                 AlertOutbox.claimed_at < now - timedelta(seconds=ALERT_CLAIM_TIMEOUT))
+        )
+
+    def claim(self, limit):
+        now = datetime.utcnow()
+        ids = [row.id for row in db.session.query(AlertOutbox.id)
+               .filter(self._due(now))
+               .order_by(AlertOutbox.id)
+               .limit(limit)]
+        if not ids:
+            return []
+
+        token = uuid.uuid4().hex
+        AlertOutbox.query.filter(AlertOutbox.id.in_(ids), self._due(now)).update({
+            'status': 'SENDING',
+            'claimed_by': token,
+            'claimed_at': now,
+            'attempts': AlertOutbox.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        return AlertOutbox.query.filter_by(claimed_by=token, status='SENDING').all()
+
+    def relay_once(self):
+        """Claim and submit one batch; returns the number of rows claimed"""
+        with self._lock:
+            capacity = min(ALERT_BATCH_SIZE, ALERT_WORKERS * 4 - self._in_flight)
+        if capacity <= 0:
+            return 0
+
+        rows = self.claim(capacity)
+        clients = PROVIDERS.get(ALERT_PROVIDER, PROVIDERS['live'])
+
+        groups = {}
+        for row in rows:
+            message = (row.channel, row.woman_name, row.latitude, row.longitude, row.battery_percentage,
+                       row.kind == 'FOLLOW_UP')
+            groups.setdefault(message, []).append((row.id, row.contact_phone, row.attempts))
+
+        for (channel, *alert), recipients in groups.items():
+            client = clients[channel]
+            by_phone = {}
+            for recipient in recipients:
+                by_phone.setdefault(recipient[1], []).append(recipient)
+            for phones in client.batches(list(by_phone)):
+                batch = [recipient for phone in phones for recipient in by_phone[phone]]
+                with self._lock:
+                    self._in_flight += len(batch)
+                self._executor.submit(self._deliver, rows[0].claimed_by, channel, client, alert, phones, batch)
+        return len(rows)
+
+    def _deliver(self, token, channel, client, alert, phones, recipients):
+        """Send one provider request to ``phones`` and record the outcome on ``recipients`` (row id, phone, attempts)"""
+        started = time.monotonic()
+        error = None
+        try:
+            if client.configured():
+                success = client.send_batch(phones, client.format_message(*alert))
+            else:
+                success = False
+                error = f'{client.name} credentials not configured'
+        except Exception as e:
+            success = False
+            error = str(e)
+        latency_ms = round((time.monotonic() - started) * 1000)
+
+        now = datetime.utcnow()
+        max_attempts, base, cap = RETRY_POLICIES[channel]
+        try:
+            with self._app.app_context():
+                for row_id, phone, attempts in recipients:
+                    if success:
+                        values = {'status': 'SENT', 'sent_at': now, 'last_error': None}
+                    elif attempts >= max_attempts:
+                        values = {'status': 'FAILED', 'last_error': error or 'Provider rejected the message'}
+                    else:
+                        delay = min(cap, base * 2 ** (attempts - 1)) * random.uniform(1, 1.2)
+                        values = {'status': 'PENDING', 'last_error': error or 'Provider rejected the message',
+                                  'next_attempt_at': now + timedelta(seconds=delay)}
+                    values['latency_ms'] = latency_ms
+                    # Only if the claim is still ours (it may have expired and been re-claimed)
+                    AlertOutbox.query.filter_by(id=row_id, claimed_by=token).update(values, synchronize_session=False)
+                db.session.commit()
+                db.session.remove()
+        except Exception as e:
+            print(f"Alert status update failed: {str(e)}")
+        finally:
+            with self._lock:
+                was_full = self._in_flight >= ALERT_WORKERS * 4
+                self._in_flight -= len(recipients)
+            if was_full:
+                self.notify()
+
+
+alert_relay = AlertRelay()
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import queue
+import socket
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+
+# local: events stay in the publishing process; socket: fanned out to every worker through a hub
+EVENT_BROKER = os.getenv('EVENT_BROKER', 'local')
+EVENT_BROKER_SOCKET = os.getenv(
+    'EVENT_BROKER_SOCKET', os.path.join(tempfile.gettempdir(), 'safespace-events.sock')
+)
+RECONNECT_DELAY = 1.0
+# Lines the hub holds for one worker before it disconnects that worker as too slow
+EVENT_HUB_CLIENT_QUEUE = int(os.getenv('EVENT_HUB_CLIENT_QUEUE', 10000))
+
+
+def next_event_id(last_id):
+    """Strictly increasing, and never below the current time in microseconds"""
+    return max(last_id + 1, time.time_ns() // 1000)
+
+
+class Broker(ABC):
+    """Carries bus messages (dicts with type, data, ref_id and id) to every process's EventBus.
+
+    ``start(on_message)`` is called once per process; ``on_message`` must then
+    be called exactly once per published message, in the same order for
+    every subscriber process.
+    """
+
+    @abstractmethod
+    def start(self, on_message):
+        """Begin delivering messages from every process to ``on_message``"""
+
+    @abstractmethod
+    def publish(self, message):
+        """Send ``message`` to every process, this one included"""
+
+    def close(self):
+        pass
+
+
+class LocalBroker(Broker):
+    """Single process: publishing delivers straight to this process's bus"""
+
+    def start(self, on_message):
+        self._on_message = on_message
+
+    def publish(self, message):
+        self._on_message(message)
+
+
+class SocketBroker(Broker):
+    """Client of a BrokerHub over a Unix-domain socket (newline-delimited JSON).
+
+    The hub stamps ids and echoes every message to all connected workers,
+    including the sender. While the hub is unreachable messages are
+    delivered locally only, so this worker's subscribers still see them.
+    """
+
+    def __init__(self, path=EVENT_BROKER_SOCKET):
+        self.path = path
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._closed = False
+
+    def start(self, on_message):
+        self._on_message = on_message
+        self._connect()
+        threading.Thread(target=self._read_loop, name='event-broker', daemon=True).start()
+
+    def _connect(self):
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+        except OSError as e:
+            print(f"Event broker hub unavailable at {self.path}: {e}")
+            return None
+        with self._send_lock:
+            self._sock = sock
+        return sock
+
+    def _read_loop(self):
+        while not self._closed:
+            sock = self._sock or self._connect()
+            if sock is None:
+                time.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                with sock.makefile('rb') as stream:
+                    for line in stream:
+                        self._on_message(json.loads(line))
+            except (OSError, ValueError) as e:
+                print(f"Event broker connection lost: {e}")
+            with self._send_lock:
+                if self._sock is sock:
+                    self._sock = None
+            sock.close()
+
+    def publish(self, message):
+        line = json.dumps(message, separators=(',', ':')).encode() + b'\n'
+        with self._send_lock:
+            sock = self._sock
+            if sock is not None:
+                try:
+                    sock.sendall(line)
+                    return
+                except OSError as e:
+                    print(f"Event broker send failed, delivering locally: {e}")
+                    self._sock = None
+        self._on_message(message)
+
+    def close(self):
+        self._closed = True
+        with self._send_lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+
+class HubClient:
+    """One worker connection: the hub queues lines for it and a writer thread sends them.
+
+    A worker that stops reading only fills its own queue; once that is full
+    the hub disconnects it rather than stall the others, and its
+    SocketBroker reconnects.
+    """
+
+    def __init__(self, sock, on_closed, maxsize=EVENT_HUB_CLIENT_QUEUE):
+        self.sock = sock
+        self._on_closed = on_closed
+        self._outbox = queue.Queue(maxsize=maxsize)
+        threading.Thread(target=self._write_loop, name='event-hub-writer', daemon=True).start()
+
+    def put(self, line):
+        """Queue a line without blocking; returns False if the worker has fallen too far behind"""
+        try:
+            self._outbox.put_nowait(line)
+            return True
+        except queue.Full:
+            return False
+
+    def _write_loop(self):
+        while True:
+            line = self._outbox.get()
+            if line is None:
+                return
+            try:
+                self.sock.sendall(line)
+            except OSError:
+                self._on_closed(self)
+                return
+
+    def close(self):
+        self.sock.close()
+        while True:
+            try:
+                self._outbox.put_nowait(None)
+                return
+            except queue.Full:
+                try:
+                    self._outbox.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+class BrokerHub:
+    """Unix-domain socket hub, run by the gunicorn master.
+
+    Each line received from a worker gets the next event id and is queued
+    for every connected worker under one lock, so all workers see the same
+    events in the same order with the same ids. Sending happens on each
+    worker's own writer thread, outside the lock.
+    """
+
+    def __init__(self, path=EVENT_BROKER_SOCKET):
+        self.path = path
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._server = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(64)
+        threading.Thread(target=self._accept_loop, name='event-hub', daemon=True).start()
+        print(f"Event broker hub listening on {self.path}")
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            client = HubClient(sock, self._drop)
+            with self._lock:
+                self._clients.add(client)
+            threading.Thread(target=self._client_loop, args=(client,), daemon=True).start()
+
+    def _client_loop(self, client):
+        try:
+            with client.sock.makefile('rb') as stream:
+                for line in stream:
+                    self._broadcast(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        self._drop(client)
+
+    def _broadcast(self, message):
+        with self._lock:
+            self._last_id = next_event_id(self._last_id)
+            message['id'] = self._last_id
+            line = json.dumps(message, separators=(',', ':')).encode() + b'\n'
+            lagging = [client for client in self._clients if not client.put(line)]
+        for client in lagging:
+            print("Event broker hub dropping a worker that fell behind")
+            self._drop(client)
+
+    def _drop(self, client):
+        with self._lock:
+            if client not in self._clients:
+                return
+            self._clients.discard(client)
+        client.close()
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        with self._lock:
+            clients = list(self._clients)
+            self._clients.clear()
+        for client in clients:
+            client.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+_hub = None
+
+
+def start_hub():
+    """Start the hub in this process (the gunicorn master) when EVENT_BROKER=socket"""
+    global _hub
+    if EVENT_BROKER == 'socket' and _hub is None:
+        _hub = BrokerHub()
+        _hub.start()
+    return _hub
+
+
+def stop_hub():
+    global _hub
+    if _hub is not None:
+        _hub.stop()
+        _hub = None
+
+
+def create_broker():
+    if EVENT_BROKER == 'socket':
+        return SocketBroker()
+    if EVENT_BROKER != 'local':
+        print(f"Unknown EVENT_BROKER '{EVENT_BROKER}', using local")
+    return LocalBroker()
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from services.layer_store import Layer
+from services.layer_registry import DEFAULT_LAYER_SPECS, resolve_layer_specs
+from services import shared_layers
+from services.process_local import PerProcess
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CITY_DATA_DIR = os.getenv('CITY_DATA_DIR', os.path.join(BASE_DIR, 'data'))
+DEFAULT_CITY = os.getenv('DEFAULT_CITY', 'bangalore')
+
+# Cities whose layers have not been touched for this many seconds are unloaded
+CITY_IDLE_TTL = int(os.getenv('CITY_IDLE_TTL', 1800))
+# Seconds between idle checks in each process, so a worker that stops getting requests still frees memory
+CITY_EVICT_INTERVAL = float(os.getenv('CITY_EVICT_INTERVAL', 60))
+
+# Cities the master process places in shared memory before forking workers
+SHARED_CITIES = [slug.strip() for slug in os.getenv('SHARED_CITIES', DEFAULT_CITY).split(',') if slug.strip()]
+
+
+class CityLayers:
+    """Data layers of a single city in compact struct-of-arrays form"""
+
+    def __init__(self, layers, specs=DEFAULT_LAYER_SPECS):
+        self.layers = layers
+        self.specs = [spec for spec in specs if spec.name in layers]
+
+    @classmethod
+    def load(cls, data_dir=None, specs=DEFAULT_LAYER_SPECS):
+        """Read the file of every layer spec from a city directory"""
+        layers = {}
+
+        for spec in specs:
+            df = None
+            if data_dir:
+                try:
+                    df = pd.read_csv(os.path.join(data_dir, spec.file))
+                except Exception as e:
+                    print(f"Error loading {spec.name} layer from {data_dir}: {e}")
+            if df is None:
+                df = pd.DataFrame(columns=spec.columns)
+
+            # The DataFrame is only needed for parsing and is released here
+            layers[spec.name] = Layer.from_spec(spec, df)
+
+        return cls(layers, specs)
+
+    def __contains__(self, name):
+        return name in self.layers
+
+    def __getitem__(self, name):
+        return self.layers[name]
+
+    def spec(self, name):
+        return next((spec for spec in self.specs if spec.name == name), None)
+
+    def summary(self):
+        return {name: len(layer) for name, layer in self.layers.items()}
+
+    @property
+    def nbytes(self):
+        return sum(layer.nbytes for layer in self.layers.values())
+
+
+# Shared placeholder for points outside every registered city
+EMPTY_LAYERS = CityLayers.load()
+
+
+class City:
+    """A registered city: bounding box, geocoding hints and lazily loaded layers"""
+
+    def __init__(self, slug, name, bounds, data_dir, geocode_suffix=None, layer_specs=DEFAULT_LAYER_SPECS):
+        self.slug = slug
+        self.name = name
+        self.bounds = bounds
+        self.data_dir = data_dir
+        self.geocode_suffix = geocode_suffix or name
+        self.layer_specs = layer_specs
+        self.layers = None
+        self.shared = False
+        self.last_used = 0.0
+
+    @property
+    def area(self):
+        return ((self.bounds['max_lat'] - self.bounds['min_lat']) *
+                (self.bounds['max_lon'] - self.bounds['min_lon']))
+
+    def contains(self, lat, lon):
+        return (self.bounds['min_lat'] <= lat <= self.bounds['max_lat'] and
+                self.bounds['min_lon'] <= lon <= self.bounds['max_lon'])
+
+    def to_dict(self):
+        return {
+            'slug': self.slug,
+            'name': self.name,
+            'bounds': self.bounds,
+            'loaded': self.layers is not None,
+            'shared': self.shared,
+            'layers': [spec.name for spec in self.layer_specs],
+            'last_used': self.last_used or None
+        }
+
+
+class CityRegistry(PerProcess):
+    """Discover city directories and route coordinate lookups to their layers.
+
+    Every subdirectory of ``data_dir`` containing a ``city.json`` is a city.
+    Layers are read on the first lookup that falls inside the city's bounding
+    box and dropped again once the city has been idle for ``idle_ttl`` seconds,
+    checked on every lookup and every ``evict_interval`` seconds by a
+    background thread in each process.
+    Anything derived from a city's layers registers with ``on_unload`` to be
+    told, by slug, when they are dropped or replaced.
+    """
+
+    def __init__(self, data_dir=CITY_DATA_DIR, idle_ttl=CITY_IDLE_TTL, evict_interval=CITY_EVICT_INTERVAL):
+        self.data_dir = data_dir
+        self.idle_ttl = idle_ttl
+        self.evict_interval = evict_interval
+        self.cities = {}
+        self._lock = threading.Lock()
+        self._unload_listeners = []
+        self._discover()
+        self._build_bbox_index()
+
+    def _init_process(self):
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name='city-evictor', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.evict_interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"City eviction error: {e}")
+
+    def _discover(self):
+        if not os.path.isdir(self.data_dir):
+            print(f"City data directory not found: {self.data_dir}")
+            return
+
+        for slug in sorted(os.listdir(self.data_dir)):
+            city_dir = os.path.join(self.data_dir, slug)
+            config_path = os.path.join(city_dir, 'city.json')
+            if not os.path.isfile(config_path):
+                continue
+            try:
+                with open(config_path, encoding='utf-8') as f:
+                    config = json.load(f)
+                self.cities[slug] = City(
+                    slug,
+                    config.get('name', slug.title()),
+                    {key: float(config['bounds'][key]) for key in ('min_lat', 'max_lat', 'min_lon', 'max_lon')},
+                    city_dir,
+                    config.get('geocode_suffix'),
+                    resolve_layer_specs(config.get('layers'))
+                )
+            except Exception as e:
+                print(f"Error registering city '{slug}': {e}")
+
+        print(f"Registered cities: {', '.join(self.cities) or 'none'}")
+
+    def _build_bbox_index(self):
+        # Smallest boxes first so a city nested inside a larger region wins
+        self._bbox_cities = sorted(self.cities.values(), key=lambda c: c.area)
+        self._bboxes = np.array(
+            [[c.bounds['min_lat'], c.bounds['max_lat'], c.bounds['min_lon'], c.bounds['max_lon']]
+             for c in self._bbox_cities],
+            dtype=float
+        ).reshape(-1, 4)
+
+    def get_city(self, slug=None):
+        """Return a city by slug, falling back to the default city"""
+        return self.cities.get(slug or DEFAULT_CITY) or self.cities.get(DEFAULT_CITY)
+
+    def find_city(self, lat, lon):
+        """Return the city whose bounding box contains the point, or None"""
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return None
+
+        boxes = self._bboxes
+        hits = np.flatnonzero(
+            (boxes[:, 0] <= lat) & (lat <= boxes[:, 1]) &
+            (boxes[:, 2] <= lon) & (lon <= boxes[:, 3])
+        )
+        return self._bbox_cities[hits[0]] if len(hits) else None
+
+    def on_unload(self, callback):
+        """Call ``callback(slug)`` whenever a city's layers are evicted or replaced"""
+        self._unload_listeners.append(callback)
+
+    def _unloaded(self, slugs):
+        # Called after releasing the registry lock, so listeners may take their own locks and call get_layers
+        for slug in slugs:
+            for callback in self._unload_listeners:
+                callback(slug)
+
+    def get_layers(self, city):
+        """Return the layers of a city, loading them on first use"""
+        if city is None:
+            return EMPTY_LAYERS
+
+        self.ensure_process()
+        now = time.time()
+        with self._lock:
+            city.last_used = now
+            if city.layers is None:
+                city.layers = self._attach_shared(city)
+            if city.layers is None:
+                city.layers = CityLayers.load(city.data_dir, city.layer_specs)
+                print(f"Loaded layers for {city.name}: {city.layers.summary()} ({city.layers.nbytes / 1024:.0f} KiB)")
+            layers = city.layers
+            evicted = self._evict_idle(now)
+        self._unloaded(evicted)
+        return layers
+
+    def _attach_shared(self, city):
+        entry = shared_layers.load_manifest().get(city.slug)
+        if not entry:
+            return None
+        try:
+            layers = CityLayers(shared_layers.attach_layers(entry), city.layer_specs)
+        except Exception as e:
+            print(f"Could not attach shared layers for {city.name}: {e}")
+            return None
+        city.shared = True
+        return layers
+
+    def share_layers(self, slugs=None):
+        """Build layers once and export them to shared memory for forked workers.
+
+        Meant to run in the gunicorn master (see gunicorn.conf.py) before any
+        worker is forked. The master keeps read-only views of the segments, so
+        workers inherit them directly and fresh processes attach by name.
+        """
+        manifest = {}
+        for slug in slugs or SHARED_CITIES:
+            city = self.cities.get(slug)
+            if city is None:
+                print(f"Cannot share unknown city '{slug}'")
+                continue
+            layers = CityLayers.load(city.data_dir, city.layer_specs)
+            manifest[slug] = shared_layers.export_layers(slug, layers.layers)
+            with self._lock:
+                city.layers = CityLayers(shared_layers.attach_layers(manifest[slug]), city.layer_specs)
+                city.shared = True
+                city.last_used = time.time()
+            self._unloaded([slug])
+            print(f"Shared layers for {city.name}: {manifest[slug]['size'] / 1024:.0f} KiB in {manifest[slug]['segment']}")
+
+        shared_layers.publish_manifest(manifest)
+        return manifest
+
+    def layers_for_point(self, lat, lon):
+        """Return the layers of the city containing the point"""
+        return self.get_layers(self.find_city(lat, lon))
+
+    def evict_idle(self):
+        self.ensure_process()
+        with self._lock:
+            evicted = self._evict_idle(time.time())
+        self._unloaded(evicted)
+        return evicted
+
+    def _evict_idle(self, now):
+        evicted = []
+        for city in self.cities.values():
+            # Shared layers cost a worker nothing, so only private copies are evicted
+            if city.layers is not None and not city.shared and now - city.last_used > self.idle_ttl:
+                city.layers = None
+                evicted.append(city.slug)
+        if evicted:
+            print(f"Evicted idle cities: {', '.join(evicted)}")
+        return evicted
+
+    def status(self):
+        return [city.to_dict() for city in self.cities.values()]
+
+
+city_registry = CityRegistry()
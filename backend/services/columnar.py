@@ -0,0 +1,75 @@
+import json
+import struct
+import numpy as np
+from flask import request
+
+MAGIC = b'SSCF'
+FORMAT_VERSION = 2
+MIMETYPE = 'application/octet-stream'
+
+# Column type codes; every type is 4 bytes wide so columns stay aligned
+DTYPES = {'f': '<f4', 'i': '<i4', 'u': '<u4'}
+
+# magic, format version, column count, row count, metadata length
+_HEADER = struct.Struct('<4sHHII')
+
+
+def encode_columns(columns, meta=None, types=None):
+    """Pack equal-length numeric columns as little-endian 4-byte values with a small header.
+
+    Columns are Float32 unless ``types`` maps their name to another code in
+    DTYPES ('i' for Int32, 'u' for Uint32; use these for ids, which Float32
+    cannot hold exactly past 2**24). Layout: the fixed header, then each
+    column name as a length-prefixed UTF-8 string followed by its type code,
+    then the metadata as UTF-8 JSON, zero padding to a 4-byte boundary, and
+    finally every column back to back (``rows`` values each). Missing float
+    values are NaN. A browser can wrap each column in a typed array without
+    copying or parsing.
+    """
+    types = types or {}
+    names = list(columns)
+    codes = [types.get(name, 'f') for name in names]
+    arrays = [np.asarray(columns[name], dtype=DTYPES[code]).ravel() for name, code in zip(names, codes)]
+    rows = len(arrays[0]) if arrays else 0
+    if any(len(array) != rows for array in arrays):
+        raise ValueError('All columns must have the same length')
+
+    meta_bytes = json.dumps(meta or {}, separators=(',', ':')).encode()
+    header = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, len(names), rows, len(meta_bytes)))
+    for name, code in zip(names, codes):
+        encoded = name.encode()
+        header += struct.pack('<B', len(encoded)) + encoded + code.encode()
+    header += meta_bytes
+    header += b'\0' * (-len(header) % 4)
+
+    return bytes(header) + b''.join(array.tobytes() for array in arrays)
+
+
+def decode_columns(body):
+    """Inverse of encode_columns, returning (columns, meta)"""
+    magic, version, count, rows, meta_length = _HEADER.unpack_from(body, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError('Not a columnar payload')
+
+    offset = _HEADER.size
+    names = []
+    for _ in range(count):
+        length = body[offset]
+        names.append((body[offset + 1:offset + 1 + length].decode(), chr(body[offset + 1 + length])))
+        offset += 2 + length
+    meta = json.loads(body[offset:offset + meta_length])
+    offset += meta_length
+    offset += -offset % 4
+
+    columns = {}
+    for name, code in names:
+        columns[name] = np.frombuffer(body, dtype=DTYPES[code], count=rows, offset=offset)
+        offset += rows * 4
+    return columns, meta
+
+
+def wants_columnar():
+    """True for ?format=binary or a request that prefers application/octet-stream"""
+    if request.args.get('format') == 'binary':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', MIMETYPE]) == MIMETYPE
@@ -0,0 +1,396 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from services.broker import create_broker, next_event_id
+from services.geo_subscriptions import AreaIndex
+from services.process_local import PerProcess
+
+# Events buffered per subscriber; past this, location updates are dropped oldest
+# first, and a subscriber whose queue is all NEW_SOS/SOS_RESOLVED is disconnected
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv('SSE_SUBSCRIBER_QUEUE_SIZE', 1000))
+# Event types that replace an older queued event with the same topic
+CONFLATED_TYPES = ('LOCATION_UPDATE',)
+# Seconds a subscriber may go without any message before it is sent a heartbeat
+HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', 15))
+HEARTBEAT_WHEEL_SLOTS = 16
+# Recent events kept for Last-Event-ID replay
+REPLAY_BUFFER_SIZE = int(os.getenv('SSE_REPLAY_BUFFER_SIZE', 2000))
+
+
+class Event:
+    """A message on the bus: SSE ``type`` and ``data``, the row id it came from, its event id
+    and its topic (the SOS it belongs to)"""
+
+    __slots__ = ('type', 'data', 'ref_id', 'id', 'topic')
+
+    def __init__(self, type, data, ref_id=None, id=None, topic=None):
+        self.type = type
+        self.data = data
+        self.ref_id = ref_id
+        self.id = id
+        self.topic = topic
+
+    @property
+    def point(self):
+        if not isinstance(self.data, dict) or self.data.get('latitude') is None:
+            return None
+        return self.data['latitude'], self.data['longitude']
+
+    def to_dict(self):
+        return {'type': self.type, 'data': self.data}
+
+
+# Queued by the heartbeat wheel; SSE streams turn it into a comment line
+HEARTBEAT = Event('HEARTBEAT', None)
+
+
+class SubscriberQueue:
+    """Bounded FIFO that conflates location updates.
+
+    A queued LOCATION_UPDATE is overwritten in place by a newer one for the
+    same SOS, and removed once that SOS is resolved, so a slow reader gets the
+    latest fix instead of a backlog. Other events are never conflated; when
+    the queue is full the oldest location update is dropped to make room,
+    and only if there is none does ``put`` raise queue.Full.
+    """
+
+    def __init__(self, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self._slots = deque()
+        self._latest = {}
+        self._size = 0
+        self._ready = threading.Condition(threading.Lock())
+        self.conflated = 0
+        self.dropped = 0
+
+    def put(self, event):
+        with self._ready:
+            if event is HEARTBEAT and self._size:
+                return
+            if event.topic is not None:
+                slot = self._latest.get(event.topic)
+                if slot is not None:
+                    if event.type in CONFLATED_TYPES:
+                        slot[0] = event
+                        self.conflated += 1
+                        return
+                    if event.type == 'SOS_RESOLVED':
+                        # The resolved event carries the final position
+                        self._discard(event.topic)
+                        self.conflated += 1
+            if self._size >= self.maxsize:
+                if not self._latest:
+                    raise queue.Full
+                self._discard(next(iter(self._latest)))
+                self.dropped += 1
+
+            slot = [event]
+            self._slots.append(slot)
+            self._size += 1
+            if event.type in CONFLATED_TYPES and event.topic is not None:
+                self._latest[event.topic] = slot
+            self._ready.notify()
+
+    def _discard(self, topic):
+        slot = self._latest.pop(topic)
+        slot[0] = None
+        self._size -= 1
+
+    def get(self, timeout=None):
+        """Oldest queued event, or None after ``timeout`` seconds without one"""
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._size, timeout):
+                return None
+            while True:
+                event = self._slots.popleft()[0]
+                if event is not None:
+                    break
+            self._size -= 1
+            if event.topic is not None and self._latest.get(event.topic, [None])[0] is event:
+                del self._latest[event.topic]
+            return event
+
+    def qsize(self):
+        return self._size
+
+
+class Subscription:
+    """One subscriber's queue; closed by the bus if the subscriber falls too far behind"""
+
+    def __init__(self, maxsize=SUBSCRIBER_QUEUE_SIZE, area=None):
+        self.queue = SubscriberQueue(maxsize)
+        self.closed = False
+        # None for citywide; otherwise only events inside the area, plus later
+        # events for any SOS already sent (its topic), until it is resolved
+        self.area = area
+        self.topics = set()
+        self.last_sent = time.monotonic()
+        # Id of the newest event published before this subscription existed
+        self.cursor = 0
+
+    def get(self, timeout=None):
+        """Next event (possibly HEARTBEAT), or None after ``timeout`` seconds without one"""
+        return self.queue.get(timeout)
+
+
+class TimerWheel:
+    """Hashed timer wheel that visits every member once per ``interval``.
+
+    Members sit in one of ``slots`` buckets; each tick advances to the next
+    bucket, so a tick touches only ~1/slots of the members instead of every
+    connection keeping its own timer.
+    """
+
+    def __init__(self, interval, slots=HEARTBEAT_WHEEL_SLOTS):
+        self.tick = interval / slots
+        self.buckets = [set() for _ in range(slots)]
+        self.position = 0
+        self.slot_of = {}
+
+    def add(self, member):
+        # The bucket just passed comes round again a full interval from now
+        slot = (self.position - 1) % len(self.buckets)
+        self.buckets[slot].add(member)
+        self.slot_of[member] = slot
+
+    def remove(self, member):
+        slot = self.slot_of.pop(member, None)
+        if slot is not None:
+            self.buckets[slot].discard(member)
+
+    def advance(self):
+        """Move to the next bucket and return its members"""
+        members = list(self.buckets[self.position])
+        self.position = (self.position + 1) % len(self.buckets)
+        return members
+
+
+class EventBus(PerProcess):
+    """Publish/subscribe for SOS events.
+
+    Request handlers publish after committing. The broker (see
+    services/broker.py) hands every message to each worker's bus exactly
+    once, so subscribers on any worker see events from all of them; within
+    a worker a single dispatcher thread
+    copies each event into every subscriber's queue, so publishing never
+    blocks on slow SSE clients and the database is not polled per viewer.
+    The same thread drives a timer wheel that queues heartbeats for idle
+    subscribers, so an SSE stream simply blocks on its queue.
+
+    Every event gets an id that only increases, even across restarts (it is
+    floored at the current time in microseconds; the socket hub assigns it so
+    all workers agree), and the newest events stay
+    in a ring buffer so a reconnecting client can resume from Last-Event-ID.
+
+    Subscribers with an area sit in a grid index, so an event is matched
+    only against areas near its point rather than against every subscriber.
+    """
+
+    def __init__(self, heartbeat_interval=HEARTBEAT_INTERVAL, replay_size=REPLAY_BUFFER_SIZE,
+                 broker_factory=create_broker):
+        self.heartbeat_interval = heartbeat_interval
+        self._broker_factory = broker_factory
+        self._broker = None
+        self._inbox = queue.Queue()
+        self._subscribers = set()
+        self._everywhere = set()
+        self._areas = AreaIndex()
+        self._followers = {}
+        self._wheel = TimerWheel(heartbeat_interval)
+        self._replay = deque(maxlen=replay_size)
+        self._last_id = self._replay_floor = time.time_ns() // 1000
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+        self.disconnected = 0
+        # Counters of subscribers that have gone away
+        self._retired = {'conflated': 0, 'dropped': 0}
+
+    def _init_process(self):
+        self._lock = threading.Lock()
+        self._inbox = queue.Queue()
+        self._subscribers = set()
+        self._everywhere = set()
+        self._areas = AreaIndex()
+        self._followers = {}
+        self._wheel = TimerWheel(self.heartbeat_interval)
+        self._thread = None
+        self._broker = self._broker_factory()
+        self._broker.start(self._receive)
+
+    def _ensure_dispatcher(self):
+        self.ensure_process()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._dispatch, name='event-bus', daemon=True)
+                self._thread.start()
+
+    def publish(self, type, data, ref_id=None, topic=None):
+        self._ensure_dispatcher()
+        self._broker.publish({'type': type, 'data': data, 'ref_id': ref_id, 'topic': topic})
+
+    def _receive(self, message):
+        """Called by the broker once per message, in order"""
+        with self._lock:
+            event_id = message.get('id') or next_event_id(self._last_id)
+            self._last_id = max(self._last_id, event_id)
+            event = Event(message['type'], message['data'], message.get('ref_id'), event_id, message.get('topic'))
+            if len(self._replay) == self._replay.maxlen:
+                self._replay_floor = self._replay[0].id
+            self._replay.append(event)
+            self._inbox.put(event)
+        for listener in self._listeners:
+            listener(event)
+
+    def listen(self, callback):
+        """Call ``callback(event)`` for every event this worker receives, in order, on the broker's thread"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+        self._ensure_dispatcher()
+
+    def subscribe(self, last_event_id=None, area=None):
+        """Register a subscriber, citywide or for an Area; returns (subscription, replay).
+
+        ``replay`` lists the buffered events after ``last_event_id`` that the
+        subscriber would have received, or is None when there is no id or the
+        buffer no longer reaches back to it. Replayed events may also arrive
+        on the queue; skip ids already sent.
+        """
+        self._ensure_dispatcher()
+        subscription = Subscription(area=area)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if area is None:
+                self._everywhere.add(subscription)
+            else:
+                self._areas.add(subscription, area)
+            self._wheel.add(subscription)
+            subscription.cursor = self._last_id
+            replay = None
+            if last_event_id is not None and self._replay_floor <= last_event_id <= self._last_id:
+                replay = [event for event in self._replay
+                          if event.id > last_event_id and self._wants(subscription, event)]
+                for event in replay:
+                    self._track(subscription, event)
+        return subscription, replay
+
+    def follow(self, subscription, topics):
+        """Send ``subscription`` every later event for these topics, wherever they happen"""
+        with self._lock:
+            for topic in topics:
+                subscription.topics.add(topic)
+                self._followers.setdefault(topic, set()).add(subscription)
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            if subscription in self._subscribers:
+                self._retired['conflated'] += subscription.queue.conflated
+                self._retired['dropped'] += subscription.queue.dropped
+            self._subscribers.discard(subscription)
+            self._everywhere.discard(subscription)
+            self._areas.remove(subscription)
+            for topic in subscription.topics:
+                followers = self._followers.get(topic)
+                if followers is not None:
+                    followers.discard(subscription)
+                    if not followers:
+                        del self._followers[topic]
+            self._wheel.remove(subscription)
+
+    @staticmethod
+    def _wants(subscription, event):
+        if subscription.area is None or event.topic in subscription.topics:
+            return True
+        point = event.point
+        return point is not None and subscription.area.contains(*point)
+
+    def _track(self, subscription, event):
+        # Keep an area subscriber on an SOS it has seen until it is resolved
+        if subscription.area is None or event.topic is None:
+            return
+        if event.type == 'SOS_RESOLVED':
+            subscription.topics.discard(event.topic)
+            followers = self._followers.get(event.topic)
+            if followers is not None:
+                followers.discard(subscription)
+                if not followers:
+                    del self._followers[event.topic]
+        else:
+            subscription.topics.add(event.topic)
+            self._followers.setdefault(event.topic, set()).add(subscription)
+
+    def _recipients(self, event):
+        recipients = set(self._everywhere)
+        if event.topic is not None:
+            recipients.update(self._followers.get(event.topic, ()))
+        point = event.point
+        if point is not None:
+            recipients.update(self._areas.match(*point))
+        for subscription in recipients:
+            self._track(subscription, event)
+        return recipients
+
+    def _deliver(self, subscription, event):
+        try:
+            subscription.queue.put(event)
+            subscription.last_sent = time.monotonic()
+        except queue.Full:
+            # The client reconnects and resumes from Last-Event-ID or a fresh snapshot
+            print("SSE subscriber queue full, disconnecting subscriber")
+            self.disconnected += 1
+            self.unsubscribe(subscription)
+
+    def _dispatch(self):
+        tick = self._wheel.tick
+        next_tick = time.monotonic() + tick
+        while True:
+            try:
+                event = self._inbox.get(timeout=max(0, next_tick - time.monotonic()))
+            except queue.Empty:
+                event = None
+
+            if event is not None:
+                with self._lock:
+                    subscribers = self._recipients(event)
+                for subscription in subscribers:
+                    self._deliver(subscription, event)
+
+            now = time.monotonic()
+            while now >= next_tick:
+                with self._lock:
+                    due = self._wheel.advance()
+                for subscription in due:
+                    if now - subscription.last_sent >= self.heartbeat_interval - tick:
+                        self._deliver(subscription, HEARTBEAT)
+                next_tick += tick
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def metrics(self):
+        """Queue depth and conflation counters for this worker's subscribers"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        depths = sorted((subscription.queue.qsize() for subscription in subscribers), reverse=True)
+        return {
+            'pid': os.getpid(),
+            'subscribers': len(subscribers),
+            'area_subscribers': len(self._areas),
+            'queue_depth': {
+                'total': sum(depths),
+                'max': depths[0] if depths else 0,
+                'top': depths[:10],
+            },
+            'queue_capacity': SUBSCRIBER_QUEUE_SIZE,
+            'conflated': self._retired['conflated'] + sum(s.queue.conflated for s in subscribers),
+            'dropped': self._retired['dropped'] + sum(s.queue.dropped for s in subscribers),
+            'disconnected': self.disconnected,
+            'last_event_id': self._last_id,
+        }
+
+
+event_bus = EventBus()
@@ -0,0 +1,361 @@
+import os
+import re
+import difflib
+import threading
+import numpy as np
+import pandas as pd
+import requests
+from math import cos, radians
+from services.city_registry import city_registry
+from services.spatial_index import build_index
+from services.ttl_cache import TTLCache
+
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org').rstrip('/')
+NOMINATIM_USER_AGENT = os.getenv('NOMINATIM_USER_AGENT', 'safe-routes-app/1.0')
+
+# Nominatim answers change rarely; cache them for a day by default
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 86400))
+
+# Optional per-city list of imported places (name, Latitude, Longitude[, type])
+POI_FILE = 'pois.csv'
+
+# Reverse geocoding answers locally when a named point is this close (metres)
+REVERSE_GEOCODE_MAX_DISTANCE = float(os.getenv('REVERSE_GEOCODE_MAX_DISTANCE', 300))
+
+# Decimal places coordinates are snapped to for the Nominatim reverse cache (3 ~ 110 m)
+REVERSE_GEOCODE_SNAP = int(os.getenv('REVERSE_GEOCODE_SNAP', 3))
+
+METERS_PER_DEGREE = 111320.0
+
+# Query tokens shorter than this are never fuzzy-matched
+FUZZY_MIN_LENGTH = 3
+FUZZY_CUTOFF = 0.8
+
+_search_cache = TTLCache(maxsize=4096, ttl=GEOCODE_CACHE_TTL)
+_reverse_cache = TTLCache(maxsize=16384, ttl=GEOCODE_CACHE_TTL)
+_session = requests.Session()
+_session.headers['User-Agent'] = NOMINATIM_USER_AGENT
+
+_gazetteers = {}
+_lock = threading.Lock()
+
+
+def normalize(text):
+    return re.sub(r'[^a-z0-9]+', ' ', str(text).lower()).strip()
+
+
+class TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = set()
+
+
+class PrefixTrie:
+    """Character trie where every node knows all entries having a word with that prefix"""
+
+    def __init__(self):
+        self.root = TrieNode()
+
+    def insert(self, word, entry_id):
+        node = self.root
+        for char in word:
+            node = node.children.setdefault(char, TrieNode())
+            node.ids.add(entry_id)
+
+    def prefix(self, word):
+        node = self.root
+        for char in word:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.ids
+
+
+class Gazetteer:
+    """In-memory place-name index for one city.
+
+    Places are the ``area`` names of every layer, located at the centroid of
+    their rows, plus the city's optional ``pois.csv``. Each word of a name is
+    inserted into a prefix trie, so "kora man" finds "Koramangala Main Road";
+    words with no prefix match fall back to fuzzy matching.
+
+    Every named row is also kept as a point of the place it belongs to, with a
+    spatial index over them for reverse geocoding.
+    """
+
+    def __init__(self, places, point_lat=(), point_lon=(), point_place=()):
+        self.places = places
+        self.trie = PrefixTrie()
+        self.words = set()
+        for entry_id, place in enumerate(places):
+            for word in set(place['key'].split()):
+                self.trie.insert(word, entry_id)
+                self.words.add(word)
+
+        self.point_lat = np.asarray(point_lat, dtype=np.float32)
+        self.point_lon = np.asarray(point_lon, dtype=np.float32)
+        self.point_place = np.asarray(point_place, dtype=np.int32)
+        self.point_index = build_index(self.point_lat, self.point_lon)
+
+    @classmethod
+    def from_layers(cls, layers, data_dir=None):
+        merged = {}
+        points = []  # (lat, lon, normalized names) per layer or POI file
+
+        def add(name, lat, lon, kind, weight):
+            key = normalize(name)
+            if not key:
+                return
+            place = merged.get(key)
+            if place is None:
+                merged[key] = {'name': str(name).strip(), 'key': key, 'lat': lat, 'lon': lon,
+                               'type': kind, 'weight': weight}
+                return
+            # The same name in several layers: weighted centroid of all rows
+            total = place['weight'] + weight
+            place['lat'] = (place['lat'] * place['weight'] + lat * weight) / total
+            place['lon'] = (place['lon'] * place['weight'] + lon * weight) / total
+            place['weight'] = total
+
+        for name, layer in layers.layers.items():
+            if 'area' not in layer.codes:
+                continue
+            codes = layer.codes['area']
+            known = codes >= 0
+            ncat = len(layer.categories['area'])
+            counts = np.bincount(codes[known], minlength=ncat)
+            lat_sums = np.bincount(codes[known], weights=layer.lat[known].astype(np.float64), minlength=ncat)
+            lon_sums = np.bincount(codes[known], weights=layer.lon[known].astype(np.float64), minlength=ncat)
+            for code in np.flatnonzero(counts):
+                add(layer.categories['area'][code], lat_sums[code] / counts[code],
+                    lon_sums[code] / counts[code], 'area', int(counts[code]))
+            keys = np.asarray([normalize(label) for label in layer.categories['area']], dtype=object)
+            points.append((layer.lat[known], layer.lon[known], keys[codes[known]]))
+
+        poi_path = os.path.join(data_dir, POI_FILE) if data_dir else None
+        if poi_path and os.path.isfile(poi_path):
+            try:
+                pois = pd.read_csv(poi_path)
+                points.append((pois['Latitude'].to_numpy(dtype=np.float32), pois['Longitude'].to_numpy(dtype=np.float32),
+                               np.asarray([normalize(name) for name in pois['name']], dtype=object)))
+                for row in pois.itertuples(index=False):
+                    row = row._asdict()
+                    kind = row.get('type')
+                    add(row['name'], float(row['Latitude']), float(row['Longitude']),
+                        kind if isinstance(kind, str) and kind else 'poi', 1)
+            except Exception as e:
+                print(f"Error loading places from {poi_path}: {e}")
+
+        place_ids = {key: entry_id for entry_id, key in enumerate(merged)}
+        point_lat, point_lon, point_place = [], [], []
+        for lat, lon, keys in points:
+            ids = np.asarray([place_ids.get(key, -1) for key in keys], dtype=np.int32)
+            named = ids >= 0
+            point_lat.append(lat[named])
+            point_lon.append(lon[named])
+            point_place.append(ids[named])
+
+        if not points:
+            return cls(list(merged.values()))
+        return cls(list(merged.values()), np.concatenate(point_lat), np.concatenate(point_lon),
+                   np.concatenate(point_place))
+
+    def _fuzzy(self, word):
+        if len(word) < FUZZY_MIN_LENGTH:
+            return set()
+        ids = set()
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(word)
+        for candidate in self.words:
+            # Compare against the candidate's prefix so half-typed words still match
+            matcher.set_seq1(candidate[:len(word) + 1])
+            if (matcher.real_quick_ratio() >= FUZZY_CUTOFF and matcher.quick_ratio() >= FUZZY_CUTOFF
+                    and matcher.ratio() >= FUZZY_CUTOFF):
+                ids |= self.trie.prefix(candidate)
+        return ids
+
+    def search(self, query, limit=6, fuzzy=True):
+        """Places whose words start with every query word, best matches first"""
+        words = normalize(query).split()
+        if not words:
+            return []
+
+        matched = None
+        approximate = False
+        for word in words:
+            ids = self.trie.prefix(word)
+            if not ids and fuzzy:
+                ids = self._fuzzy(word)
+                approximate = True
+            matched = set(ids) if matched is None else matched & ids
+            if not matched:
+                return []
+
+        key = ' '.join(words)
+
+        def rank(entry_id):
+            place = self.places[entry_id]
+            if place['key'] == key:
+                match = 0
+            elif place['key'].startswith(key):
+                match = 1
+            else:
+                match = 2
+            return (match, -place['weight'], len(place['key']))
+
+        results = []
+        for entry_id in sorted(matched, key=rank)[:limit]:
+            place = self.places[entry_id]
+            results.append({
+                'name': place['name'],
+                'lat': round(float(place['lat']), 6),
+                'lon': round(float(place['lon']), 6),
+                'type': place['type'],
+                'fuzzy': approximate
+            })
+        return results
+
+    def nearest(self, lat, lon, max_distance=REVERSE_GEOCODE_MAX_DISTANCE):
+        """Closest named point within ``max_distance`` metres, or None"""
+        if self.point_index is None:
+            return None
+        lon_scale = max(cos(radians(lat)), 0.1)
+        # Degrees of longitude are shorter, so the search circle is sized for them
+        rows = self.point_index.query(lat, lon, max_distance / METERS_PER_DEGREE / lon_scale)
+        if not len(rows):
+            return None
+
+        dlat = (self.point_lat[rows].astype(np.float64) - lat) * METERS_PER_DEGREE
+        dlon = (self.point_lon[rows].astype(np.float64) - lon) * METERS_PER_DEGREE * lon_scale
+        distances = np.hypot(dlat, dlon)
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance:
+            return None
+
+        place = self.places[self.point_place[rows[best]]]
+        return {'name': place['name'], 'type': place['type'], 'distance_m': round(float(distances[best]), 1)}
+
+    def __len__(self):
+        return len(self.places)
+
+
+def get_gazetteer(city):
+    """Gazetteer of a city, built from its layers on first use"""
+    if city is None:
+        return None
+    with _lock:
+        gazetteer = _gazetteers.get(city.slug)
+    if gazetteer is None:
+        layers = city_registry.get_layers(city)
+        gazetteer = Gazetteer.from_layers(layers, city.data_dir)
+        print(f"Built gazetteer for {city.name}: {len(gazetteer)} places")
+        with _lock:
+            # Not kept if the layers were evicted or replaced while it was being built
+            if city.layers is layers:
+                _gazetteers[city.slug] = gazetteer
+    return gazetteer
+
+
+def invalidate(slug):
+    """Forget a city's gazetteer; the next lookup rebuilds it from the current layers"""
+    with _lock:
+        _gazetteers.pop(slug, None)
+
+
+city_registry.on_unload(invalidate)
+
+
+def search_places(city, query, limit=6):
+    """Local autocomplete results in the /api/search-place format"""
+    gazetteer = get_gazetteer(city)
+    if gazetteer is None:
+        return []
+    return [
+        {
+            'display_name': f"{place['name']}, {city.geocode_suffix}",
+            'lat': place['lat'],
+            'lon': place['lon'],
+            'type': place['type'],
+            'source': 'local'
+        }
+        for place in gazetteer.search(query, limit)
+    ]
+
+
+def nominatim_search(city, query, limit=6):
+    """Forward geocode through Nominatim, cached per city and normalized query"""
+    cache_key = (city.slug if city else None, normalize(query), limit)
+    results = _search_cache.get(cache_key)
+    if results is not None:
+        return results
+
+    params = {
+        'q': f"{query}, {city.geocode_suffix}" if city else query,
+        'format': 'jsonv2',
+        'addressdetails': 1,
+        'limit': limit,
+        'accept-language': 'en'
+    }
+    resp = _session.get(f'{NOMINATIM_URL}/search', params=params, timeout=5)
+    resp.raise_for_status()
+
+    results = []
+    for item in resp.json():
+        try:
+            lat = float(item.get('lat', 0))
+            lon = float(item.get('lon', 0))
+        except (TypeError, ValueError):
+            continue
+        if city_registry.find_city(lat, lon) is not None:
+            results.append({
+                'display_name': item.get('display_name'),
+                'lat': lat,
+                'lon': lon,
+                'type': item.get('type'),
+                'source': 'nominatim'
+            })
+
+    _search_cache.set(cache_key, results)
+    return results
+
+
+def reverse_place(city, lat, lon):
+    """Nearest local place name in the /api/reverse-geocode format, or None"""
+    gazetteer = get_gazetteer(city)
+    place = gazetteer.nearest(lat, lon) if gazetteer is not None else None
+    if place is None:
+        return None
+    return {
+        'address': f"{place['name']}, {city.geocode_suffix}",
+        'area': place['name'],
+        'distance_m': place['distance_m'],
+        'source': 'local'
+    }
+
+
+def nominatim_reverse(lat, lon):
+    """Reverse geocode through Nominatim, cached on coordinates snapped to a small grid"""
+    lat = round(float(lat), REVERSE_GEOCODE_SNAP)
+    lon = round(float(lon), REVERSE_GEOCODE_SNAP)
+    result = _reverse_cache.get((lat, lon))
+    if result is not None:
+        return result
+
+    params = {
+        'lat': lat,
+        'lon': lon,
+        'format': 'jsonv2',
+        'accept-language': 'en'
+    }
+    resp = _session.get(f'{NOMINATIM_URL}/reverse', params=params, timeout=5)
+    resp.raise_for_status()
+    result = {'address': resp.json().get('display_name'), 'source': 'nominatim'}
+
+    _reverse_cache.set((lat, lon), result)
+    return result
+
+
+def cache_stats():
+    return {'search': _search_cache.stats(), 'reverse': _reverse_cache.stats()}
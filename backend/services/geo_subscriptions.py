@@ -0,0 +1,111 @@
+import math
+from services.heatmap import parse_bbox
+
+METERS_PER_DEGREE = 111320.0
+
+# Side of the grid cells subscriber areas are bucketed into (~5.5 km)
+AREA_CELL_SIZE = 0.05
+# Areas covering more cells than this (a whole state, say) are checked linearly instead
+MAX_AREA_CELLS = 400
+MAX_RADIUS = 200000
+
+
+class Area:
+    """A subscriber's area of interest: a bounding box, optionally trimmed to a circle"""
+
+    __slots__ = ('west', 'south', 'east', 'north', 'center', 'radius')
+
+    def __init__(self, west, south, east, north, center=None, radius=None):
+        self.west = west
+        self.south = south
+        self.east = east
+        self.north = north
+        self.center = center
+        self.radius = radius
+
+    @classmethod
+    def circle(cls, lat, lon, radius):
+        """Points within ``radius`` metres of (lat, lon)"""
+        dlat = radius / METERS_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        return cls(lon - dlon, lat - dlat, lon + dlon, lat + dlat, (lat, lon), radius)
+
+    def contains(self, lat, lon):
+        if not (self.south <= lat <= self.north and self.west <= lon <= self.east):
+            return False
+        if self.center is None:
+            return True
+        center_lat, center_lon = self.center
+        dlat = (lat - center_lat) * METERS_PER_DEGREE
+        dlon = (lon - center_lon) * METERS_PER_DEGREE * math.cos(math.radians(center_lat))
+        return dlat * dlat + dlon * dlon <= self.radius * self.radius
+
+
+def parse_area(args):
+    """Area from ``bbox=west,south,east,north`` or ``lat``, ``lon`` and ``radius`` (metres); None for citywide"""
+    if args.get('bbox'):
+        return Area(*parse_bbox(args['bbox']))
+    if args.get('lat') is None and args.get('lon') is None:
+        return None
+    try:
+        lat = float(args['lat'])
+        lon = float(args['lon'])
+        radius = float(args.get('radius', 5000))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('lat, lon and radius (metres) must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not (0 < radius <= MAX_RADIUS):
+        raise ValueError(f'lat/lon out of range or radius not in (0, {MAX_RADIUS}]')
+    return Area.circle(lat, lon, radius)
+
+
+class AreaIndex:
+    """Members keyed by Area, bucketed on a coarse grid.
+
+    Matching a point looks at the one grid cell containing it (plus the few
+    oversized areas), so the cost depends on how many areas overlap that
+    cell rather than on the total number of members.
+    """
+
+    def __init__(self, cell_size=AREA_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.large = {}
+        self.areas = {}
+
+    def _cells(self, area):
+        rows = range(math.floor(area.south / self.cell_size), math.floor(area.north / self.cell_size) + 1)
+        cols = range(math.floor(area.west / self.cell_size), math.floor(area.east / self.cell_size) + 1)
+        if len(rows) * len(cols) > MAX_AREA_CELLS:
+            return None
+        return [(row, col) for row in rows for col in cols]
+
+    def add(self, member, area):
+        self.areas[member] = area
+        cells = self._cells(area)
+        if cells is None:
+            self.large[member] = area
+            return
+        for cell in cells:
+            self.cells.setdefault(cell, {})[member] = area
+
+    def remove(self, member):
+        area = self.areas.pop(member, None)
+        if area is None:
+            return
+        if self.large.pop(member, None) is not None:
+            return
+        for cell in self._cells(area):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.pop(member, None)
+                if not bucket:
+                    del self.cells[cell]
+
+    def match(self, lat, lon):
+        """Members whose area contains (lat, lon)"""
+        cell = (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+        candidates = list(self.cells.get(cell, {}).items()) + list(self.large.items())
+        return [member for member, area in candidates if area.contains(lat, lon)]
+
+    def __len__(self):
+        return len(self.areas)
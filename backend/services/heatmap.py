@@ -0,0 +1,160 @@
+import os
+import threading
+import weakref
+import numpy as np
+from services.city_registry import city_registry
+
+# Zoom range of the precomputed pyramid; deeper zooms reuse the finest level
+HEATMAP_MIN_ZOOM = int(os.getenv('HEATMAP_MIN_ZOOM', 6))
+HEATMAP_MAX_ZOOM = int(os.getenv('HEATMAP_MAX_ZOOM', 18))
+
+# Cells per 256px tile edge at each zoom, i.e. one cell every 32px
+HEATMAP_CELLS_PER_TILE = 8
+
+# Upper bound on cells in one response; wider viewports fall back to coarser levels
+MAX_HEATMAP_CELLS = int(os.getenv('MAX_HEATMAP_CELLS', 4000))
+
+_pyramids = {}
+_lock = threading.Lock()
+
+
+def cell_size_for_zoom(zoom):
+    """Cell edge in degrees at a slippy-map zoom level"""
+    return 360.0 / (2 ** zoom * HEATMAP_CELLS_PER_TILE)
+
+
+def parse_bbox(value):
+    """Parse a ``west,south,east,north`` string (Leaflet's toBBoxString order)"""
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('bbox must be west,south,east,north')
+    if south > north or west > east:
+        raise ValueError('bbox must be west,south,east,north')
+    return west, south, east, north
+
+
+class HeatmapLevel:
+    """One pyramid level: the layer's rows binned into square cells.
+
+    Each cell keeps the centroid of its rows, the row count and the sum of
+    the value column, so counts and means can be served without touching rows.
+    """
+
+    def __init__(self, zoom, lat, lon, values):
+        self.zoom = zoom
+        self.cell_size = cell_size_for_zoom(zoom)
+
+        rows = np.floor(lat / self.cell_size).astype(np.int64)
+        cols = np.floor(lon / self.cell_size).astype(np.int64)
+        keys, inverse = np.unique(rows * (1 << 32) + cols, return_inverse=True)
+        inverse = inverse.ravel()
+
+        self.count = np.bincount(inverse, minlength=len(keys))
+        self.lat = np.bincount(inverse, weights=lat, minlength=len(keys)) / self.count
+        self.lon = np.bincount(inverse, weights=lon, minlength=len(keys)) / self.count
+        if values is None:
+            self.mean = None
+        else:
+            known = ~np.isnan(values)
+            known_count = np.bincount(inverse[known], minlength=len(keys))
+            sums = np.bincount(inverse[known], weights=values[known], minlength=len(keys))
+            self.mean = np.where(known_count > 0, sums / np.maximum(known_count, 1), np.nan)
+
+    def __len__(self):
+        return len(self.count)
+
+    def select(self, bbox=None):
+        if bbox is None:
+            return np.arange(len(self.count))
+        west, south, east, north = bbox
+        return np.flatnonzero((self.lat >= south) & (self.lat <= north) &
+                              (self.lon >= west) & (self.lon <= east))
+
+
+class HeatmapPyramid:
+    """Multi-resolution cell aggregates of one layer, built once per loaded layer"""
+
+    def __init__(self, layer, value_column=None):
+        # Weak, so a pyramid never keeps an evicted city's arrays alive
+        self.layer_ref = weakref.ref(layer)
+        self.value_column = value_column
+        lat = layer.lat.astype(np.float64)
+        lon = layer.lon.astype(np.float64)
+        values = layer.values[value_column].astype(np.float64) if value_column in layer.values else None
+        self.levels = {}
+        if len(lat):
+            for zoom in range(HEATMAP_MIN_ZOOM, HEATMAP_MAX_ZOOM + 1):
+                self.levels[zoom] = HeatmapLevel(zoom, lat, lon, values)
+
+    @classmethod
+    def from_spec(cls, layer, spec):
+        """Means of the spec's value column, or plain counts for count/categorical layers"""
+        value_column = spec.value if spec is not None and spec.aggregation in ('mean', 'any') else None
+        return cls(layer, value_column)
+
+    def query(self, bbox=None, zoom=None, max_cells=MAX_HEATMAP_CELLS):
+        """Cells inside ``bbox`` at ``zoom``, coarsened until at most ``max_cells`` remain.
+
+        Without a zoom the finest level that fits is used, so small layers come
+        back as (nearly) their raw points.
+        """
+        if not self.levels:
+            return {'zoom': zoom, 'cell_size': None, 'data': [], 'cell_counts': []}
+
+        zoom = HEATMAP_MAX_ZOOM if zoom is None else int(min(max(zoom, HEATMAP_MIN_ZOOM), HEATMAP_MAX_ZOOM))
+        level = self.levels[zoom]
+        selected = level.select(bbox)
+        while len(selected) > max_cells and zoom > HEATMAP_MIN_ZOOM:
+            zoom -= 1
+            level = self.levels[zoom]
+            selected = level.select(bbox)
+        selected = selected[:max_cells]
+
+        weights = level.count[selected] if level.mean is None else level.mean[selected]
+        data = np.column_stack([level.lat[selected], level.lon[selected], weights]).round(6)
+        if level.mean is not None:
+            # Cells whose rows have no value keep the centroid with a null weight
+            data = [[lat, lon, None if np.isnan(w) else w] for lat, lon, w in data.tolist()]
+        else:
+            data = data.tolist()
+
+        return {
+            'zoom': zoom,
+            'cell_size': level.cell_size,
+            'data': data,
+            'cell_counts': level.count[selected].tolist()
+        }
+
+
+def get_pyramid(city_slug, layers, name):
+    """Pyramid of a city's layer, rebuilt whenever the layer object is reloaded"""
+    layer = layers[name]
+    key = (city_slug, name)
+    with _lock:
+        pyramid = _pyramids.get(key)
+    if pyramid is None or pyramid.layer_ref() is not layer:
+        pyramid = HeatmapPyramid.from_spec(layer, layers.spec(name))
+        city = city_registry.cities.get(city_slug)
+        with _lock:
+            # Not kept if the layers were evicted or replaced while it was being built
+            if city is None or city.layers is layers:
+                _pyramids[key] = pyramid
+    return pyramid
+
+
+def invalidate(slug):
+    """Forget a city's pyramids; the next request rebuilds them from the current layers"""
+    with _lock:
+        for key in [key for key in _pyramids if key[0] == slug]:
+            del _pyramids[key]
+
+
+city_registry.on_unload(invalidate)
+
+
+def heatmap(city, layers, name, bbox=None, zoom=None, max_cells=MAX_HEATMAP_CELLS):
+    """Viewport heatmap of one layer; an empty payload if the city lacks it"""
+    if name not in layers:
+        return {'zoom': zoom, 'cell_size': None, 'data': [], 'cell_counts': []}
+    return get_pyramid(city.slug if city else None, layers, name).query(bbox, zoom, max_cells)
@@ -0,0 +1,123 @@
+import numpy as np
+
+AGGREGATIONS = ('count', 'mean', 'mode', 'any')
+
+
+class LayerSpec:
+    """Declarative description of one safety data layer.
+
+    Rows within ``radius`` degrees of a sample point are reduced with
+    ``aggregation``: ``count`` counts them, ``mean``/``any`` reduce the numeric
+    ``value`` column and ``mode`` picks the most frequent label of a categorical
+    one. A layer with a non-zero ``weight`` adds ``weight * min(result / scale, 1)``
+    points to every sample's safety score (``weight * (1 - ...)`` if ``invert``),
+    so a new signal needs a CSV and an entry here, not new scoring code.
+    """
+
+    def __init__(self, name, file, value=None, aggregation='mean', radius=0.005, weight=0.0,
+                 scale=10.0, invert=False, default=None, categorical=(),
+                 lat_column='Latitude', lon_column='Longitude'):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Layer '{name}': unknown aggregation '{aggregation}'")
+        if aggregation != 'count' and not value:
+            raise ValueError(f"Layer '{name}': '{aggregation}' aggregation needs a value column")
+        if aggregation == 'mode' and weight:
+            raise ValueError(f"Layer '{name}': categorical layers cannot be weighted")
+
+        categorical = tuple(categorical)
+        if aggregation == 'mode' and value not in categorical:
+            categorical += (value,)
+        if default is None:
+            default = {'count': 0, 'mean': 0.0, 'mode': 'Unknown', 'any': False}[aggregation]
+
+        self.name = name
+        self.file = file
+        self.value = value
+        self.aggregation = aggregation
+        self.radius = float(radius)
+        self.weight = float(weight)
+        self.scale = float(scale)
+        self.invert = bool(invert)
+        self.default = default
+        self.categorical = categorical
+        self.lat_column = lat_column
+        self.lon_column = lon_column
+
+    @classmethod
+    def from_dict(cls, config):
+        return cls(**config)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'file': self.file,
+            'value': self.value,
+            'aggregation': self.aggregation,
+            'radius': self.radius,
+            'weight': self.weight,
+            'scale': self.scale,
+            'invert': self.invert,
+            'default': self.default,
+            'categorical': list(self.categorical),
+            'lat_column': self.lat_column,
+            'lon_column': self.lon_column
+        }
+
+    def with_overrides(self, config):
+        merged = self.to_dict()
+        merged.update(config)
+        return LayerSpec.from_dict(merged)
+
+    @property
+    def columns(self):
+        """Columns of the empty frame used when the layer file is missing"""
+        columns = [self.lat_column, self.lon_column]
+        if self.value:
+            columns.append(self.value)
+        return columns + [c for c in self.categorical if c not in columns]
+
+    def normalize(self, results):
+        """Map aggregated results onto 0..1 where 1 is safest"""
+        normalized = np.clip(np.asarray(results, dtype=np.float64) / self.scale, 0.0, 1.0)
+        return 1.0 - normalized if self.invert else normalized
+
+    def score(self, results):
+        """Safety points this layer contributes for each sample"""
+        return self.weight * self.normalize(results)
+
+
+# Built-in layers. Weights reproduce the original per-point formula:
+# crime 6 + lighting 5 (score / 2) + population 1 + infrastructure 0.5 + network 0.5
+DEFAULT_LAYER_SPECS = [
+    LayerSpec('crime', 'crimes.csv', aggregation='count', radius=0.003,
+              weight=6.0, scale=5.0, invert=True, categorical=('Crime type', 'area')),
+    LayerSpec('lighting', 'lighting.csv', value='lighting_score', radius=0.005,
+              weight=5.0, scale=10.0, default=5.0, categorical=('area', 'road_type')),
+    LayerSpec('population', 'population.csv', value='population_density', radius=0.005,
+              weight=1.0, scale=15000.0, default=15000.0, categorical=('area',)),
+    LayerSpec('infrastructure', 'nearby_infrastructure.csv', value='infrastructure_score', radius=0.005,
+              weight=0.5, scale=10.0, default=5.0, categorical=('area', 'infrastructure_type')),
+    LayerSpec('network', 'network_connectivity.csv', value='network_score', radius=0.005,
+              weight=0.5, scale=10.0, default=5.0, categorical=('area', 'network_type'))
+]
+
+
+def resolve_layer_specs(overrides=None):
+    """Merge a city's ``layers`` entries from city.json over the built-in specs.
+
+    Entries matching a built-in name override its fields, ``"enabled": false``
+    removes it, and new names (e.g. CCTV or bus stops) are appended.
+    """
+    specs = {spec.name: spec for spec in DEFAULT_LAYER_SPECS}
+
+    for config in overrides or []:
+        config = dict(config)
+        name = config['name']
+        if not config.pop('enabled', True):
+            specs.pop(name, None)
+        elif name in specs:
+            specs[name] = specs[name].with_overrides(config)
+        else:
+            specs[name] = LayerSpec.from_dict(config)
+
+    return list(specs.values())
@@ -0,0 +1,195 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from services.spatial_index import build_index, DEFAULT_CELL_SIZE
+
+
+class Layer:
+    """Struct-of-arrays storage for one data layer.
+
+    Coordinates and numeric columns are float32 arrays, string columns listed
+    as categorical are stored as int32 codes into a sorted lookup table, and
+    everything else in the source CSV is dropped. Scoring works on row indices
+    returned by the spatial index and never touches pandas. All arrays, index
+    included, can be views into a shared memory segment (see shared_layers).
+    """
+
+    def __init__(self, name, lat, lon, values=None, codes=None, categories=None, index=None,
+                 cell_size=DEFAULT_CELL_SIZE):
+        self.name = name
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.lon = np.asarray(lon, dtype=np.float32)
+        self.values = values or {}
+        self.codes = codes or {}
+        self.categories = categories or {}
+
+        # Per-type totals for every categorical column, e.g. crimes by type
+        self.type_counts = {
+            column: np.bincount(column_codes[column_codes >= 0], minlength=len(self.categories[column]))
+            for column, column_codes in self.codes.items()
+        }
+
+        self.index = index if index is not None else build_index(self.lat, self.lon, cell_size)
+        self._version = None
+
+    @classmethod
+    def from_frame(cls, name, df, categorical_columns=(), lat_column='Latitude', lon_column='Longitude',
+                   cell_size=DEFAULT_CELL_SIZE):
+        """Convert a DataFrame read from CSV into compact arrays"""
+        values = {}
+        codes = {}
+        categories = {}
+
+        for column in df.columns:
+            if column in (lat_column, lon_column):
+                continue
+            if column in categorical_columns:
+                # sort=True keeps codes in label order, so bincount().argmax()
+                # breaks ties the same way as Series.mode()[0]
+                column_codes, uniques = pd.factorize(df[column], sort=True)
+                codes[column] = column_codes.astype(np.int32)
+                categories[column] = [str(label) for label in uniques]
+            elif pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]):
+                values[column] = df[column].to_numpy(dtype=np.float32, na_value=np.nan)
+
+        return cls(
+            name,
+            df[lat_column].to_numpy(dtype=np.float32),
+            df[lon_column].to_numpy(dtype=np.float32),
+            values,
+            codes,
+            categories,
+            cell_size=cell_size
+        )
+
+    @classmethod
+    def from_spec(cls, spec, df):
+        return cls.from_frame(spec.name, df, spec.categorical, spec.lat_column, spec.lon_column,
+                              cell_size=spec.radius)
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def empty(self):
+        return len(self.lat) == 0
+
+    def has(self, column):
+        return column in self.values or column in self.codes
+
+    @property
+    def coordinates(self):
+        return np.column_stack([self.lat, self.lon])
+
+    def query(self, lat, lon, radius):
+        """Sorted row indices within a radius (degrees) of a point"""
+        if self.index is None:
+            return np.empty(0, dtype=np.int32)
+        return self.index.query(lat, lon, radius)
+
+    def count(self, lat, lon, radius):
+        if self.index is None:
+            return 0
+        return self.index.count(lat, lon, radius)
+
+    def mean(self, column, indices, default):
+        """Mean of a numeric column over the given rows"""
+        if not len(indices) or column not in self.values:
+            return default
+        return float(np.nanmean(self.values[column][indices], dtype=np.float64))
+
+    def mode(self, column, indices, default='Unknown'):
+        """Most frequent label of a categorical column over the given rows"""
+        if not len(indices) or column not in self.codes:
+            return default
+        column_codes = self.codes[column][indices]
+        column_codes = column_codes[column_codes >= 0]
+        if not len(column_codes):
+            return default
+        return self.categories[column][int(np.bincount(column_codes).argmax())]
+
+    def sample(self, lats, lons, radius, aggregation='count', column=None, default=None, metric='euclidean'):
+        """Aggregate rows around every point of a batch in one vectorized pass.
+
+        Returns one result per point: row counts, the mean or any() of a numeric
+        column, or the most frequent label of a categorical column. Points with
+        no rows in range get ``default``. ``metric='box'`` matches rows in the
+        open square of half-width ``radius`` instead of the circle.
+        """
+        n = len(lats)
+        if aggregation == 'count':
+            if self.index is None:
+                return np.zeros(n, dtype=np.int64)
+            points, _ = self.index.query_many(lats, lons, radius, metric)
+            return np.bincount(points, minlength=n)
+
+        if aggregation == 'mode':
+            result = np.full(n, default, dtype=object)
+            if self.index is None or column not in self.codes:
+                return result
+            points, rows = self.index.query_many(lats, lons, radius, metric)
+            column_codes = self.codes[column][rows]
+            known = column_codes >= 0
+            points, column_codes = points[known], column_codes[known]
+            ncat = len(self.categories[column])
+            table = np.bincount(points * ncat + column_codes, minlength=n * ncat).reshape(n, ncat)
+            hits = np.flatnonzero(table.any(axis=1))
+            labels = np.asarray(self.categories[column], dtype=object)
+            result[hits] = labels[table[hits].argmax(axis=1)]
+            return result
+
+        if self.index is None or column not in self.values:
+            return np.full(n, default, dtype=np.float64 if aggregation == 'mean' else bool)
+        points, rows = self.index.query_many(lats, lons, radius, metric)
+        column_values = self.values[column][rows].astype(np.float64)
+        known = ~np.isnan(column_values)
+        points, column_values = points[known], column_values[known]
+        counts = np.bincount(points, minlength=n)
+
+        if aggregation == 'any':
+            hits = np.bincount(points, weights=column_values != 0, minlength=n) > 0
+            return np.where(counts > 0, hits, default)
+
+        sums = np.bincount(points, weights=column_values, minlength=n)
+        return np.where(counts > 0, sums / np.maximum(counts, 1), default)
+
+    def aggregate(self, spec, lats, lons, radius=None):
+        """Apply a LayerSpec's aggregation to a batch of points"""
+        return self.sample(lats, lons, radius or spec.radius, spec.aggregation, spec.value, spec.default)
+
+    def label(self, column, index, default=None):
+        """Categorical label of a single row"""
+        code = self.codes[column][index] if column in self.codes else -1
+        return self.categories[column][code] if code >= 0 else default
+
+    def counts_by(self, column):
+        if column not in self.codes:
+            return {}
+        return dict(zip(self.categories.get(column, []), self.type_counts.get(column, []).tolist()))
+
+    def arrays(self):
+        """Every array backing this layer, keyed for export to shared memory"""
+        arrays = {'lat': self.lat, 'lon': self.lon}
+        arrays.update({f'values/{column}': array for column, array in self.values.items()})
+        arrays.update({f'codes/{column}': array for column, array in self.codes.items()})
+        if self.index is not None:
+            arrays.update({f'index/{key}': array for key, array in self.index.arrays().items()})
+        return arrays
+
+    @property
+    def version(self):
+        """Short content hash of the layer's data, for cache keys and ETags"""
+        if self._version is None:
+            digest = hashlib.blake2b(digest_size=8)
+            for key, array in sorted(self.arrays().items()):
+                if not key.startswith('index/'):
+                    digest.update(key.encode())
+                    digest.update(np.ascontiguousarray(array).tobytes())
+            for column in sorted(self.categories):
+                digest.update('\x1f'.join(self.categories[column]).encode())
+            self._version = digest.hexdigest()
+        return self._version
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays().values())
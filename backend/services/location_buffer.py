@@ -0,0 +1,198 @@
+import os
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy import update, bindparam
+from models import db, SOSEvent, LocationUpdate
+from services.event_bus import event_bus
+from services.process_local import PerProcess
+
+# Buffer live location fixes in memory and write them in batches instead of one commit per fix
+LOCATION_WRITE_BEHIND = os.getenv('LOCATION_WRITE_BEHIND', 'true').lower() == 'true'
+# Seconds between flushes, and the number of pending fixes that triggers one early
+LOCATION_FLUSH_INTERVAL = float(os.getenv('LOCATION_FLUSH_INTERVAL', 1))
+LOCATION_FLUSH_SIZE = int(os.getenv('LOCATION_FLUSH_SIZE', 200))
+# Pending fixes kept while the database is unavailable; the oldest are dropped past this
+LOCATION_BUFFER_LIMIT = int(os.getenv('LOCATION_BUFFER_LIMIT', 50000))
+
+SOS_POSITION_UPDATE = (
+    update(SOSEvent.__table__)
+    .where(SOSEvent.__table__.c.id == bindparam('sos_id'))
+    .values(latitude=bindparam('new_latitude'), longitude=bindparam('new_longitude'),
+            battery_percentage=bindparam('new_battery_percentage'))
+)
+
+
+class LocationBuffer(PerProcess):
+    """Write-behind store for live SOS locations.
+
+    ``latest`` holds the newest position of every active SOS. It is fed from
+    the event bus, so every worker sees fixes received by any of them, and the
+    SSE snapshot and police feed read it ahead of the database. Fixes received
+    by this worker, live or uploaded in a batch, wait in ``pending`` until a
+    background thread writes them with one multi-row insert and one position
+    update per SOS, every
+    LOCATION_FLUSH_INTERVAL seconds or as soon as LOCATION_FLUSH_SIZE are
+    waiting, and once more when the worker exits. A failed flush keeps its
+    fixes for the next one.
+    """
+
+    def __init__(self):
+        self.latest = {}
+        self._pending = []
+        self._positions = {}
+        self._flushing = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._app = None
+        self.flushes = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def _init_process(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = []
+        self._positions = {}
+        self._flushing = []
+        event_bus.listen(self._on_event)
+        if LOCATION_WRITE_BEHIND:
+            threading.Thread(target=self._run, name='location-writer', daemon=True).start()
+            atexit.register(self.flush)
+
+    def start(self, app):
+        """Start this process's writer thread; called once per gunicorn worker"""
+        self._app = app
+        self.ensure_process()
+
+    def add(self, location_update):
+        """Queue an unsaved LocationUpdate for the next flush; the SOS moves to it unless a later fix is known"""
+        row = {
+            'sos_event_id': location_update.sos_event_id,
+            'latitude': location_update.latitude,
+            'longitude': location_update.longitude,
+            'battery_percentage': location_update.battery_percentage,
+            'timestamp': location_update.timestamp
+        }
+        self.add_rows([row], latest=row)
+
+    def add_rows(self, rows, latest=None):
+        """Queue LocationUpdate rows (dicts) for the next flush; the SOS only moves to ``latest``, if given"""
+        if self._app is not None:
+            # A worker forked after start() without calling it again gets its own writer here
+            self.ensure_process()
+        with self._lock:
+            self._pending.extend(rows)
+            if latest is not None:
+                current = self._positions.get(latest['sos_event_id'])
+                if current is None or latest['timestamp'] >= current['timestamp']:
+                    self._positions[latest['sos_event_id']] = latest
+            overflow = len(self._pending) - LOCATION_BUFFER_LIMIT
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+            full = len(self._pending) >= LOCATION_FLUSH_SIZE
+        if full:
+            self._wake.set()
+
+    def _on_event(self, event):
+        if event.type == 'LOCATION_UPDATE':
+            data = event.data
+            timestamp = datetime.fromisoformat(data['timestamp'])
+            with self._lock:
+                current = self.latest.get(event.topic)
+                if current is None or timestamp >= current[0]:
+                    self.latest[event.topic] = (timestamp, {
+                        'latitude': data['latitude'],
+                        'longitude': data['longitude'],
+                        'battery_percentage': data['battery_percentage']
+                    })
+        elif event.type == 'SOS_RESOLVED':
+            with self._lock:
+                self.latest.pop(event.topic, None)
+
+    def unsaved_times(self, sos_id):
+        """Timestamps of this worker's fixes for an SOS that are not committed yet"""
+        with self._lock:
+            return [row['timestamp'] for row in self._pending + self._flushing if row['sos_event_id'] == sos_id]
+
+    def last_fix_time(self, sos_id):
+        """Timestamp of the newest fix seen for an SOS, or None"""
+        entry = self.latest.get(sos_id)
+        return entry[0] if entry is not None else None
+
+    def overlay(self, sos):
+        """Apply the buffered position to an SOS dict (SOSEvent.to_dict() shape); returns it"""
+        entry = self.latest.get(sos['id'])
+        if entry is not None:
+            sos.update(entry[1])
+        return sos
+
+    def _run(self):
+        while True:
+            self._wake.wait(LOCATION_FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write every pending fix in one transaction; returns the number written"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+            newest, self._positions = self._positions, {}
+            self._flushing = rows
+            positions = []
+            for sos_id, row in newest.items():
+                # Another worker, or a batch upload, may have seen a later fix
+                entry = self.latest.get(sos_id)
+                position = entry[1] if entry is not None and entry[0] > row['timestamp'] else row
+                positions.append({
+                    'sos_id': sos_id,
+                    'new_latitude': position['latitude'],
+                    'new_longitude': position['longitude'],
+                    'new_battery_percentage': position['battery_percentage']
+                })
+        if not rows:
+            return 0
+
+        with self._app.app_context():
+            try:
+                db.session.execute(LocationUpdate.__table__.insert(), rows)
+                if positions:
+                    db.session.execute(SOS_POSITION_UPDATE, positions)
+                db.session.commit()
+            except Exception as e:
+                print(f"Location flush failed, keeping {len(rows)} fix(es): {str(e)}")
+                db.session.rollback()
+                with self._lock:
+                    merged = rows + self._pending
+                    overflow = max(0, len(merged) - LOCATION_BUFFER_LIMIT)
+                    self._pending = merged[overflow:]
+                    self.dropped += overflow
+                    self._flushing = []
+                    for sos_id, row in newest.items():
+                        current = self._positions.get(sos_id)
+                        if current is None or row['timestamp'] > current['timestamp']:
+                            self._positions[sos_id] = row
+                return 0
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            self._flushing = []
+            self.flushes += 1
+            self.flushed += len(rows)
+        return len(rows)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'write_behind': LOCATION_WRITE_BEHIND,
+                'pending': len(self._pending),
+                'tracked_sos': len(self.latest),
+                'flushes': self.flushes,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+            }
+
+
+location_buffer = LocationBuffer()
@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Most fixes accepted in one batch upload
+MAX_LOCATION_BATCH = int(os.getenv('MAX_LOCATION_BATCH', 500))
+# Seconds a fix may be stamped ahead of the server clock, or before the SOS started
+LOCATION_CLOCK_SKEW = int(os.getenv('LOCATION_CLOCK_SKEW', 300))
+
+FIX_COLUMNS = ['latitude', 'longitude', 'battery_percentage', 'timestamp']
+
+
+def parse_fix_times(values):
+    """Fix timestamps as naive-UTC datetime64: epoch milliseconds or ISO-8601 strings, NaT when unparseable"""
+    def naive_us(parsed):
+        # The two parses can come back at different resolutions, so both are converted before merging
+        return parsed.dt.tz_convert(None).to_numpy(dtype='datetime64[us]')
+
+    epoch_ms = pd.to_numeric(values, errors='coerce')
+    times = naive_us(pd.to_datetime(epoch_ms, unit='ms', errors='coerce', utc=True))
+    text = (epoch_ms.isna() & values.notna()).to_numpy()
+    if text.any():
+        times[text] = naive_us(pd.to_datetime(values[text].astype(str), format='ISO8601', errors='coerce', utc=True))
+    return times
+
+
+def parse_fixes(fixes, not_before, now):
+    """Validate a batch of fixes in one pass over column arrays.
+
+    Returns (latitude, longitude, battery, timestamp) arrays holding the
+    valid fixes oldest first, with repeated timestamps dropped, and the
+    indexes of the rejected ones. Times are naive UTC like the rest of the
+    database.
+    """
+    frame = pd.DataFrame.from_records(fixes, columns=FIX_COLUMNS)
+    lat = pd.to_numeric(frame['latitude'], errors='coerce').to_numpy(dtype=np.float64)
+    lon = pd.to_numeric(frame['longitude'], errors='coerce').to_numpy(dtype=np.float64)
+    battery = pd.to_numeric(frame['battery_percentage'], errors='coerce').to_numpy(dtype=np.float64)
+    times = parse_fix_times(frame['timestamp'])
+
+    skew = np.timedelta64(LOCATION_CLOCK_SKEW, 's')
+    valid = (
+        np.isfinite(lat) & np.isfinite(lon)
+        & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        & ((lat != 0) | (lon != 0))
+        & ~np.isnat(times)
+    )
+    valid[valid] &= (times[valid] >= np.datetime64(not_before, 'us') - skew) \
+        & (times[valid] <= np.datetime64(now, 'us') + skew)
+    rejected = np.flatnonzero(~valid)
+
+    keep = np.flatnonzero(valid)
+    keep = keep[np.argsort(times[keep], kind='stable')]
+    _, first = np.unique(times[keep], return_index=True)
+    keep = keep[first]
+
+    battery = np.clip(np.nan_to_num(battery[keep], nan=0), 0, 100).astype(np.int64)
+    return lat[keep], lon[keep], battery, times[keep], rejected
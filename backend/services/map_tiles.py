@@ -0,0 +1,233 @@
+import os
+import json
+import zlib
+import shutil
+import struct
+import tempfile
+import threading
+import numpy as np
+from services.heatmap import get_pyramid, HEATMAP_MIN_ZOOM, HEATMAP_MAX_ZOOM
+from services.ttl_cache import TTLCache
+
+TILE_SIZE = 256
+MAX_TILE_ZOOM = 20
+TILE_FORMATS = {'png': 'image/png', 'json': 'application/json'}
+
+# Bump when rendering changes so cached tiles and browser copies are replaced
+TILE_RENDER_VERSION = 1
+
+# In-memory LRU of encoded tiles, backed by an on-disk cache ('' disables it)
+TILE_CACHE_SIZE = int(os.getenv('TILE_CACHE_SIZE', 1024))
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'safespace-tiles'))
+TILE_MAX_AGE = int(os.getenv('TILE_MAX_AGE', 86400))
+
+# Points are drawn as Gaussian blobs of this radius in pixels
+SPLAT_RADIUS = 12
+
+# Vector tile coordinates are integers in 0..extent, as in Mapbox vector tiles
+VECTOR_EXTENT = 4096
+
+# Colour stops (position, r, g, b): hazards go yellow to red, safety signals red to green
+HAZARD_RAMP = [(0.0, 255, 220, 0), (1.0, 215, 25, 28)]
+SAFETY_RAMP = [(0.0, 215, 25, 28), (0.5, 253, 174, 97), (1.0, 26, 150, 65)]
+
+_offsets = np.arange(-SPLAT_RADIUS, SPLAT_RADIUS + 1)
+_kernel = np.exp(-(_offsets[:, None] ** 2 + _offsets[None, :] ** 2) / (2 * (SPLAT_RADIUS / 2.5) ** 2))
+
+
+def tile_bounds(z, x, y):
+    """(west, south, east, north) of a slippy-map tile"""
+    n = 2 ** z
+
+    def lat(row):
+        return float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * row / n)))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def project(lats, lons, z, x, y, size=TILE_SIZE):
+    """Web Mercator pixel coordinates of points relative to a tile's top-left corner"""
+    n = 2 ** z
+    px = ((lons + 180.0) / 360.0 * n - x) * size
+    lat_rad = np.radians(lats)
+    py = ((1.0 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2.0 * n - y) * size
+    return px, py
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def encode_png(rgba):
+    """Encode an (h, w, 4) uint8 array as PNG, without an imaging library"""
+    height, width = rgba.shape[:2]
+    # Filter type 0 (None) in front of every scanline
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1)
+    return (b'\x89PNG\r\n\x1a\n' +
+            _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) +
+            _png_chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            _png_chunk(b'IEND', b''))
+
+
+def _ramp(t, stops):
+    positions = [stop[0] for stop in stops]
+    return np.stack([np.interp(t, positions, [stop[channel] for stop in stops]) for channel in (1, 2, 3)], axis=-1)
+
+
+def _cells_near_tile(level, z, x, y, margin_px=0):
+    west, south, east, north = tile_bounds(z, x, y)
+    pad_lon = (east - west) / TILE_SIZE * margin_px
+    pad_lat = (north - south) / TILE_SIZE * margin_px
+    return level.select((west - pad_lon, south - pad_lat, east + pad_lon, north + pad_lat))
+
+
+def render_png(pyramid, spec, z, x, y):
+    """Heatmap tile: blobs per pyramid cell, weighted by row count, coloured by the layer's spec"""
+    # Cells a quarter of the tile's 32px heatmap cells keep blobs smooth at every zoom
+    level = pyramid.levels.get(min(max(z + 2, HEATMAP_MIN_ZOOM), HEATMAP_MAX_ZOOM))
+    size = TILE_SIZE + 2 * SPLAT_RADIUS
+    density = np.zeros(size * size)
+    weighted = np.zeros(size * size)
+
+    if level is not None:
+        cells = _cells_near_tile(level, z, x, y, SPLAT_RADIUS)
+        if len(cells):
+            px, py = project(level.lat[cells], level.lon[cells], z, x, y)
+            cols = (np.rint(px).astype(np.int64) + SPLAT_RADIUS)[:, None] + _offsets[None, :]
+            rows = (np.rint(py).astype(np.int64) + SPLAT_RADIUS)[:, None] + _offsets[None, :]
+            cols = np.broadcast_to(cols[:, None, :], (len(cells), len(_offsets), len(_offsets)))
+            rows = np.broadcast_to(rows[:, :, None], cols.shape)
+            weights = level.count[cells][:, None, None] * _kernel[None, :, :]
+            inside = (rows >= 0) & (rows < size) & (cols >= 0) & (cols < size)
+            flat = rows[inside] * size + cols[inside]
+            density = np.bincount(flat, weights=weights[inside], minlength=size * size)
+            if level.mean is not None:
+                means = np.nan_to_num(level.mean[cells])[:, None, None] * np.ones_like(weights)
+                weighted = np.bincount(flat, weights=(weights * means)[inside], minlength=size * size)
+
+    crop = slice(SPLAT_RADIUS, SPLAT_RADIUS + TILE_SIZE)
+    density = density.reshape(size, size)[crop, crop]
+    weighted = weighted.reshape(size, size)[crop, crop]
+
+    if level is not None and level.mean is not None:
+        mean = np.divide(weighted, density, out=np.zeros_like(density), where=density > 0)
+        colour = _ramp(spec.normalize(mean) if spec is not None else mean / 10.0, SAFETY_RAMP)
+        alpha = np.clip(density, 0, 1) * 0.7
+    else:
+        # Saturates at about three overlapping rows
+        strength = 1.0 - np.exp(-density / 1.5)
+        colour = _ramp(strength, HAZARD_RAMP)
+        alpha = strength * 0.8
+
+    rgba = np.empty((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    rgba[..., :3] = np.clip(colour, 0, 255).astype(np.uint8)
+    rgba[..., 3] = np.clip(alpha * 255, 0, 255).astype(np.uint8)
+    return encode_png(rgba)
+
+
+def render_vector(pyramid, name, z, x, y):
+    """JSON vector tile: one [x, y, weight, count] feature per heatmap cell in the tile"""
+    level = pyramid.levels.get(min(max(z, HEATMAP_MIN_ZOOM), HEATMAP_MAX_ZOOM))
+    features = []
+    if level is not None:
+        cells = _cells_near_tile(level, z, x, y)
+        if len(cells):
+            px, py = project(level.lat[cells], level.lon[cells], z, x, y, VECTOR_EXTENT)
+            weights = level.count[cells] if level.mean is None else np.round(level.mean[cells], 3)
+            features = [
+                [int(fx), int(fy), None if np.isnan(weight) else weight, int(count)]
+                for fx, fy, weight, count in zip(np.rint(px), np.rint(py), weights.tolist(), level.count[cells])
+            ]
+    return json.dumps({
+        'layer': name,
+        'extent': VECTOR_EXTENT,
+        'zoom': level.zoom if level is not None else z,
+        'features': features
+    }, separators=(',', ':')).encode()
+
+
+class TileCache:
+    """Bounded LRU of encoded tiles in front of an optional on-disk cache.
+
+    The layer version is part of every key and disk path, so a reloaded or
+    edited layer never serves stale tiles; directories of older versions are
+    removed the first time a new version is written.
+    """
+
+    def __init__(self, maxsize=TILE_CACHE_SIZE, directory=TILE_CACHE_DIR):
+        self.memory = TTLCache(maxsize=maxsize, ttl=None)
+        self.directory = directory
+        self._pruned = set()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        city, layer, version, z, x, y, fmt = key
+        return os.path.join(self.directory, city, f'{layer}-{version}', str(z), str(x), f'{y}.{fmt}')
+
+    def _prune(self, city, layer, version):
+        with self._lock:
+            if (city, layer, version) in self._pruned:
+                return
+            self._pruned.add((city, layer, version))
+        city_dir = os.path.join(self.directory, city)
+        if not os.path.isdir(city_dir):
+            return
+        for entry in os.listdir(city_dir):
+            if entry.startswith(f'{layer}-') and entry != f'{layer}-{version}':
+                shutil.rmtree(os.path.join(city_dir, entry), ignore_errors=True)
+
+    def get(self, key):
+        body = self.memory.get(key)
+        if body is not None or not self.directory:
+            return body
+        try:
+            with open(self._path(key), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        self.memory.set(key, body)
+        return body
+
+    def set(self, key, body):
+        self.memory.set(key, body)
+        if not self.directory:
+            return
+        self._prune(*key[:3])
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write tile cache {path}: {e}")
+
+    def stats(self):
+        return {'memory': self.memory.stats(), 'directory': self.directory or None}
+
+
+tile_cache = TileCache()
+
+
+def tile_etag(layer):
+    return f'{layer.version}.{TILE_RENDER_VERSION}'
+
+
+def get_tile(city, layers, name, z, x, y, fmt):
+    """Encoded tile bytes, rendered on a cache miss"""
+    layer = layers[name]
+    key = (city.slug, name, tile_etag(layer), z, x, y, fmt)
+    body = tile_cache.get(key)
+    if body is None:
+        pyramid = get_pyramid(city.slug, layers, name)
+        if fmt == 'png':
+            body = render_png(pyramid, layers.spec(name), z, x, y)
+        else:
+            body = render_vector(pyramid, name, z, x, y)
+        tile_cache.set(key, body)
+    return body
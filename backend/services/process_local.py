@@ -0,0 +1,29 @@
+import os
+from abc import ABC, abstractmethod
+
+
+class PerProcess(ABC):
+    """Base for long-lived objects that own threads, locks or pools.
+
+    Such objects are created at import, which under gunicorn --preload
+    happens in the master. Threads do not survive fork, and with gevent
+    workers a lock, event or executor made in the master is not patched, so
+    a worker waiting on it blocks its whole event loop. Subclasses therefore
+    build that state in ``_init_process``, which ``ensure_process`` runs on
+    first use in every process. An at-fork hook would be too early: it runs
+    before the gevent worker patches threading.
+    """
+
+    _pid = None
+
+    @abstractmethod
+    def _init_process(self):
+        """Create this process's threads, locks and pools"""
+
+    def ensure_process(self):
+        """Run ``_init_process`` if it has not run in this process yet; returns True if it ran"""
+        if self._pid == os.getpid():
+            return False
+        self._pid = os.getpid()
+        self._init_process()
+        return True
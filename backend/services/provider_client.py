@@ -0,0 +1,102 @@
+import os
+import time
+import random
+import threading
+import requests
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from services.process_local import PerProcess
+
+# (connect, read) seconds for every alert provider request
+ALERT_TIMEOUT = (float(os.getenv('ALERT_CONNECT_TIMEOUT', 3.05)), float(os.getenv('ALERT_READ_TIMEOUT', 10)))
+
+
+class ProviderClient(PerProcess):
+    """Base for an alert provider: one pooled keep-alive session and a concurrency limit.
+
+    Subclasses implement ``format_message`` and ``_send(phones, message)``,
+    which delivers one message to up to ``max_batch`` numbers in a single
+    request and returns True on success. ``send_batch`` makes one such
+    request while holding one of ``concurrency`` slots, so callers can run
+    batches in parallel and the provider still sees at most that many
+    requests at once. ``send`` does this for a whole list of numbers and
+    returns {phone: success}.
+    """
+
+    name = 'provider'
+    max_batch = 1
+
+    def __init__(self, concurrency=4, timeout=ALERT_TIMEOUT):
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._slots = None
+
+    def configured(self):
+        return True
+
+    @abstractmethod
+    def format_message(self, woman_name, latitude, longitude, battery, follow_up=False):
+        """Alert text for one SOS"""
+
+    @abstractmethod
+    def _send(self, phones, message):
+        """Send ``message`` to one batch of numbers; returns True on success"""
+
+    def batches(self, phones):
+        return [phones[start:start + self.max_batch] for start in range(0, len(phones), self.max_batch)]
+
+    def _init_process(self):
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+
+    def slots(self):
+        self.ensure_process()
+        return self._slots
+
+    def send_batch(self, phones, message):
+        """One request for up to ``max_batch`` numbers, holding a concurrency slot; returns True on success"""
+        with self.slots():
+            try:
+                return self._send(phones, message)
+            except requests.RequestException as e:
+                print(f"Error sending {self.name} message: {str(e)}")
+                return False
+
+    def send(self, phones, woman_name, latitude, longitude, battery, follow_up=False):
+        if not self.configured():
+            print(f"Warning: {self.name} credentials not configured")
+            return {phone: False for phone in phones}
+
+        message = self.format_message(woman_name, latitude, longitude, battery, follow_up)
+        batches = self.batches(phones)
+        if not batches:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(batches), self.concurrency)) as pool:
+            outcomes = pool.map(lambda batch: self.send_batch(batch, message), batches)
+            return {phone: success for batch, success in zip(batches, outcomes) for phone in batch}
+
+
+class StubClient(ProviderClient):
+    """Offline provider: logs and reports success, or failure at ``failure_rate``"""
+
+    def __init__(self, name, failure_rate=0.0, max_batch=1):
+        super().__init__(concurrency=16)
+        self.name = name
+        self.failure_rate = failure_rate
+        self.max_batch = max_batch
+        self.requests = 0
+
+    def format_message(self, woman_name, latitude, longitude, battery, follow_up=False):
+        prefix = 'SOS still active' if follow_up else 'SOS'
+        return f"{prefix} from {woman_name} at {latitude},{longitude} (battery {battery}%)"
+
+    def _send(self, phones, message):
+        time.sleep(0.05)
+        self.requests += 1
+        success = random.random() >= self.failure_rate
+        print(f"[stub {self.name}] {'sent' if success else 'failed'} to {','.join(phones)}: {message}")
+        return success
@@ -0,0 +1,95 @@
+import os
+import gzip
+import json
+import hashlib
+from flask import request, Response
+from services.ttl_cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+
+# Encodings we pre-compress, in order of preference when the client accepts several
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class EncodedResponse:
+    """A serialized response body plus its pre-compressed variants and strong ETag"""
+
+    __slots__ = ('etag', 'mimetype', 'bodies')
+
+    def __init__(self, body, mimetype='application/json'):
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.mimetype = mimetype
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, 6, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=5)
+
+    def variant_etag(self, encoding):
+        # Each encoding is a different byte sequence, so it needs its own strong ETag
+        return self.etag if encoding == 'identity' else f'{self.etag}-{encoding}'
+
+    def matches(self, etags):
+        if etags.star_tag:
+            return True
+        return any(etags.contains_weak(self.variant_etag(encoding)) for encoding in self.bodies)
+
+    @property
+    def nbytes(self):
+        return sum(len(body) for body in self.bodies.values())
+
+
+class ResponseCache:
+    """Encoded responses keyed by (key, version).
+
+    ``version`` is anything that changes when the underlying data does (a
+    layer hash, a DB aggregate), so a new version simply misses and the
+    stale entry ages out of the LRU.
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE):
+        self.entries = TTLCache(maxsize=maxsize, ttl=None)
+
+    def get(self, key, version, build, mimetype='application/json'):
+        """Cached entry, calling ``build()`` on a miss; dicts and lists are JSON-encoded"""
+        entry = self.entries.get((key, version))
+        if entry is None:
+            body = build()
+            if not isinstance(body, bytes):
+                body = json.dumps(body, separators=(',', ':')).encode()
+            entry = EncodedResponse(body, mimetype)
+            self.entries.set((key, version), entry)
+        return entry
+
+    def stats(self):
+        return self.entries.stats()
+
+
+response_cache = ResponseCache()
+
+
+def cached_response(entry, status=200, public=True):
+    """Serve an EncodedResponse: 304 on a matching If-None-Match, else the best accepted encoding.
+
+    ``no-cache`` lets browsers and proxies keep the body but revalidate it on
+    every poll, which costs one header comparison here.
+    """
+    cache_control = 'public, no-cache' if public else 'private, no-cache'
+    encoding = request.accept_encodings.best_match(ENCODINGS) or 'identity'
+
+    if entry.matches(request.if_none_match):
+        # Same ETag the 200 for this Accept-Encoding would carry
+        response = Response(status=304)
+        response.set_etag(entry.variant_etag(encoding))
+    else:
+        response = Response(entry.bodies[encoding], status=status, mimetype=entry.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(entry.variant_etag(encoding))
+
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
@@ -1,43 +1,14 @@
 import os
 import requests
-import pandas as pd
 import numpy as np
-from scipy.spatial import KDTree
 from math import radians, sin, cos, sqrt, atan2
 from dotenv import load_dotenv
+from services.city_registry import city_registry
 
 load_dotenv()
 
 OSRM_SERVER = os.getenv('OSRM_SERVER', 'http://router.project-osrm.org')
 
-# Load CSV data
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-
-try:
-    crime_df = pd.read_csv(os.path.join(DATA_DIR, 'bangalore_crimes.csv'))
-    lighting_df = pd.read_csv(os.path.join(DATA_DIR, 'bangalore_lighting.csv'))
-    population_df = pd.read_csv(os.path.join(DATA_DIR, 'bangalore_population.csv'))
-    infrastructure_df = pd.read_csv(os.path.join(DATA_DIR, 'bangalore_nearby_infrastructure.csv'))
-    network_df = pd.read_csv(os.path.join(DATA_DIR, 'bangalore_network_connectivity.csv'))
-    
-    # Initialize KDTrees for fast spatial querying - Use capitalized Latitude/Longitude
-    crime_tree = KDTree(crime_df[['Latitude', 'Longitude']].values) if not crime_df.empty else None
-    lighting_tree = KDTree(lighting_df[['Latitude', 'Longitude']].values) if not lighting_df.empty else None
-    population_tree = KDTree(population_df[['Latitude', 'Longitude']].values) if not population_df.empty else None
-    infrastructure_tree = KDTree(infrastructure_df[['Latitude', 'Longitude']].values) if not infrastructure_df.empty else None
-    network_tree = KDTree(network_df[['Latitude', 'Longitude']].values) if not network_df.empty else None
-    
-    print(f"CSV data loaded and indexed - Crime: {len(crime_df)} rows, Lighting: {len(lighting_df)} rows, Population: {len(population_df)} rows, Infrastructure: {len(infrastructure_df)} rows, Network: {len(network_df)} rows")
-except Exception as e:
-    print(f"Error loading CSV data: {e}")
-    crime_df = pd.DataFrame(columns=['Latitude', 'Longitude', 'Crime type'])
-    lighting_df = pd.DataFrame(columns=['Latitude', 'Longitude', 'lighting_score'])
-    population_df = pd.DataFrame(columns=['Latitude', 'Longitude', 'population_density'])
-    infrastructure_df = pd.DataFrame(columns=['Latitude', 'Longitude', 'infrastructure_score', 'area', 'infrastructure_type'])
-    network_df = pd.DataFrame(columns=['Latitude', 'Longitude', 'network_score', 'area', 'network_type'])
-    crime_tree = lighting_tree = population_tree = infrastructure_tree = network_tree = None
-
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two coordinates in kilometers"""
@@ -170,131 +141,146 @@ def get_routes_from_osrm(start_lat, start_lon, end_lat, end_lon, waypoints=None,
     return []
 
 
-def calculate_crime_exposure(lat, lon, radius=0.003):
+def resolve_layers(lat, lon, layers=None):
+    """Return the given layers, or those of the city containing the point"""
+    if layers is not None:
+        return layers
+    return city_registry.layers_for_point(lat, lon)
+
+
+def calculate_crime_exposure(lat, lon, radius=0.003, layers=None):
     """Count crimes within a radius (default ~300m)"""
-    if crime_tree is None:
-        return 0
-    
-    indices = crime_tree.query_ball_point([lat, lon], radius)
-    return len(indices)
+    return resolve_layers(lat, lon, layers)['crime'].count(lat, lon, radius)
 
 
-def calculate_lighting_score_at_point(lat, lon, radius=0.005):
+def calculate_lighting_score_at_point(lat, lon, radius=0.005, layers=None):
     """Average lighting score within a radius (default ~500m)"""
-    if lighting_tree is None:
+    lighting = resolve_layers(lat, lon, layers)['lighting']
+    if lighting.empty:
         return 5.0  # Neutral fallback
     
-    indices = lighting_tree.query_ball_point([lat, lon], radius)
-    if not indices:
-        return 5.0
-    
-    return lighting_df.iloc[indices]['lighting_score'].mean()
+    indices = lighting.query(lat, lon, radius)
+    return lighting.mean('lighting_score', indices, 5.0)
 
 
-def calculate_population_score_at_point(lat, lon, radius=0.005):
+def calculate_population_score_at_point(lat, lon, radius=0.005, layers=None):
     """Get population density and traffic within a radius (default ~500m)"""
-    if population_tree is None:
+    population = resolve_layers(lat, lon, layers)['population']
+    if population.empty:
         return 15000, False  # Count, is_main_road
     
-    indices = population_tree.query_ball_point([lat, lon], radius)
-    if not indices:
+    indices = population.query(lat, lon, radius)
+    if not len(indices):
         return 15000, False
     
-    relevant_data = population_df.iloc[indices]
-    
     # Try different column names for population
-    pop_col = 'population_density' if 'population_density' in population_df.columns else 'population_count'
-    avg_pop = relevant_data[pop_col].mean() if pop_col in relevant_data.columns else 15000
+    pop_col = 'population_density' if population.has('population_density') else 'population_count'
+    avg_pop = population.mean(pop_col, indices, 15000)
     
-    is_main_road = any(relevant_data.get('is_main_road', [False] * len(relevant_data)))
+    is_main_road = population.has('is_main_road') and bool(population.values['is_main_road'][indices].any())
     
     return avg_pop, is_main_road
 
 
-def calculate_infrastructure_score_at_point(lat, lon, radius=0.005):
+def calculate_infrastructure_score_at_point(lat, lon, radius=0.005, layers=None):
     """Get infrastructure score within a radius (default ~500m)"""
-    if infrastructure_tree is None:
+    infrastructure = resolve_layers(lat, lon, layers)['infrastructure']
+    if infrastructure.empty:
         return 5.0, 'Unknown'  # Score, Type
     
-    indices = infrastructure_tree.query_ball_point([lat, lon], radius)
-    if not indices:
+    indices = infrastructure.query(lat, lon, radius)
+    if not len(indices):
         return 5.0, 'Unknown'
     
-    relevant_data = infrastructure_df.iloc[indices]
-    avg_score = relevant_data['infrastructure_score'].mean()
-    infra_type = relevant_data['infrastructure_type'].mode()[0] if len(relevant_data) > 0 else 'Unknown'
+    avg_score = infrastructure.mean('infrastructure_score', indices, 5.0)
+    infra_type = infrastructure.mode('infrastructure_type', indices)
     
     return avg_score, infra_type
 
 
-def calculate_network_score_at_point(lat, lon, radius=0.005):
+def calculate_network_score_at_point(lat, lon, radius=0.005, layers=None):
     """Get network connectivity score within a radius (default ~500m)"""
-    if network_tree is None:
+    network = resolve_layers(lat, lon, layers)['network']
+    if network.empty:
         return 5.0, 'Unknown'  # Score, Type
     
-    indices = network_tree.query_ball_point([lat, lon], radius)
-    if not indices:
+    indices = network.query(lat, lon, radius)
+    if not len(indices):
         return 5.0, 'Unknown'
     
-    relevant_data = network_df.iloc[indices]
-    avg_score = relevant_data['network_score'].mean()
-    network_type = relevant_data['network_type'].mode()[0] if len(relevant_data) > 0 else 'Unknown'
+    avg_score = network.mean('network_score', indices, 5.0)
+    network_type = network.mode('network_type', indices)
     
     return avg_score, network_type
 
 
-def calculate_crime_score(route_coordinates):
+def sample_layer(layers, name, points, radius=None):
+    """Aggregate a layer over [lon, lat] points as its spec declares; None if the city lacks it"""
+    spec = layers.spec(name)
+    if spec is None:
+        return None
+    lons, lats = np.asarray(points, dtype=np.float64).reshape(-1, 2).T
+    return layers[name].aggregate(spec, lats, lons, radius)
+
+
+def route_sample_indices(route_coordinates, max_samples=20):
+    sample_size = min(max_samples, len(route_coordinates))
+    return np.linspace(0, len(route_coordinates)-1, sample_size, dtype=int)
+
+
+def calculate_crime_score(route_coordinates, layers=None):
     """Calculate average crime exposure for a route"""
-    if crime_df.empty:
+    lon, lat = route_coordinates[0]
+    layers = resolve_layers(lat, lon, layers)
+    if 'crime' not in layers or layers['crime'].empty:
         return np.random.uniform(0.3, 0.7)
     
-    total_crimes = 0
-    sample_size = min(20, len(route_coordinates))
-    sample_indices = np.linspace(0, len(route_coordinates)-1, sample_size, dtype=int)
-    
-    for idx in sample_indices:
-        lon, lat = route_coordinates[idx]
-        total_crimes += calculate_crime_exposure(lat, lon)
+    sample_indices = route_sample_indices(route_coordinates)
+    crimes = sample_layer(layers, 'crime', [route_coordinates[idx] for idx in sample_indices])
     
     # Normalize crime score (0 to 1 scale for the service)
     # Assume 10+ crimes in radius is "very dangerous" (1.0)
-    avg_crimes = total_crimes / sample_size if sample_size > 0 else 0
+    avg_crimes = float(crimes.mean()) if len(crimes) > 0 else 0
     return min(avg_crimes / 10.0, 1.0)
 
 
-def calculate_lighting_score(route_coordinates):
+def calculate_lighting_score(route_coordinates, layers=None):
     """Calculate average lighting score for a route"""
-    if lighting_df.empty:
+    lon, lat = route_coordinates[0]
+    layers = resolve_layers(lat, lon, layers)
+    if 'lighting' not in layers or layers['lighting'].empty:
         return np.random.uniform(0.3, 0.7)
     
-    total_score = 0
-    sample_size = min(20, len(route_coordinates))
-    sample_indices = np.linspace(0, len(route_coordinates)-1, sample_size, dtype=int)
-    
-    for idx in sample_indices:
-        lon, lat = route_coordinates[idx]
-        total_score += calculate_lighting_score_at_point(lat, lon)
+    sample_indices = route_sample_indices(route_coordinates)
+    scores = sample_layer(layers, 'lighting', [route_coordinates[idx] for idx in sample_indices])
     
     # Normalize score (originally 1-10, map to 0-1)
-    avg_score = total_score / sample_size if sample_size > 0 else 5.0
+    avg_score = float(scores.mean()) if len(scores) > 0 else 5.0
     return avg_score / 10.0
 
 
-def calculate_population_score(route_coordinates):
+def calculate_population_score(route_coordinates, layers=None):
     """Calculate average population density for a route"""
-    if population_df.empty:
+    lon, lat = route_coordinates[0]
+    layers = resolve_layers(lat, lon, layers)
+    if 'population' not in layers or layers['population'].empty:
         return 15000
     
-    total_population = 0
-    sample_size = min(20, len(route_coordinates))
-    sample_indices = np.linspace(0, len(route_coordinates)-1, sample_size, dtype=int)
+    sample_indices = route_sample_indices(route_coordinates)
+    population = sample_layer(layers, 'population', [route_coordinates[idx] for idx in sample_indices])
     
-    for idx in sample_indices:
-        lon, lat = route_coordinates[idx]
-        pop_count, _ = calculate_population_score_at_point(lat, lon)
-        total_population += pop_count
+    return float(population.mean()) if len(population) > 0 else 15000
+
+
+def calculate_main_road_share(route_coordinates, layers, radius=0.005):
+    """Fraction of ~20 sampled points that have a main road nearby"""
+    if 'population' not in layers:
+        return 0.0
     
-    return total_population / sample_size if sample_size > 0 else 15000
+    stride = max(1, len(route_coordinates) // 20)
+    lons, lats = np.asarray(route_coordinates[::stride], dtype=np.float64).reshape(-1, 2).T
+    on_main_road = layers['population'].sample(lats, lons, radius, 'any', 'is_main_road', False)
+    return float(np.mean(on_main_road)) if len(on_main_road) else 0.0
 
 
 def check_flagged_zones(route_coordinates, flagged_zones):
@@ -318,69 +304,58 @@ def check_flagged_zones(route_coordinates, flagged_zones):
     return min(risk_penalty, 1.0)  # Cap at 1.0
 
 
-def calculate_route_safety_comprehensive(route, flagged_zones=[]):
-    """Evaluate route safety with point sampling, hotspot penalties, and max exposure - NOW WITH INFRASTRUCTURE & NETWORK"""
+def calculate_route_safety_comprehensive(route, flagged_zones=[], layers=None):
+    """Evaluate route safety with point sampling, hotspot penalties, and max exposure.
+
+    Every layer spec of the city is aggregated over all sample points at once;
+    weighted specs add their points to each sample's score (see layer_registry).
+    """
     coordinates = route['geometry']['coordinates']
+    layers = resolve_layers(coordinates[0][1], coordinates[0][0], layers)
     
     # Sampling: every ~50 segments/points
     stride = max(1, len(coordinates) // 20)
-    sample_points = coordinates[::stride]
-    
-    point_scores = []
-    hotspots_count = 0
-    max_exposure = 0
-    infrastructure_scores = []
-    network_scores = []
-    
-    for lon, lat in sample_points:
-        crime_count = calculate_crime_exposure(lat, lon)
-        lighting = calculate_lighting_score_at_point(lat, lon)
-        pop, _ = calculate_population_score_at_point(lat, lon)
-        infra_score, _ = calculate_infrastructure_score_at_point(lat, lon)
-        network_score, _ = calculate_network_score_at_point(lat, lon)
-        
-        infrastructure_scores.append(infra_score)
-        network_scores.append(network_score)
-        
-        # Point safety calculation
-        # Crime is primary threat (0 to 1, where 1 is dangerous)
-        point_crime_risk = min(crime_count / 5.0, 1.0) 
-        if crime_count > 3:
-            hotspots_count += 1
-            
-        max_exposure = max(max_exposure, point_crime_risk)
-        
-        # Enhanced Point score with infrastructure and network (higher is safer)
-        # Base: Crime (6 points) + Lighting (2 points) + Population (1 point)
-        # NEW: Infrastructure (0.5 points) + Network (0.5 points) = 10 total
-        p_score = (
-            (1 - point_crime_risk) * 6 + 
-            (lighting / 2.0) + 
-            (min(pop / 15000, 1.0) * 1.0) +
-            (infra_score / 10.0 * 0.5) +  # Infrastructure contributes 0.5 points
-            (network_score / 10.0 * 0.5)   # Network contributes 0.5 points
-        )
-        point_scores.append(p_score)
-        
-    avg_safety = sum(point_scores) / len(point_scores) if point_scores else 5.0
+    sample_points = np.asarray(coordinates[::stride], dtype=np.float64).reshape(-1, 2)
+    lons, lats = sample_points.T
+    
+    results = {spec.name: layers[spec.name].aggregate(spec, lats, lons) for spec in layers.specs}
+    
+    # Crime is the primary threat (0 to 1, where 1 is dangerous) and also drives
+    # the hotspot and max-exposure penalties below
+    crime_counts = results.get('crime', np.zeros(len(lats)))
+    point_crime_risk = np.minimum(crime_counts / 5.0, 1.0)
+    hotspots_count = int(np.count_nonzero(crime_counts > 3))
+    max_exposure = float(point_crime_risk.max()) if len(point_crime_risk) else 0
+    
+    # Point score (higher is safer): sum of weighted layer contributions
+    point_scores = np.zeros(len(lats))
+    for spec in layers.specs:
+        if spec.weight:
+            point_scores += spec.score(results[spec.name])
+    
+    avg_safety = float(point_scores.mean()) if len(point_scores) else 5.0
     
     # Apply penalties
-    hotspot_ratio = hotspots_count / len(point_scores) if point_scores else 0
+    hotspot_ratio = hotspots_count / len(point_scores) if len(point_scores) else 0
     penalty = (hotspot_ratio * 2.0) + (max_exposure * 1.5)
     
     final_safety_score = max(0, min(100, (avg_safety * 10) - (penalty * 10)))
     
-    # Calculate averages for infrastructure and network
-    avg_infrastructure = sum(infrastructure_scores) / len(infrastructure_scores) if infrastructure_scores else 5.0
-    avg_network = sum(network_scores) / len(network_scores) if network_scores else 5.0
+    def layer_average(name, default=5.0):
+        values = results.get(name)
+        return float(np.mean(values)) if values is not None and len(values) else default
     
     return {
         'safety_score': round(final_safety_score, 1),
         'hotspots': hotspots_count,
         'max_exposure': round(max_exposure, 2),
-        'avg_lighting': round(sum([calculate_lighting_score_at_point(lat, lon) for lon, lat in sample_points]) / len(sample_points), 1) if sample_points else 5.0,
-        'avg_infrastructure': round(avg_infrastructure, 1),
-        'avg_network': round(avg_network, 1)
+        'avg_lighting': round(layer_average('lighting'), 1),
+        'avg_infrastructure': round(layer_average('infrastructure'), 1),
+        'avg_network': round(layer_average('network'), 1),
+        'layer_averages': {
+            spec.name: round(layer_average(spec.name), 2)
+            for spec in layers.specs if spec.aggregation != 'mode'
+        }
     }
 
 
@@ -389,6 +364,11 @@ def calculate_safe_routes(start_lat, start_lon, end_lat, end_lon, flagged_zones=
     try:
         print(f"Calculating advanced routes from ({start_lat}, {start_lon}) to ({end_lat}, {end_lon})")
         
+        # All candidates share the layers of the city the trip starts in
+        city = city_registry.find_city(start_lat, start_lon)
+        layers = city_registry.get_layers(city)
+        print(f"Using safety layers for {city.name if city else 'no registered city'}")
+        
         # Phase 1: Direct Alternatives
         direct_routes = get_routes_from_osrm(start_lat, start_lon, end_lat, end_lon, num_alternatives=3)
         if not direct_routes:
@@ -415,7 +395,7 @@ def calculate_safe_routes(start_lat, start_lon, end_lat, end_lon, flagged_zones=
         scored_routes = []
         for item in all_candidate_routes:
             route = item['route']
-            safety_metrics = calculate_route_safety_comprehensive(route, flagged_zones)
+            safety_metrics = calculate_route_safety_comprehensive(route, flagged_zones, layers=layers)
             
             # Composite Score: 70% Safety, 30% Distance
             # Distance is normalized against shortest (1.0 = shortest, 0.0 = 1.8x shortest)
@@ -423,11 +403,7 @@ def calculate_safe_routes(start_lat, start_lon, end_lat, end_lon, flagged_zones=
             composite_score = (safety_metrics['safety_score'] * 0.7) + ((1 - distance_penalty) * 30)
             
             # Main road detection (simplified: if >50% of sampled points on main road)
-            main_road_count = 0
-            stride = max(1, len(route['geometry']['coordinates']) // 20)
-            for lon, lat in route['geometry']['coordinates'][::stride]:
-                _, is_main = calculate_population_score_at_point(lat, lon)
-                if is_main: main_road_count += 1
+            main_road_share = calculate_main_road_share(route['geometry']['coordinates'], layers)
             
             scored_routes.append({
                 'route': route,
@@ -435,7 +411,7 @@ def calculate_safe_routes(start_lat, start_lon, end_lat, end_lon, flagged_zones=
                 'composite_score': composite_score,
                 'distance': route['distance'],
                 'duration': route['duration'],
-                'on_main_road': main_road_count > (len(route['geometry']['coordinates'][::stride]) / 2)
+                'on_main_road': main_road_share > 0.5
             })
             
         # Select and Category Mapping
@@ -460,30 +436,25 @@ def calculate_safe_routes(start_lat, start_lon, end_lat, end_lon, flagged_zones=
         # 🏙️ High Population: Highest population density
         pop_routes = []
         for r in scored_routes:
-            pop = calculate_population_score(r['route']['geometry']['coordinates'])
+            pop = calculate_population_score(r['route']['geometry']['coordinates'], layers=layers)
             pop_routes.append((r, pop))
         high_pop_route = max(pop_routes, key=lambda x: x[1])[0]
         
         def get_nearby_landmark(lat, lon, radius=0.01):
             """Get nearby landmark from infrastructure data"""
-            if infrastructure_tree is None:
-                return None
-            
-            indices = infrastructure_tree.query_ball_point([lat, lon], radius)
-            if not indices:
+            infrastructure = layers['infrastructure']
+            indices = infrastructure.query(lat, lon, radius)
+            if not len(indices):
                 return None
             
-            # Get the closest landmark
-            relevant_data = infrastructure_df.iloc[indices]
-            if len(relevant_data) > 0:
-                # Get the first one with an area name
-                for idx in indices[:3]:  # Check first 3 closest
-                    row = infrastructure_df.iloc[idx]
-                    if pd.notna(row.get('area')) and row.get('area') != 'Unknown':
-                        # Calculate distance to this landmark
-                        dist_km = haversine_distance(lat, lon, row['Latitude'], row['Longitude'])
-                        dist_m = int(dist_km * 1000)
-                        return f"{row.get('area', 'landmark')} ({dist_m}m)"
+            # Get the first one with an area name
+            for idx in indices[:3]:  # Check first 3 closest
+                area = infrastructure.label('area', idx)
+                if area and area != 'Unknown':
+                    # Calculate distance to this landmark
+                    dist_km = haversine_distance(lat, lon, float(infrastructure.lat[idx]), float(infrastructure.lon[idx]))
+                    dist_m = int(dist_km * 1000)
+                    return f"{area} ({dist_m}m)"
             return None
 
         def format_route(r, category, label):
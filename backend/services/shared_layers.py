@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import tempfile
+import numpy as np
+from multiprocessing import shared_memory
+from services.spatial_index import index_from_params
+from services.layer_store import Layer
+
+# Environment variable pointing forked workers at the manifest written by the master
+SHARED_LAYERS_ENV = 'SAFESPACE_SHARED_LAYERS'
+
+# Byte alignment of every array inside a segment
+ALIGNMENT = 64
+
+_owned = {}     # segments created by this process (the master), unlinked on release
+_attached = {}  # segments mapped by this process, kept open for its lifetime
+_manifest = None
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def export_layers(slug, layers):
+    """Copy a city's layer arrays and spatial indexes into one shared memory segment.
+
+    Returns the manifest entry workers need to map the segment back into Layer
+    objects without reading CSVs or rebuilding indexes.
+    """
+    entry = {'layers': {}}
+    offset = 0
+    placements = []
+
+    for name, layer in layers.items():
+        arrays = {}
+        for key, array in layer.arrays().items():
+            offset = _align(offset)
+            arrays[key] = [offset, array.dtype.str, list(array.shape)]
+            placements.append((offset, array))
+            offset += array.nbytes
+        entry['layers'][name] = {
+            'arrays': arrays,
+            'categories': layer.categories,
+            'index': layer.index.params() if layer.index is not None else None
+        }
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1), name=f'safespace_{slug}_{os.getpid()}')
+    for start, array in placements:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=start)[...] = array
+
+    _owned[shm.name] = shm
+    _attached[shm.name] = shm
+    entry['segment'] = shm.name
+    entry['size'] = shm.size
+    return entry
+
+
+def _open_segment(name):
+    if name not in _attached:
+        if sys.version_info >= (3, 13):
+            _attached[name] = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Forked workers share the master's resource tracker, so registering
+            # the segment again here does not cause it to be unlinked on exit
+            _attached[name] = shared_memory.SharedMemory(name=name)
+    return _attached[name]
+
+
+def attach_layers(entry):
+    """Map a manifest entry back into read-only Layer objects"""
+    shm = _open_segment(entry['segment'])
+    layers = {}
+
+    for name, spec in entry['layers'].items():
+        arrays = {}
+        for key, (offset, dtype, shape) in spec['arrays'].items():
+            array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            array.setflags(write=False)
+            arrays[key] = array
+
+        values = {key.split('/', 1)[1]: array for key, array in arrays.items() if key.startswith('values/')}
+        codes = {key.split('/', 1)[1]: array for key, array in arrays.items() if key.startswith('codes/')}
+
+        index_arrays = {key.split('/', 1)[1]: array for key, array in arrays.items() if key.startswith('index/')}
+        index = index_from_params(spec['index'], arrays['lat'], arrays['lon'], index_arrays)
+
+        layers[name] = Layer(name, arrays['lat'], arrays['lon'], values, codes, spec['categories'], index=index)
+
+    return layers
+
+
+def publish_manifest(manifest):
+    """Write the manifest to a file and point child processes at it"""
+    global _manifest
+    fd, path = tempfile.mkstemp(prefix='safespace-layers-', suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f)
+    os.environ[SHARED_LAYERS_ENV] = path
+    _manifest = manifest
+    return path
+
+
+def load_manifest():
+    """Manifest published by the master process, or an empty dict"""
+    global _manifest
+    if _manifest is None:
+        path = os.getenv(SHARED_LAYERS_ENV)
+        _manifest = {}
+        if path:
+            try:
+                with open(path) as f:
+                    _manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Could not read shared layer manifest {path}: {e}")
+    return _manifest
+
+
+def release_shared_layers():
+    """Unlink segments created by this process and remove the manifest"""
+    for name, shm in list(_owned.items()):
+        try:
+            shm.unlink()
+            shm.close()
+        except (BufferError, FileNotFoundError):
+            # Live array views keep the mapping until the process exits
+            pass
+        _owned.pop(name, None)
+
+    path = os.environ.pop(SHARED_LAYERS_ENV, None)
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def process_memory():
+    """Memory usage of the current process in KiB, read from /proc (Linux only).
+
+    Pss splits shared pages between the processes mapping them, so with shared
+    layers each worker's Pss stays small while its Rss still counts the segment.
+    """
+    usage = {'pid': os.getpid()}
+    sources = (
+        ('/proc/self/smaps_rollup', ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')),
+        ('/proc/self/status', ('VmRSS', 'RssAnon', 'RssFile', 'RssShmem'))
+    )
+    for path, keys in sources:
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, rest = line.partition(':')
+                    if key in keys:
+                        usage[f'{key.lower()}_kb'] = int(rest.split()[0])
+        except OSError:
+            continue
+
+    usage['shared_segments'] = {name: shm.size for name, shm in _attached.items()}
+    return usage
@@ -1,24 +1,42 @@
 import os
-import requests
 from dotenv import load_dotenv
+from services.provider_client import ProviderClient
 
 load_dotenv()
 
 FAST2SMS_API_KEY = os.getenv('FAST2SMS_API_KEY')
 FAST2SMS_URL = 'https://www.fast2sms.com/dev/bulkV2'
+# Fast2SMS takes a comma-separated ``numbers`` list, so one request covers many contacts
+FAST2SMS_BATCH_SIZE = int(os.getenv('FAST2SMS_BATCH_SIZE', 50))
+FAST2SMS_CONCURRENCY = int(os.getenv('FAST2SMS_CONCURRENCY', 4))
 
 
-def send_emergency_sms(phone_number, woman_name, latitude, longitude, battery):
-    """Send emergency SMS via Fast2SMS"""
-    try:
-        if not FAST2SMS_API_KEY:
-            print("Warning: Fast2SMS API key not configured")
-            return False
-        
-        # Debug: Print first 4 chars of the key to verify it's loaded correctly
-        print(f"DEBUG: Attempting SMS with key starting with: {FAST2SMS_API_KEY[:4]}...")
-        
-        message = (
+class Fast2SMSClient(ProviderClient):
+    """Fast2SMS bulk route: one request per batch of numbers"""
+
+    name = 'Fast2SMS'
+
+    def __init__(self):
+        super().__init__(concurrency=FAST2SMS_CONCURRENCY)
+        self.max_batch = FAST2SMS_BATCH_SIZE
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'cache-control': 'no-cache'
+        })
+
+    def configured(self):
+        return bool(FAST2SMS_API_KEY)
+
+    def format_message(self, woman_name, latitude, longitude, battery, follow_up=False):
+        if follow_up:
+            return (
+                f"🚨 SAFE SPACE UPDATE 🚨\n"
+                f"User: {woman_name}\n"
+                f"Status: SOS STILL ACTIVE\n"
+                f"Updated location: https://maps.google.com/?q={latitude},{longitude}\n"
+                f"Battery: {battery}%"
+            )
+        return (
             f"🚨 SAFE SPACE EMERGENCY 🚨\n"
             f"User: {woman_name}\n"
             f"Status: SOS TRIGGERED\n"
@@ -26,49 +44,41 @@ def send_emergency_sms(phone_number, woman_name, latitude, longitude, battery):
             f"Battery: {battery}%\n"
             f"Action: Immediate assistance required!"
         )
-        
+
+    def _send(self, phones, message):
         payload = {
             'route': 'q',
             'message': message,
             'language': 'english',
             'flash': '0',
-            'numbers': phone_number
-        }
-        
-        headers = {
-            'Authorization': FAST2SMS_API_KEY,
-            'Content-Type': 'application/json',
-            'cache-control': 'no-cache'
+            'numbers': ','.join(phones)
         }
-        
-        response = requests.post(FAST2SMS_URL, headers=headers, json=payload)
-        
+
+        response = self.session.post(
+            FAST2SMS_URL, headers={'Authorization': FAST2SMS_API_KEY}, json=payload, timeout=self.timeout
+        )
+
         if response.status_code == 200:
-            print(f"SMS sent successfully to {phone_number}")
+            print(f"SMS sent successfully to {len(phones)} number(s)")
             return True
-        else:
-            print(f"Failed to send SMS: {response.text}")
-            return False
-    
-    except Exception as e:
-        print(f"Error sending SMS: {str(e)}")
+        print(f"Failed to send SMS: {response.text}")
         return False
 
 
+sms_client = Fast2SMSClient()
+
+
+def send_emergency_sms(phone_number, woman_name, latitude, longitude, battery):
+    """Send emergency SMS via Fast2SMS"""
+    return sms_client.send([phone_number], woman_name, latitude, longitude, battery)[phone_number]
+
+
 def send_bulk_emergency_sms(contacts, woman_name, latitude, longitude, battery):
-    """Send emergency SMS to multiple contacts"""
-    results = []
-    for contact in contacts:
-        success = send_emergency_sms(
-            contact['contact_phone'],
-            woman_name,
-            latitude,
-            longitude,
-            battery
-        )
-        results.append({
-            'contact': contact['contact_name'],
-            'phone': contact['contact_phone'],
-            'success': success
-        })
-    return results
+    """Send emergency SMS to multiple contacts, batched into as few requests as possible"""
+    phones = [contact['contact_phone'] for contact in contacts]
+    sent = sms_client.send(phones, woman_name, latitude, longitude, battery)
+    return [{
+        'contact': contact['contact_name'],
+        'phone': contact['contact_phone'],
+        'success': sent[contact['contact_phone']]
+    } for contact in contacts]
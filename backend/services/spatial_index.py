@@ -0,0 +1,190 @@
+import numpy as np
+
+# Default cell edge in degrees (~550m), close to the radii used for scoring
+DEFAULT_CELL_SIZE = 0.005
+
+# Upper bound on cells per index; sparse, very wide layers get coarser cells
+MAX_CELLS = 1 << 20
+
+# Layers this small are scanned directly; an index would cost more than it saves
+BRUTE_FORCE_MAX_ROWS = 64
+
+
+def _expand_ranges(starts, ends):
+    """Flatten [start, end) ranges into positions plus the range each came from"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    positions = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+    return positions, owner
+
+
+def _within(dlat, dlon, radius, metric='euclidean'):
+    """Distance test: a circle of ``radius`` degrees, or the open square ``box``"""
+    if metric == 'box':
+        return (np.abs(dlat) < radius) & (np.abs(dlon) < radius)
+    return dlat * dlat + dlon * dlon <= radius * radius
+
+
+class GridIndex:
+    """Uniform lat/lon grid stored as CSR arrays.
+
+    ``order`` holds row indices sorted by cell and ``cell_start[c]`` is the
+    offset of cell ``c`` in it, so all cells of one grid row within a query
+    window are a single contiguous slice. Both are plain int32 arrays, which
+    lets the index live in shared memory next to the layer it indexes.
+    """
+
+    kind = 'grid'
+
+    def __init__(self, lat, lon, origin, cell_size, shape, order, cell_start):
+        self.lat = lat
+        self.lon = lon
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.cell_size = float(cell_size)
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.order = order
+        self.cell_start = cell_start
+
+    @classmethod
+    def build(cls, lat, lon, cell_size=DEFAULT_CELL_SIZE):
+        lat0, lon0 = float(lat.min()), float(lon.min())
+        lat_span, lon_span = float(lat.max()) - lat0, float(lon.max()) - lon0
+
+        while (int(lat_span / cell_size) + 1) * (int(lon_span / cell_size) + 1) > MAX_CELLS:
+            cell_size *= 2
+        shape = (int(lat_span / cell_size) + 1, int(lon_span / cell_size) + 1)
+
+        rows = np.minimum(((lat - lat0) / cell_size).astype(np.int64), shape[0] - 1)
+        cols = np.minimum(((lon - lon0) / cell_size).astype(np.int64), shape[1] - 1)
+        cells = rows * shape[1] + cols
+
+        order = np.argsort(cells, kind='stable').astype(np.int32)
+        cell_start = np.zeros(shape[0] * shape[1] + 1, dtype=np.int32)
+        np.cumsum(np.bincount(cells, minlength=shape[0] * shape[1]), out=cell_start[1:])
+
+        return cls(lat, lon, (lat0, lon0), cell_size, shape, order, cell_start)
+
+    def arrays(self):
+        return {'order': self.order, 'cell_start': self.cell_start}
+
+    def params(self):
+        return {'kind': self.kind, 'origin': self.origin, 'cell_size': self.cell_size, 'shape': self.shape}
+
+    def _window(self, value, radius, origin, size):
+        first = int(np.floor((value - radius - origin) / self.cell_size))
+        last = int(np.floor((value + radius - origin) / self.cell_size))
+        return max(first, 0), min(last, size - 1)
+
+    def candidates(self, lat, lon, radius):
+        """Row indices in all cells overlapping the query square"""
+        row0, row1 = self._window(lat, radius, self.origin[0], self.shape[0])
+        col0, col1 = self._window(lon, radius, self.origin[1], self.shape[1])
+        if row0 > row1 or col0 > col1:
+            return np.empty(0, dtype=np.int32)
+
+        ncols = self.shape[1]
+        slices = [
+            self.order[self.cell_start[row * ncols + col0]:self.cell_start[row * ncols + col1 + 1]]
+            for row in range(row0, row1 + 1)
+        ]
+        return np.concatenate(slices) if len(slices) > 1 else slices[0]
+
+    def query(self, lat, lon, radius, metric='euclidean'):
+        """Sorted row indices within ``radius`` degrees of a point"""
+        candidates = self.candidates(lat, lon, radius)
+        if not len(candidates):
+            return candidates
+        dlat = self.lat[candidates].astype(np.float64) - lat
+        dlon = self.lon[candidates].astype(np.float64) - lon
+        return np.sort(candidates[_within(dlat, dlon, radius, metric)])
+
+    def count(self, lat, lon, radius, metric='euclidean'):
+        return len(self.query(lat, lon, radius, metric))
+
+    def query_many(self, lats, lons, radius, metric='euclidean'):
+        """All (point, row) pairs within ``radius`` for a batch of points.
+
+        Each point's window spans at most ``span`` grid rows; every (point, grid
+        row) pair is one contiguous slice of ``order``, so the whole batch is
+        gathered with a handful of array operations and no Python loop.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        nrows, ncols = self.shape
+
+        row0 = np.floor((lats - radius - self.origin[0]) / self.cell_size).astype(np.int64)
+        row1 = np.floor((lats + radius - self.origin[0]) / self.cell_size).astype(np.int64)
+        col0 = np.clip(np.floor((lons - radius - self.origin[1]) / self.cell_size).astype(np.int64), 0, None)
+        col1 = np.clip(np.floor((lons + radius - self.origin[1]) / self.cell_size).astype(np.int64), None, ncols - 1)
+
+        span = int((row1 - row0).max()) + 1 if len(lats) else 0
+        grid_rows = row0[:, None] + np.arange(span)[None, :]
+        valid = (grid_rows <= row1[:, None]) & (grid_rows >= 0) & (grid_rows < nrows) & (col0 <= col1)[:, None]
+
+        points, steps = np.nonzero(valid)
+        cells = grid_rows[points, steps] * ncols
+        starts = self.cell_start[cells + col0[points]]
+        ends = self.cell_start[cells + col1[points] + 1]
+
+        positions, owner = _expand_ranges(starts, ends)
+        rows = self.order[positions]
+        points = points[owner]
+        dlat = self.lat[rows].astype(np.float64) - lats[points]
+        dlon = self.lon[rows].astype(np.float64) - lons[points]
+        keep = _within(dlat, dlon, radius, metric)
+        return points[keep], rows[keep]
+
+
+class BruteForceIndex:
+    """Direct scan for tiny layers, with the same interface as GridIndex"""
+
+    kind = 'brute'
+
+    def __init__(self, lat, lon):
+        self.lat = lat
+        self.lon = lon
+
+    def arrays(self):
+        return {}
+
+    def params(self):
+        return {'kind': self.kind}
+
+    def query(self, lat, lon, radius, metric='euclidean'):
+        dlat = self.lat.astype(np.float64) - lat
+        dlon = self.lon.astype(np.float64) - lon
+        return np.flatnonzero(_within(dlat, dlon, radius, metric))
+
+    def count(self, lat, lon, radius, metric='euclidean'):
+        return len(self.query(lat, lon, radius, metric))
+
+    def query_many(self, lats, lons, radius, metric='euclidean'):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        dlat = self.lat.astype(np.float64)[None, :] - lats[:, None]
+        dlon = self.lon.astype(np.float64)[None, :] - lons[:, None]
+        return np.nonzero(_within(dlat, dlon, radius, metric))
+
+
+def build_index(lat, lon, radius=DEFAULT_CELL_SIZE):
+    """Pick the index type for a layer and build it.
+
+    Fixed-radius queries on a grid whose cells match the radius only ever
+    touch a 3x3 block of cells, which beats a KD-tree walk for these layers.
+    """
+    if not len(lat):
+        return None
+    if len(lat) <= BRUTE_FORCE_MAX_ROWS:
+        return BruteForceIndex(lat, lon)
+    return GridIndex.build(lat, lon, cell_size=radius)
+
+
+def index_from_params(params, lat, lon, arrays):
+    """Rebuild an index object around arrays mapped from shared memory"""
+    if params is None:
+        return None
+    if params['kind'] == BruteForceIndex.kind:
+        return BruteForceIndex(lat, lon)
+    return GridIndex(lat, lon, params['origin'], params['cell_size'], params['shape'],
+                     arrays['order'], arrays['cell_start'])
@@ -1,68 +1,72 @@
 import os
-import requests
 from dotenv import load_dotenv
+from services.provider_client import ProviderClient
 
 load_dotenv()
 
 WHATSAPP_API_TOKEN = os.getenv('WHATSAPP_API_TOKEN')
 WHATSAPP_PHONE_ID = os.getenv('WHATSAPP_PHONE_ID')
 WHATSAPP_URL = f'https://graph.facebook.com/v17.0/{WHATSAPP_PHONE_ID}/messages'
+WHATSAPP_CONCURRENCY = int(os.getenv('WHATSAPP_CONCURRENCY', 4))
 
 
-def send_emergency_whatsapp(phone_number, woman_name, latitude, longitude, battery):
-    """Send emergency WhatsApp message via WhatsApp Business API"""
-    try:
-        if not WHATSAPP_API_TOKEN or not WHATSAPP_PHONE_ID:
-            print("Warning: WhatsApp API credentials not configured")
-            return False
-        
+class WhatsAppClient(ProviderClient):
+    """WhatsApp Business API: one recipient per request, over a shared keep-alive session"""
+
+    name = 'WhatsApp'
+    max_batch = 1
+
+    def __init__(self):
+        super().__init__(concurrency=WHATSAPP_CONCURRENCY)
+        self.session.headers.update({
+            'Authorization': f'Bearer {WHATSAPP_API_TOKEN}',
+            'Content-Type': 'application/json'
+        })
+
+    def configured(self):
+        return bool(WHATSAPP_API_TOKEN and WHATSAPP_PHONE_ID)
+
+    def format_message(self, woman_name, latitude, longitude, battery, follow_up=False):
+        if follow_up:
+            return f"🚨 *SOS STILL ACTIVE*\n\n{woman_name} triggered SOS again.\n\n📍 Updated location: https://maps.google.com/?q={latitude},{longitude}\n🔋 Battery: {battery}%"
+        return f"🚨 *EMERGENCY ALERT*\n\n{woman_name} has triggered an SOS!\n\n📍 Location: https://maps.google.com/?q={latitude},{longitude}\n🔋 Battery: {battery}%\n\n⚠️ Please respond immediately!"
+
+    def _send(self, phones, message):
         # Format phone number (remove leading + if present)
-        formatted_phone = phone_number.replace('+', '')
-        
-        message_text = f"🚨 *EMERGENCY ALERT*\n\n{woman_name} has triggered an SOS!\n\n📍 Location: https://maps.google.com/?q={latitude},{longitude}\n🔋 Battery: {battery}%\n\n⚠️ Please respond immediately!"
-        
+        formatted_phone = phones[0].replace('+', '')
+
         payload = {
             'messaging_product': 'whatsapp',
             'to': formatted_phone,
             'type': 'text',
             'text': {
-                'body': message_text
+                'body': message
             }
         }
-        
-        headers = {
-            'Authorization': f'Bearer {WHATSAPP_API_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.post(WHATSAPP_URL, headers=headers, json=payload)
-        
+
+        response = self.session.post(WHATSAPP_URL, json=payload, timeout=self.timeout)
+
         if response.status_code == 200:
-            print(f"WhatsApp message sent successfully to {phone_number}")
+            print(f"WhatsApp message sent successfully to {phones[0]}")
             return True
-        else:
-            print(f"Failed to send WhatsApp message: {response.text}")
-            return False
-    
-    except Exception as e:
-        print(f"Error sending WhatsApp message: {str(e)}")
+        print(f"Failed to send WhatsApp message: {response.text}")
         return False
 
 
+whatsapp_client = WhatsAppClient()
+
+
+def send_emergency_whatsapp(phone_number, woman_name, latitude, longitude, battery):
+    """Send emergency WhatsApp message via WhatsApp Business API"""
+    return whatsapp_client.send([phone_number], woman_name, latitude, longitude, battery)[phone_number]
+
+
 def send_bulk_emergency_whatsapp(contacts, woman_name, latitude, longitude, battery):
     """Send emergency WhatsApp messages to multiple contacts"""
-    results = []
-    for contact in contacts:
-        success = send_emergency_whatsapp(
-            contact['contact_phone'],
-            woman_name,
-            latitude,
-            longitude,
-            battery
-        )
-        results.append({
-            'contact': contact['contact_name'],
-            'phone': contact['contact_phone'],
-            'success': success
-        })
-    return results
+    phones = [contact['contact_phone'] for contact in contacts]
+    sent = whatsapp_client.send(phones, woman_name, latitude, longitude, battery)
+    return [{
+        'contact': contact['contact_name'],
+        'phone': contact['contact_phone'],
+        'success': sent[contact['contact_phone']]
+    } for contact in contacts]
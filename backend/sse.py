@@ -1,91 +1,198 @@
-from flask import Response, stream_with_context
-from models import SOSEvent, LocationUpdate
+from flask import Response, request, stream_with_context
+from sqlalchemy import or_, and_
+from models import db, User, SOSEvent
+from services.event_bus import event_bus, HEARTBEAT
+from services.geo_subscriptions import parse_area
+from services.location_buffer import location_buffer
 import json
-import time
+
+
+def format_event(event_data, event_id=None):
+    if event_id is None:
+        return f"data: {json.dumps(event_data)}\n\n"
+    return f"id: {event_id}\ndata: {json.dumps(event_data)}\n\n"
+
+
+def last_event_id():
+    """Last-Event-ID header (sent by EventSource on reconnect) or ?last_event_id=, as an int"""
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Only the columns the stream sends, so rows never trigger relationship loads
+SOS_COLUMNS = (
+    SOSEvent.id, SOSEvent.woman_id, User.name, User.phone, SOSEvent.latitude, SOSEvent.longitude,
+    SOSEvent.battery_percentage, SOSEvent.status, SOSEvent.timestamp, SOSEvent.resolved_at
+)
+
+
+def sos_payload(id, woman_id, woman_name, woman_phone, latitude, longitude,
+                battery_percentage, status, timestamp, resolved_at):
+    """Same shape as SOSEvent.to_dict()"""
+    return {
+        'id': id,
+        'woman_id': woman_id,
+        'woman_name': woman_name,
+        'woman_phone': woman_phone,
+        'latitude': latitude,
+        'longitude': longitude,
+        'battery_percentage': battery_percentage,
+        'status': status,
+        'timestamp': timestamp.isoformat(),
+        'resolved_at': resolved_at.isoformat() if resolved_at else None
+    }
+
+
+def location_payload(sos_id, woman_id, woman_name, latitude, longitude, battery_percentage, timestamp):
+    return {
+        'sos_id': sos_id,
+        'woman_id': woman_id,
+        'woman_name': woman_name,
+        'latitude': latitude,
+        'longitude': longitude,
+        'battery_percentage': battery_percentage,
+        'timestamp': timestamp.isoformat()
+    }
+
+
+def fetch_active_sos(area=None):
+    """Payloads of currently active SOS events, optionally inside an Area: one query joined to users"""
+    query = (db.session.query(*SOS_COLUMNS)
+             .join(User, User.id == SOSEvent.woman_id)
+             .filter(SOSEvent.status == 'ACTIVE'))
+    if area is not None:
+        # Also fetch every SOS with a buffered live position: it may have moved into the area
+        # since the database last heard, so the area test runs on the overlaid position below
+        query = query.filter(or_(
+            and_(SOSEvent.latitude.between(area.south, area.north),
+                 SOSEvent.longitude.between(area.west, area.east)),
+            SOSEvent.id.in_(list(location_buffer.latest))
+        ))
+    rows = query.order_by(SOSEvent.id).all()
+    payloads = [location_buffer.overlay(sos_payload(*row)) for row in rows]
+    if area is not None:
+        payloads = [data for data in payloads if area.contains(data['latitude'], data['longitude'])]
+    return payloads
 
 
 class SSEManager:
     """Manage Server-Sent Events for real-time updates"""
-    
-    def __init__(self):
-        self.last_sos_id = 0
-        self.last_location_update_id = 0
-    
-    def get_sos_updates(self):
-        """Stream SOS events and location updates"""
+
+    def get_sos_updates(self, resume_from=None, area=None):
+        """Stream SOS events and location updates, citywide or for one Area.
+
+        A client resuming with a Last-Event-ID still in the replay buffer gets
+        just the events it missed; anyone else gets the active SOS events as a
+        snapshot and then live events from now on. With an area, an SOS that
+        was sent keeps streaming after it leaves the area, until resolved.
+        """
+        # Subscribe before taking the snapshot so nothing published in between is lost
+        subscription, replay = event_bus.subscribe(resume_from, area)
+
         @stream_with_context
         def generate():
-            last_sos_check = 0
-            last_location_check = 0
-            
-            while True:
-                try:
-                    # Check for new SOS events
-                    new_sos_events = SOSEvent.query.filter(
-                        SOSEvent.id > last_sos_check
-                    ).all()
-                    
-                    for sos_event in new_sos_events:
-                        event_data = {
-                            'type': 'NEW_SOS' if sos_event.status == 'ACTIVE' else 'SOS_RESOLVED',
-                            'data': sos_event.to_dict()
-                        }
-                        yield f"data: {json.dumps(event_data)}\n\n"
-                        last_sos_check = max(last_sos_check, sos_event.id)
-                    
-                    # Check for location updates
-                    new_location_updates = LocationUpdate.query.filter(
-                        LocationUpdate.id > last_location_check
-                    ).all()
-                    
-                    for update in new_location_updates:
-                        sos_event = SOSEvent.query.get(update.sos_event_id)
-                        if sos_event:
-                            event_data = {
-                                'type': 'LOCATION_UPDATE',
-                                'data': {
-                                    'sos_id': sos_event.id,
-                                    'woman_id': sos_event.woman_id,
-                                    'woman_name': sos_event.woman.name,
-                                    'latitude': update.latitude,
-                                    'longitude': update.longitude,
-                                    'battery_percentage': update.battery_percentage,
-                                    'timestamp': update.timestamp.isoformat()
-                                }
-                            }
-                            yield f"data: {json.dumps(event_data)}\n\n"
-                            last_location_check = max(last_location_check, update.id)
-                    
-                    # Keep connection alive
-                    yield f": heartbeat\n\n"
-                    
-                    # Sleep for 2 seconds before next check
-                    time.sleep(2)
-                
-                except GeneratorExit:
-                    break
-                except Exception as e:
-                    print(f"SSE error: {str(e)}")
-                    time.sleep(2)
-        
+            try:
+                sent_id = subscription.cursor
+                snapshot_ids = set()
+                if replay is not None:
+                    sent_id = resume_from
+                    for event in replay:
+                        yield format_event(event.to_dict(), event.id)
+                        sent_id = event.id
+                else:
+                    snapshot = fetch_active_sos(area)
+                    snapshot_ids.update(data['id'] for data in snapshot)
+                    if area is not None:
+                        event_bus.follow(subscription, snapshot_ids)
+                    for data in snapshot:
+                        yield format_event({'type': 'NEW_SOS', 'data': data}, sent_id)
+
+                # Live events come from the bus; give the connection back to the pool
+                db.session.close()
+
+                # Blocks on the queue only: under gevent workers this parks a greenlet, not a thread
+                while not subscription.closed:
+                    event = subscription.get()
+                    if event is HEARTBEAT:
+                        # Keep connection alive
+                        yield ": heartbeat\n\n"
+                        continue
+
+                    # Already replayed, or already in the snapshot
+                    if event.id <= sent_id:
+                        continue
+                    if event.type == 'NEW_SOS' and event.ref_id in snapshot_ids:
+                        continue
+
+                    yield format_event(event.to_dict(), event.id)
+                    sent_id = event.id
+            except GeneratorExit:
+                pass
+            except Exception as e:
+                print(f"SSE error: {str(e)}")
+            finally:
+                event_bus.unsubscribe(subscription)
+
         return Response(generate(), mimetype='text/event-stream')
 
 
 sse_manager = SSEManager()
 
 
+def sos_event_payload(sos_event, woman):
+    """Serialize an SOS event whose woman is already loaded (usually the current user)"""
+    return sos_payload(
+        sos_event.id, sos_event.woman_id, woman.name, woman.phone, sos_event.latitude,
+        sos_event.longitude, sos_event.battery_percentage, sos_event.status,
+        sos_event.timestamp, sos_event.resolved_at
+    )
+
+
+def publish_new_sos(sos_event, woman):
+    event_bus.publish('NEW_SOS', sos_event_payload(sos_event, woman), ref_id=sos_event.id, topic=sos_event.id)
+
+
+def publish_sos_resolved(sos_event, woman):
+    event_bus.publish('SOS_RESOLVED', sos_event_payload(sos_event, woman), ref_id=sos_event.id, topic=sos_event.id)
+
+
+def publish_location_update(sos_event, location_update, woman):
+    event_bus.publish('LOCATION_UPDATE', location_payload(
+        sos_event.id, sos_event.woman_id, woman.name, location_update.latitude,
+        location_update.longitude, location_update.battery_percentage, location_update.timestamp
+    ), ref_id=location_update.id, topic=sos_event.id)
+
+
 def create_sse_blueprint():
     """Create SSE blueprint"""
-    from flask import Blueprint
+    from flask import Blueprint, jsonify
     from auth import token_required, role_required
-    
+
     sse_bp = Blueprint('sse', __name__)
-    
+
     @sse_bp.route('/sos-updates')
     @token_required
     @role_required('POLICE', 'EMERGENCY')
     def sos_updates(current_user):
-        """Stream SOS updates to police and emergency"""
-        return sse_manager.get_sos_updates()
-    
+        """Stream SOS updates to police and emergency, optionally for ?bbox= or ?lat=&lon=&radius="""
+        try:
+            area = parse_area(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return sse_manager.get_sos_updates(last_event_id(), area)
+
+    @sse_bp.route('/metrics')
+    @token_required
+    @role_required('ADMIN')
+    def sse_metrics(current_user):
+        """Subscriber queue depth, conflation and location write-behind counters for the worker that answers"""
+        return jsonify({
+            'success': True,
+            'metrics': event_bus.metrics(),
+            'location_buffer': location_buffer.metrics()
+        }), 200
+
     return sse_bp
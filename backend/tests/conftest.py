@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Module-level settings are read at import, so these must be set before the app is imported
+_db_file = tempfile.NamedTemporaryFile(prefix='safespace-test-', suffix='.db', delete=False)
+_db_file.close()
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + _db_file.name,
+    'EVENT_BROKER': 'local',
+    'ALERT_PROVIDER': 'stub',
+    'ALERT_STUB_FAILURE_RATE': '0',
+    'FAST2SMS_API_KEY': '',
+    'WHATSAPP_API_TOKEN': '',
+    'WHATSAPP_PHONE_ID': '',
+    # Tests drive the relay and the location writer by hand
+    'BACKGROUND_THREADS_START': 'post_worker_init',
+    'ALERT_RELAY_INTERVAL': '3600',
+    'LOCATION_FLUSH_INTERVAL': '3600',
+    'SOS_FOLLOWUP_DELAY': '0',
+})
+
+
+@pytest.fixture
+def app():
+    from app import app as flask_app
+    from models import db
+    from services.location_buffer import location_buffer
+
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    location_buffer.start(flask_app)
+    location_buffer.latest.clear()
+    location_buffer._pending = []
+    yield flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def users(app):
+    """A police officer and a woman with two emergency contacts, plus auth headers for both"""
+    from models import db, User, EmergencyContact
+    from auth import generate_token
+
+    with app.app_context():
+        police = User(name='Officer', phone='100', email='police@test', role='POLICE', is_approved=True)
+        woman = User(name='Asha', phone='200', email='woman@test', role='WOMAN', is_approved=True)
+        police.set_password('x')
+        woman.set_password('x')
+        db.session.add_all([police, woman])
+        db.session.commit()
+        db.session.add_all([
+            EmergencyContact(woman_id=woman.id, contact_name='Mum', contact_phone='9000000001'),
+            EmergencyContact(woman_id=woman.id, contact_name='Sis', contact_phone='9000000002'),
+        ])
+        db.session.commit()
+        return {
+            'woman_id': woman.id,
+            'police': {'Authorization': 'Bearer ' + generate_token(police.id, 'POLICE')},
+            'woman': {'Authorization': 'Bearer ' + generate_token(woman.id, 'WOMAN')},
+        }
+
+
+@pytest.fixture
+def admin(app):
+    """Auth headers for an admin"""
+    from models import db, User
+    from auth import generate_token
+
+    with app.app_context():
+        user = User(name='Admin', phone='300', email='admin@test', role='ADMIN', is_approved=True)
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+        return {'Authorization': 'Bearer ' + generate_token(user.id, 'ADMIN')}
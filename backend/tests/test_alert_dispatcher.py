@@ -0,0 +1,162 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from models import db, SOSEvent, User, EmergencyContact, AlertOutbox
+from services import alert_dispatcher
+from services.alert_dispatcher import AlertRelay, enqueue_alerts, schedule_follow_up, dispatch_status
+from services.provider_client import StubClient
+
+
+@pytest.fixture
+def sos(app, users):
+    with app.app_context():
+        sos_event = SOSEvent(woman_id=users['woman_id'], latitude=12.97, longitude=77.59,
+                             battery_percentage=80, status='ACTIVE')
+        db.session.add(sos_event)
+        db.session.commit()
+        return sos_event.id
+
+
+@pytest.fixture
+def relay(app):
+    relay = AlertRelay()
+    relay.start(app)
+    return relay
+
+
+def stub_providers(monkeypatch, failure_rate):
+    clients = {
+        'SMS': StubClient('SMS', failure_rate, max_batch=20),
+        'WHATSAPP': StubClient('WhatsApp', failure_rate)
+    }
+    monkeypatch.setitem(alert_dispatcher.PROVIDERS, 'stub', clients)
+    return clients
+
+
+def enqueue(app, sos_id, woman_id, **kwargs):
+    with app.app_context():
+        woman = db.session.get(User, woman_id)
+        contacts = EmergencyContact.query.filter_by(woman_id=woman_id).all()
+        dispatch_id = enqueue_alerts(db.session.get(SOSEvent, sos_id), woman, contacts, **kwargs)
+        db.session.commit()
+        return dispatch_id
+
+
+def drain(app, relay, timeout=5):
+    """Run relay passes until nothing is in flight"""
+    with app.app_context():
+        claimed = relay.relay_once()
+        db.session.remove()
+    deadline = time.monotonic() + timeout
+    while relay._in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert relay._in_flight == 0
+    return claimed
+
+
+def statuses(app, dispatch_id):
+    with app.app_context():
+        return sorted(row.status for row in AlertOutbox.query.filter_by(dispatch_id=dispatch_id))
+
+
+def test_relay_sends_every_row_and_batches_sms(app, users, sos, relay, monkeypatch):
+    clients = stub_providers(monkeypatch, failure_rate=0)
+    dispatch_id = enqueue(app, sos, users['woman_id'])
+
+    assert drain(app, relay) == 4
+    assert statuses(app, dispatch_id) == ['SENT'] * 4
+    # Both SMS contacts go out in one request; WhatsApp is one request per contact
+    assert clients['SMS'].requests == 1
+    assert clients['WHATSAPP'].requests == 2
+
+    with app.app_context():
+        summary = dispatch_status(dispatch_id, woman_id=users['woman_id'])
+        assert summary['complete'] and summary['sent'] == 4
+        assert dispatch_status(dispatch_id, woman_id=users['woman_id'] + 1) is None
+
+
+def test_claimed_rows_are_not_claimed_again_until_the_claim_expires(app, users, sos):
+    enqueue(app, sos, users['woman_id'])
+    first, second = AlertRelay(), AlertRelay()
+
+    with app.app_context():
+        rows = first.claim(10)
+        first_token = rows[0].claimed_by
+        assert len(rows) == 4
+        assert {row.attempts for row in rows} == {1}
+        assert second.claim(10) == []
+
+        # The first worker died mid-send
+        AlertOutbox.query.update({'claimed_at': datetime.utcnow() - timedelta(hours=1)})
+        db.session.commit()
+        reclaimed = second.claim(10)
+        assert len(reclaimed) == 4
+        assert first_token not in {row.claimed_by for row in reclaimed}
+        assert {row.attempts for row in reclaimed} == {2}
+
+
+def test_stale_claim_does_not_overwrite_the_new_one(app, users, sos, relay):
+    enqueue(app, sos, users['woman_id'])
+    with app.app_context():
+        stale_token = relay.claim(10)[0].claimed_by
+        AlertOutbox.query.update({'claimed_at': datetime.utcnow() - timedelta(hours=1)})
+        db.session.commit()
+        current_token = relay.claim(10)[0].claimed_by
+        row = AlertOutbox.query.filter_by(channel='SMS').first()
+        recipient = (row.id, row.contact_phone, row.attempts)
+
+    relay._in_flight += 1
+    relay._deliver(stale_token, 'SMS', StubClient('SMS'), ('Asha', 12.97, 77.59, 80, False),
+                   [row.contact_phone], [recipient])
+
+    with app.app_context():
+        row = db.session.get(AlertOutbox, recipient[0])
+        assert (row.status, row.claimed_by) == ('SENDING', current_token)
+
+
+def test_failures_back_off_then_fail_at_the_attempt_limit(app, users, sos, relay, monkeypatch):
+    stub_providers(monkeypatch, failure_rate=1.0)
+    monkeypatch.setitem(alert_dispatcher.RETRY_POLICIES, 'SMS', (2, 60, 300))
+    monkeypatch.setitem(alert_dispatcher.RETRY_POLICIES, 'WHATSAPP', (2, 60, 300))
+    dispatch_id = enqueue(app, sos, users['woman_id'])
+
+    started = datetime.utcnow()
+    drain(app, relay)
+    assert statuses(app, dispatch_id) == ['PENDING'] * 4
+    with app.app_context():
+        for row in AlertOutbox.query.filter_by(dispatch_id=dispatch_id):
+            assert row.attempts == 1
+            assert row.last_error == 'Provider rejected the message'
+            assert row.next_attempt_at >= started + timedelta(seconds=60)
+
+        # Not due yet
+        assert relay.relay_once() == 0
+        AlertOutbox.query.update({'next_attempt_at': datetime.utcnow()})
+        db.session.commit()
+        db.session.remove()
+
+    drain(app, relay)
+    assert statuses(app, dispatch_id) == ['FAILED'] * 4
+
+
+def test_repeat_triggers_share_one_pending_follow_up(app, users, sos):
+    with app.app_context():
+        woman = db.session.get(User, users['woman_id'])
+        contacts = EmergencyContact.query.filter_by(woman_id=woman.id).all()
+        sos_event = db.session.get(SOSEvent, sos)
+
+        first = schedule_follow_up(sos_event, woman, contacts)
+        db.session.commit()
+        sos_event.latitude = 13.01
+        second = schedule_follow_up(sos_event, woman, contacts)
+        db.session.commit()
+
+        rows = AlertOutbox.query.filter_by(kind='FOLLOW_UP').all()
+        assert first == second
+        assert len(rows) == 4
+        assert {row.latitude for row in rows} == {13.01}
+
+        # Once it has gone out, the next repeat queues a new one
+        AlertOutbox.query.update({'status': 'SENT'})
+        db.session.commit()
+        assert schedule_follow_up(sos_event, woman, contacts) != first
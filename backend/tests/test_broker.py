@@ -0,0 +1,94 @@
+import time
+import socket
+import threading
+import pytest
+from services.broker import Broker, BrokerHub, SocketBroker
+
+
+class Recorder:
+    def __init__(self, expected):
+        self.messages = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, message):
+        self.messages.append(message)
+        if len(self.messages) >= self.expected:
+            self.done.set()
+
+
+@pytest.fixture
+def hub(tmp_path):
+    hub = BrokerHub(str(tmp_path / 'events.sock'))
+    hub.start()
+    yield hub
+    hub.stop()
+
+
+def wait_for_clients(hub, count):
+    deadline = time.monotonic() + 2
+    while hub.client_count < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert hub.client_count == count
+
+
+def test_hub_fans_out_every_message_to_every_worker_in_one_order(hub):
+    workers = [SocketBroker(hub.path) for _ in range(2)]
+    recorders = [Recorder(expected=40) for _ in workers]
+    for worker, recorder in zip(workers, recorders):
+        worker.start(recorder)
+    wait_for_clients(hub, 2)
+
+    def publish(worker, name):
+        for n in range(20):
+            worker.publish({'type': 'NEW_SOS', 'data': {'n': n}, 'ref_id': name})
+
+    threads = [threading.Thread(target=publish, args=(worker, name)) for name, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for recorder in recorders:
+        assert recorder.done.wait(2)
+
+    first, second = ([(m['id'], m['ref_id'], m['data']['n']) for m in r.messages] for r in recorders)
+    assert first == second
+    ids = [message_id for message_id, _, _ in first]
+    assert ids == sorted(set(ids))
+    # Each sender's messages keep their order
+    for name in (0, 1):
+        assert [n for _, ref_id, n in first if ref_id == name] == list(range(20))
+
+    for worker in workers:
+        worker.close()
+
+
+def test_worker_that_stops_reading_is_dropped_without_stalling_others(hub):
+    reader = SocketBroker(hub.path)
+    recorder = Recorder(expected=50)
+    reader.start(recorder)
+    wait_for_clients(hub, 1)
+    connected = set(hub._clients)
+
+    # A connected worker that never reads
+    stalled = SocketBroker(hub.path)
+    stalled._connect()
+    wait_for_clients(hub, 2)
+    (client,) = hub._clients - connected
+    client._outbox.maxsize = 5
+    client.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+    payload = 'x' * 4096
+    for n in range(50):
+        reader.publish({'type': 'LOCATION_UPDATE', 'data': {'n': n, 'pad': payload}, 'ref_id': None})
+
+    assert recorder.done.wait(2)
+    assert [m['data']['n'] for m in recorder.messages] == list(range(50))
+    assert hub.client_count == 1
+    reader.close()
+    stalled.close()
+
+
+def test_broker_interface_is_abstract():
+    with pytest.raises(TypeError):
+        Broker()
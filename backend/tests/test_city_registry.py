@@ -0,0 +1,83 @@
+import json
+import time
+import pytest
+from services.city_registry import CityRegistry, EMPTY_LAYERS
+
+
+def make_city(root, slug, bounds, crimes=()):
+    city_dir = root / slug
+    city_dir.mkdir()
+    (city_dir / 'city.json').write_text(json.dumps({'name': slug.title(), 'bounds': bounds}))
+    lines = ['Latitude,Longitude,Crime type,area'] + [f'{lat},{lon},theft,Here' for lat, lon in crimes]
+    (city_dir / 'crimes.csv').write_text('\n'.join(lines) + '\n')
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    make_city(tmp_path, 'region', {'min_lat': 12, 'max_lat': 14, 'min_lon': 77, 'max_lon': 78},
+              crimes=[(12.5, 77.5)])
+    make_city(tmp_path, 'town', {'min_lat': 12.9, 'max_lat': 13.1, 'min_lon': 77.5, 'max_lon': 77.7},
+              crimes=[(12.97, 77.59), (12.98, 77.6)])
+    return tmp_path
+
+
+def test_point_is_routed_to_the_smallest_enclosing_city(data_dir):
+    registry = CityRegistry(str(data_dir), idle_ttl=60)
+
+    assert registry.find_city(12.97, 77.59).slug == 'town'
+    assert registry.find_city(12.5, 77.1).slug == 'region'
+    assert registry.find_city(40.0, 77.5) is None
+    assert registry.layers_for_point(40.0, 77.5) is EMPTY_LAYERS
+
+
+def test_layers_load_lazily_and_idle_cities_are_evicted(data_dir):
+    registry = CityRegistry(str(data_dir), idle_ttl=60)
+    town, region = registry.cities['town'], registry.cities['region']
+    assert town.layers is None
+
+    layers = registry.layers_for_point(12.97, 77.59)
+    assert len(layers['crime']) == 2
+    assert registry.get_layers(town) is layers
+
+    town.last_used -= 120
+    registry.get_layers(region)
+    assert town.layers is None
+    assert region.layers is not None
+
+
+def test_unload_listeners_run_outside_the_registry_lock(data_dir):
+    registry = CityRegistry(str(data_dir), idle_ttl=60)
+    town = registry.cities['town']
+    registry.get_layers(town)
+    calls = []
+
+    def listener(slug):
+        # A listener that reloads through the registry would deadlock if called under its lock
+        calls.append((slug, registry._lock.acquire(blocking=False)))
+        registry._lock.release()
+
+    registry.on_unload(listener)
+    town.last_used -= 120
+    assert registry.evict_idle() == ['town']
+    assert calls == [('town', True)]
+
+
+def test_idle_process_evicts_without_further_lookups(data_dir):
+    registry = CityRegistry(str(data_dir), idle_ttl=0.05, evict_interval=0.05)
+    town = registry.cities['town']
+    registry.get_layers(town)
+
+    deadline = time.monotonic() + 2
+    while town.layers is not None and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert town.layers is None
+
+
+def test_lock_is_recreated_in_a_forked_process(data_dir):
+    registry = CityRegistry(str(data_dir), idle_ttl=60)
+    registry.get_layers(registry.cities['town'])
+    inherited = registry._lock
+
+    registry._pid = -1  # as seen by a child forked after first use
+    registry.get_layers(registry.cities['town'])
+    assert registry._lock is not inherited
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from flask import Flask
+from services.columnar import encode_columns, decode_columns, wants_columnar
+
+app = Flask(__name__)
+
+
+def test_columns_round_trip_with_their_types():
+    body = encode_columns({
+        'lat': [12.97, 12.98, np.nan],
+        'id': [1, 2 ** 24 + 1, 7],
+    }, meta={'city': 'bangalore'}, types={'id': 'u'})
+    columns, meta = decode_columns(body)
+
+    assert meta == {'city': 'bangalore'}
+    assert list(columns) == ['lat', 'id']
+    assert columns['lat'].dtype == np.float32 and columns['id'].dtype == np.uint32
+    # Ids past 2**24 survive because they are not sent as Float32
+    assert columns['id'].tolist() == [1, 2 ** 24 + 1, 7]
+    assert np.allclose(columns['lat'][:2], [12.97, 12.98])
+    assert np.isnan(columns['lat'][2])
+
+
+def test_columns_start_on_a_four_byte_boundary():
+    body = encode_columns({'x': [1.0, 2.0]}, meta={'odd': 'abc'})
+    data_offset = len(body) - 2 * 4
+    assert data_offset % 4 == 0
+    assert np.frombuffer(body, dtype='<f4', offset=data_offset).tolist() == [1.0, 2.0]
+
+
+def test_empty_and_mismatched_columns():
+    columns, meta = decode_columns(encode_columns({}))
+    assert columns == {} and meta == {}
+
+    with pytest.raises(ValueError):
+        encode_columns({'a': [1, 2], 'b': [1]})
+    with pytest.raises(ValueError):
+        decode_columns(b'JSON' + bytes(12))
+
+
+@pytest.mark.parametrize('path, headers, expected', [
+    ('/?format=binary', {}, True),
+    ('/', {'Accept': 'application/octet-stream'}, True),
+    ('/', {'Accept': 'application/json'}, False),
+    ('/', {}, False),
+])
+def test_format_negotiation(path, headers, expected):
+    with app.test_request_context(path, headers=headers):
+        assert wants_columnar() is expected
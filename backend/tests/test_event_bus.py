@@ -0,0 +1,108 @@
+import queue
+import pytest
+from services.broker import LocalBroker
+from services.event_bus import EventBus, Event, SubscriberQueue
+from services.geo_subscriptions import Area
+
+
+def location(topic, lat, lon=77.5):
+    return Event('LOCATION_UPDATE', {'latitude': lat, 'longitude': lon}, topic=topic)
+
+
+@pytest.fixture
+def bus():
+    return EventBus(heartbeat_interval=60, broker_factory=LocalBroker)
+
+
+def test_queue_conflates_location_updates_per_sos():
+    q = SubscriberQueue(maxsize=10)
+    q.put(location(1, 12.0))
+    q.put(location(2, 13.0))
+    q.put(location(1, 12.5))
+
+    assert q.qsize() == 2
+    assert q.get(0).data['latitude'] == 12.5
+    assert q.get(0).data['latitude'] == 13.0
+    assert q.conflated == 1
+
+
+def test_queue_drops_pending_location_when_sos_resolves():
+    q = SubscriberQueue(maxsize=10)
+    q.put(location(1, 12.0))
+    q.put(Event('SOS_RESOLVED', {'latitude': 12.1, 'longitude': 77.5}, topic=1))
+
+    assert q.qsize() == 1
+    assert q.get(0).type == 'SOS_RESOLVED'
+
+
+def test_full_queue_evicts_location_updates_before_critical_events():
+    q = SubscriberQueue(maxsize=2)
+    q.put(location(1, 12.0))
+    q.put(Event('NEW_SOS', {}, topic=2))
+    q.put(Event('NEW_SOS', {}, topic=3))
+
+    assert [q.get(0).topic, q.get(0).topic] == [2, 3]
+    assert q.dropped == 1
+
+    q.put(Event('NEW_SOS', {}, topic=4))
+    q.put(Event('NEW_SOS', {}, topic=5))
+    with pytest.raises(queue.Full):
+        q.put(Event('NEW_SOS', {}, topic=6))
+
+
+def test_subscriber_receives_published_events(bus):
+    subscription, replay = bus.subscribe()
+    bus.publish('NEW_SOS', {'latitude': 12.9, 'longitude': 77.5}, ref_id=1, topic=1)
+
+    event = subscription.get(timeout=2)
+    assert replay is None
+    assert (event.type, event.ref_id, event.topic) == ('NEW_SOS', 1, 1)
+    assert event.id > subscription.cursor
+
+
+def test_last_event_id_replays_only_missed_events(bus):
+    subscription, _ = bus.subscribe()
+    for topic in (1, 2, 3):
+        bus.publish('NEW_SOS', {'latitude': 12.9, 'longitude': 77.5}, topic=topic)
+    ids = [subscription.get(timeout=2).id for _ in range(3)]
+    bus.unsubscribe(subscription)
+
+    _, replay = bus.subscribe(last_event_id=ids[0])
+    assert [event.id for event in replay] == ids[1:]
+
+    _, replay = bus.subscribe(last_event_id=ids[0] - 10 ** 9)
+    assert replay is None
+
+
+def test_area_subscriber_follows_an_sos_it_has_seen_until_resolved(bus):
+    subscription, _ = bus.subscribe(area=Area.circle(12.9, 77.5, 2000))
+
+    bus.publish('NEW_SOS', {'latitude': 14.0, 'longitude': 77.5}, topic=1)
+    bus.publish('NEW_SOS', {'latitude': 12.9, 'longitude': 77.5}, topic=2)
+    assert subscription.get(timeout=2).topic == 2
+
+    # Leaves the area but stays followed
+    bus.publish('LOCATION_UPDATE', {'latitude': 14.0, 'longitude': 77.5}, topic=2)
+    assert subscription.get(timeout=2).type == 'LOCATION_UPDATE'
+
+    bus.publish('SOS_RESOLVED', {'latitude': 14.0, 'longitude': 77.5}, topic=2)
+    assert subscription.get(timeout=2).type == 'SOS_RESOLVED'
+    bus.publish('LOCATION_UPDATE', {'latitude': 14.0, 'longitude': 77.5}, topic=2)
+    assert subscription.get(timeout=0.3) is None
+
+
+def test_listeners_see_every_event_in_order(bus):
+    seen = []
+    bus.listen(lambda event: seen.append(event.topic))
+    for topic in (1, 2, 3):
+        bus.publish('LOCATION_UPDATE', {'latitude': 12.9, 'longitude': 77.5}, topic=topic)
+
+    assert seen == [1, 2, 3]
+
+
+def test_metrics_are_admin_only(client, users, admin):
+    assert client.get('/api/sse/metrics').status_code == 401
+    assert client.get('/api/sse/metrics', headers=users['police']).status_code == 403
+    response = client.get('/api/sse/metrics', headers=admin)
+    assert response.status_code == 200
+    assert 'location_buffer' in response.get_json()
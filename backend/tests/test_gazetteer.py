@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+from services.city_registry import CityLayers
+from services.layer_store import Layer
+from services.city_registry import city_registry
+from services.gazetteer import Gazetteer, get_gazetteer
+
+
+def layer(name, rows):
+    frame = pd.DataFrame(rows, columns=['Latitude', 'Longitude', 'area'])
+    return Layer.from_frame(name, frame, categorical_columns=('area',))
+
+
+def gazetteer(data_dir=None):
+    layers = CityLayers({
+        'crime': layer('crime', [
+            (12.935, 77.624, 'Koramangala'),
+            (12.937, 77.626, 'Koramangala'),
+            (12.934, 77.610, 'Koramangala Main Road'),
+            (12.975, 77.606, 'MG Road'),
+        ]),
+        'lighting': layer('lighting', [
+            (12.939, 77.628, 'Koramangala'),
+            (12.976, 77.607, 'M.G. Road'),
+            (12.978, 77.640, 'Indiranagar'),
+        ]),
+    })
+    return Gazetteer.from_layers(layers, data_dir)
+
+
+def test_every_query_word_matches_a_word_prefix():
+    results = gazetteer().search('kora main')
+    assert [place['name'] for place in results] == ['Koramangala Main Road']
+    assert not results[0]['fuzzy']
+    assert gazetteer().search('main kora')[0]['name'] == 'Koramangala Main Road'
+    assert gazetteer().search('kora xyz') == []
+
+
+def test_exact_and_leading_matches_rank_first():
+    assert [place['name'] for place in gazetteer().search('koramangala')] == ['Koramangala', 'Koramangala Main Road']
+    assert gazetteer().search('road')[0]['name'] in ('MG Road', 'M.G. Road')
+
+
+def test_same_name_in_several_layers_is_one_place_at_the_centroid():
+    places = [place for place in gazetteer().search('koramangala') if place['name'] == 'Koramangala']
+    assert len(places) == 1
+    # Coordinates are stored as float32
+    assert places[0]['lat'] == pytest.approx(12.937, abs=1e-5)
+    assert places[0]['lon'] == pytest.approx(77.626, abs=1e-5)
+
+
+def test_misspelt_words_fall_back_to_fuzzy_matching():
+    results = gazetteer().search('indranagar')
+    assert results[0]['name'] == 'Indiranagar'
+    assert results[0]['fuzzy']
+    assert gazetteer().search('indranagar', fuzzy=False) == []
+    # Short words are never fuzzy-matched
+    assert gazetteer().search('zz') == []
+
+
+def test_places_from_the_poi_file_are_searchable(tmp_path):
+    (tmp_path / 'pois.csv').write_text('name,Latitude,Longitude,type\nCubbon Park,12.976,77.592,park\n')
+    place = gazetteer(str(tmp_path)).search('cubbon')[0]
+    assert (place['name'], place['type']) == ('Cubbon Park', 'park')
+
+
+def test_gazetteer_is_rebuilt_after_its_city_is_unloaded():
+    city = city_registry.get_city('bangalore')
+    built = get_gazetteer(city)
+    assert get_gazetteer(city) is built
+
+    city_registry._unloaded(['bangalore'])
+    assert get_gazetteer(city) is not built
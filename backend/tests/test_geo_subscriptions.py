@@ -0,0 +1,64 @@
+import random
+import pytest
+from services.geo_subscriptions import Area, AreaIndex, parse_area
+
+
+def build(seed=3):
+    rng = random.Random(seed)
+    areas = {}
+    for member in range(300):
+        lat, lon = 12.5 + rng.random(), 77.0 + rng.random()
+        if member % 3:
+            areas[member] = Area.circle(lat, lon, rng.uniform(200, 20000))
+        else:
+            areas[member] = Area(lon, lat, lon + rng.uniform(0.001, 0.3), lat + rng.uniform(0.001, 0.3))
+    # Larger than MAX_AREA_CELLS, so kept in the linear list
+    areas['state'] = Area(74.0, 11.0, 79.0, 16.0)
+    index = AreaIndex()
+    for member, area in areas.items():
+        index.add(member, area)
+    return index, areas
+
+
+def test_match_agrees_with_checking_every_area():
+    index, areas = build()
+    assert 'state' in index.large
+    rng = random.Random(9)
+    for _ in range(500):
+        lat, lon = 12.4 + rng.random() * 1.3, 76.9 + rng.random() * 1.3
+        expected = {member for member, area in areas.items() if area.contains(lat, lon)}
+        assert set(index.match(lat, lon)) == expected
+
+
+def test_removed_members_stop_matching_and_empty_cells_are_freed():
+    index, areas = build()
+    for member in list(areas):
+        index.remove(member)
+    index.remove('missing')
+
+    assert len(index) == 0
+    assert index.cells == {} and index.large == {}
+    assert index.match(12.9, 77.5) == []
+
+
+def test_circle_excludes_the_corners_of_its_box():
+    area = Area.circle(12.97, 77.59, 1000)
+    assert area.contains(12.97, 77.59)
+    assert area.contains(area.north - 1e-6, 77.59)
+    assert not area.contains(area.north - 1e-6, area.east - 1e-6)
+
+
+@pytest.mark.parametrize('args', [
+    {'lat': 'x', 'lon': '77'},
+    {'lat': '12.9'},
+    {'lat': '12.9', 'lon': '77.5', 'radius': '0'},
+    {'lat': '95', 'lon': '77.5'},
+])
+def test_bad_areas_are_rejected(args):
+    with pytest.raises(ValueError):
+        parse_area(args)
+
+
+def test_no_area_means_citywide():
+    assert parse_area({}) is None
+    assert parse_area({'bbox': '77.5,12.9,77.7,13.1'}).contains(13.0, 77.6)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services.city_registry import city_registry
+from services.heatmap import HeatmapPyramid, HEATMAP_MAX_ZOOM, get_pyramid, parse_bbox
+from services.layer_store import Layer
+
+rng = np.random.default_rng(3)
+FRAME = pd.DataFrame({
+    'Latitude': 12.9 + rng.random(2000) * 0.2,
+    'Longitude': 77.5 + rng.random(2000) * 0.2,
+    'score': np.where(rng.random(2000) < 0.1, np.nan, rng.random(2000) * 10),
+})
+BBOX = (77.55, 12.95, 77.6, 13.0)
+
+
+def layer():
+    return Layer.from_frame('lighting', FRAME)
+
+
+def inside(bbox):
+    west, south, east, north = bbox
+    lat, lon = layer().lat, layer().lon
+    return (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+
+
+def test_bbox_selects_only_cells_inside_it():
+    result = HeatmapPyramid(layer()).query(BBOX, zoom=HEATMAP_MAX_ZOOM)
+    west, south, east, north = BBOX
+
+    assert result['zoom'] == HEATMAP_MAX_ZOOM
+    assert all(south <= lat <= north and west <= lon <= east for lat, lon, _ in result['data'])
+    # At the finest zoom cells are far smaller than the spacing of the points
+    assert sum(result['cell_counts']) == int(inside(BBOX).sum())
+
+
+def test_wide_viewports_fall_back_to_coarser_levels():
+    pyramid = HeatmapPyramid(layer())
+    result = pyramid.query(None, zoom=HEATMAP_MAX_ZOOM, max_cells=100)
+
+    assert result['zoom'] < HEATMAP_MAX_ZOOM
+    assert len(result['data']) <= 100
+    assert result['cell_size'] == pytest.approx(360.0 / (2 ** result['zoom'] * 8))
+    coarse = pyramid.query(None, zoom=result['zoom'])
+    assert sum(coarse['cell_counts']) == len(FRAME)
+
+
+def test_value_layers_report_cell_means():
+    result = HeatmapPyramid(layer(), value_column='score').query(BBOX, zoom=HEATMAP_MAX_ZOOM)
+    scores = layer().values['score'][inside(BBOX)].astype(np.float64)
+
+    # One point per cell at this zoom, so each mean is that point's score; rows without one get null
+    weights = [weight for _, _, weight in result['data']]
+    assert sum(weight is None for weight in weights) == int(np.isnan(scores).sum())
+    assert sorted(weight for weight in weights if weight is not None) == \
+        pytest.approx(np.sort(scores[~np.isnan(scores)]).round(6).tolist())
+
+
+def test_bbox_strings_use_leaflet_order():
+    assert parse_bbox('77.5,12.9,77.6,13.0') == (77.5, 12.9, 77.6, 13.0)
+    for value in ('77.6,12.9,77.5,13.0', '1,2,3', None):
+        with pytest.raises(ValueError):
+            parse_bbox(value)
+
+
+def test_pyramids_are_dropped_with_their_city():
+    city = city_registry.get_city('bangalore')
+    layers = city_registry.get_layers(city)
+    built = get_pyramid(city.slug, layers, 'crime')
+    assert get_pyramid(city.slug, layers, 'crime') is built
+
+    city_registry._unloaded([city.slug])
+    assert get_pyramid(city.slug, layers, 'crime') is not built
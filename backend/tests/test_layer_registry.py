@@ -0,0 +1,40 @@
+import pytest
+from services.layer_registry import LayerSpec, DEFAULT_LAYER_SPECS, resolve_layer_specs
+
+
+def test_city_overrides_disable_and_extend_the_built_in_layers():
+    specs = resolve_layer_specs([
+        {'name': 'crime', 'radius': 0.004},
+        {'name': 'network', 'enabled': False},
+        {'name': 'cctv', 'file': 'cctv.csv', 'aggregation': 'count', 'weight': 1.0, 'scale': 3},
+    ])
+    by_name = {spec.name: spec for spec in specs}
+
+    assert [spec.name for spec in specs] == ['crime', 'lighting', 'population', 'infrastructure', 'cctv']
+    assert by_name['crime'].radius == 0.004
+    # Fields that were not overridden keep their built-in values
+    assert by_name['crime'].weight == 6.0 and by_name['crime'].invert
+    assert by_name['cctv'].default == 0
+    # The built-in specs are left untouched
+    assert DEFAULT_LAYER_SPECS[0].radius == 0.003
+
+
+def test_no_overrides_gives_the_built_in_layers():
+    assert [spec.name for spec in resolve_layer_specs(None)] == [spec.name for spec in DEFAULT_LAYER_SPECS]
+
+
+@pytest.mark.parametrize('config', [
+    {'name': 'x', 'file': 'x.csv', 'aggregation': 'median', 'value': 'v'},
+    {'name': 'x', 'file': 'x.csv', 'aggregation': 'mean'},
+    {'name': 'x', 'file': 'x.csv', 'aggregation': 'mode', 'value': 'kind', 'weight': 1.0},
+])
+def test_invalid_specs_are_rejected(config):
+    with pytest.raises(ValueError):
+        resolve_layer_specs([config])
+
+
+def test_score_normalizes_and_inverts():
+    spec = LayerSpec('crime', 'crimes.csv', aggregation='count', weight=6.0, scale=5.0, invert=True)
+
+    assert spec.score([0, 5, 50]).tolist() == [6.0, 0.0, 0.0]
+    assert LayerSpec('mode', 'm.csv', value='kind', aggregation='mode').categorical == ('kind',)
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+from services.layer_store import Layer
+
+CRIMES = pd.DataFrame({
+    'Latitude': [12.970, 12.971, 12.990, 13.100],
+    'Longitude': [77.590, 77.591, 77.600, 77.700],
+    'Crime type': ['theft', 'assault', 'theft', None],
+    'severity': [3, 5, 1, np.nan],
+    'notes': ['a', 'b', 'c', 'd'],
+})
+
+
+def crimes():
+    return Layer.from_frame('crime', CRIMES, categorical_columns=('Crime type',), cell_size=0.005)
+
+
+def test_frame_is_stored_as_compact_arrays():
+    layer = crimes()
+
+    assert layer.lat.dtype == layer.lon.dtype == np.float32
+    assert layer.values['severity'].dtype == np.float32
+    assert layer.codes['Crime type'].dtype == np.int32
+    # Labels are sorted, missing ones get code -1, other string columns are dropped
+    assert layer.categories['Crime type'] == ['assault', 'theft']
+    assert layer.codes['Crime type'].tolist() == [1, 0, 1, -1]
+    assert not layer.has('notes')
+    assert layer.counts_by('Crime type') == {'assault': 1, 'theft': 2}
+
+
+def test_row_lookups_use_the_arrays():
+    layer = crimes()
+    rows = layer.query(12.970, 77.590, 0.005)
+
+    assert rows.tolist() == [0, 1]
+    assert layer.mean('severity', rows, default=0.0) == 4.0
+    assert layer.mode('Crime type', np.array([0, 2, 3]), default='Unknown') == 'theft'
+    assert layer.label('Crime type', 3, default='Unknown') == 'Unknown'
+
+
+def test_version_changes_with_the_data():
+    changed = CRIMES.assign(severity=[3, 5, 2, np.nan])
+    other = Layer.from_frame('crime', changed, categorical_columns=('Crime type',), cell_size=0.005)
+
+    assert crimes().version == crimes().version
+    assert other.version != crimes().version
+
+
+def test_sample_matches_per_point_aggregation():
+    layer = crimes()
+    lats = np.array([12.970, 12.990, 13.100, 14.000])
+    lons = np.array([77.590, 77.600, 77.700, 77.000])
+
+    counts = layer.sample(lats, lons, 0.005)
+    assert counts.tolist() == [layer.count(lat, lon, 0.005) for lat, lon in zip(lats, lons)]
+
+    means = layer.sample(lats, lons, 0.005, 'mean', 'severity', default=-1.0)
+    # The row at 13.1 has no severity, so that point falls back to the default too
+    assert means.tolist() == [4.0, 1.0, -1.0, -1.0]
+
+    hits = layer.sample(lats, lons, 0.005, 'any', 'severity', default=False)
+    assert hits.tolist() == [True, True, False, False]
+
+
+def test_mode_picks_the_most_frequent_label_and_breaks_ties_by_label():
+    layer = crimes()
+    lats = np.array([12.970, 12.990, 13.100])
+    lons = np.array([77.590, 77.600, 77.700])
+
+    modes = layer.sample(lats, lons, 0.005, 'mode', 'Crime type', default='Unknown')
+    # One assault and one theft near the first point: the tie goes to the first label, as Series.mode() does
+    assert modes.tolist() == ['assault', 'theft', 'Unknown']
+    assert modes.tolist()[:2] == [layer.mode('Crime type', layer.query(lat, lon, 0.005))
+                                  for lat, lon in zip(lats[:2], lons[:2])]
+
+
+def test_box_metric_uses_the_open_square():
+    layer = crimes()
+    # Row 0 is 0.001 away on both axes: outside a 0.0012 circle, inside the square
+    lats, lons = np.array([12.971]), np.array([77.589])
+    assert layer.sample(lats, lons, 0.0012).tolist() == [0]
+    assert layer.sample(lats, lons, 0.0012, metric='box').tolist() == [1]
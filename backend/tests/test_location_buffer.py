@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db, SOSEvent, LocationUpdate
+from services.event_bus import Event
+from services.location_buffer import location_buffer
+
+
+@pytest.fixture
+def sos(app, users):
+    with app.app_context():
+        sos_event = SOSEvent(woman_id=users['woman_id'], latitude=12.97, longitude=77.59,
+                             battery_percentage=80, status='ACTIVE')
+        db.session.add(sos_event)
+        db.session.commit()
+        return sos_event.id
+
+
+def fix(sos_id, latitude, at, battery=70):
+    return LocationUpdate(sos_event_id=sos_id, latitude=latitude, longitude=77.59,
+                          battery_percentage=battery, timestamp=at)
+
+
+def seen(sos_id, latitude, at):
+    """A fix as other workers' buffers learn of it, through the event bus"""
+    location_buffer._on_event(Event('LOCATION_UPDATE', {
+        'latitude': latitude, 'longitude': 77.59, 'battery_percentage': 50, 'timestamp': at.isoformat()
+    }, topic=sos_id))
+
+
+def test_flush_writes_pending_fixes_and_the_newest_position(app, sos):
+    now = datetime.utcnow()
+    location_buffer.add(fix(sos, 12.98, now - timedelta(seconds=2)))
+    location_buffer.add(fix(sos, 12.99, now, battery=65))
+    location_buffer.add(fix(sos, 12.985, now - timedelta(seconds=1)))
+
+    assert location_buffer.flush() == 3
+    assert location_buffer.flush() == 0
+    with app.app_context():
+        assert LocationUpdate.query.filter_by(sos_event_id=sos).count() == 3
+        sos_event = db.session.get(SOSEvent, sos)
+        assert (sos_event.latitude, sos_event.battery_percentage) == (12.99, 65)
+    assert location_buffer.metrics()['pending'] == 0
+
+
+def test_flush_keeps_a_newer_position_seen_on_the_bus(app, sos):
+    now = datetime.utcnow()
+    location_buffer.add(fix(sos, 12.98, now - timedelta(seconds=5)))
+    seen(sos, 13.05, now)
+
+    location_buffer.flush()
+    with app.app_context():
+        assert db.session.get(SOSEvent, sos).latitude == 13.05
+
+
+def test_failed_flush_keeps_its_fixes_for_the_next_one(app, sos, monkeypatch):
+    location_buffer.add(fix(sos, 12.98, datetime.utcnow()))
+
+    def unavailable(*args, **kwargs):
+        raise RuntimeError('database is locked')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'execute', unavailable)
+        assert location_buffer.flush() == 0
+    assert location_buffer.metrics()['pending'] == 1
+
+    assert location_buffer.flush() == 1
+    with app.app_context():
+        assert LocationUpdate.query.filter_by(sos_event_id=sos).count() == 1
+        assert db.session.get(SOSEvent, sos).latitude == 12.98
+
+
+def row(sos_id, latitude, at):
+    return {'sos_event_id': sos_id, 'latitude': latitude, 'longitude': 77.59,
+            'battery_percentage': 60, 'timestamp': at}
+
+
+def test_batch_rows_only_move_the_sos_to_the_row_given_as_latest(app, sos):
+    now = datetime.utcnow()
+    location_buffer.add_rows([row(sos, 12.91, now - timedelta(seconds=9)), row(sos, 12.92, now)])
+    assert location_buffer.flush() == 2
+    with app.app_context():
+        assert db.session.get(SOSEvent, sos).latitude == 12.97
+
+    newest = row(sos, 12.94, now + timedelta(seconds=1))
+    location_buffer.add_rows([row(sos, 12.93, now - timedelta(seconds=1)), newest], latest=newest)
+    location_buffer.flush()
+    with app.app_context():
+        assert db.session.get(SOSEvent, sos).latitude == 12.94
+
+
+def test_unsaved_times_cover_fixes_until_they_are_committed(app, sos, monkeypatch):
+    now = datetime.utcnow()
+    location_buffer.add(fix(sos, 12.98, now))
+    location_buffer.add(fix(sos + 1, 12.98, now - timedelta(seconds=1)))
+    assert location_buffer.unsaved_times(sos) == [now]
+
+    during = []
+    execute = db.session.execute
+
+    def observe(*args, **kwargs):
+        during.append(location_buffer.unsaved_times(sos))
+        return execute(*args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'execute', observe)
+        location_buffer.flush()
+    assert during[0] == [now]
+    assert location_buffer.unsaved_times(sos) == []
+
+
+def test_latest_ignores_out_of_order_fixes_and_forgets_resolved_sos():
+    now = datetime.utcnow()
+    seen(7, 13.0, now)
+    seen(7, 12.0, now - timedelta(seconds=10))
+    assert location_buffer.last_fix_time(7) == now
+    assert location_buffer.overlay({'id': 7, 'latitude': 1.0})['latitude'] == 13.0
+
+    location_buffer._on_event(Event('SOS_RESOLVED', {}, topic=7))
+    assert location_buffer.last_fix_time(7) is None
+    assert location_buffer.overlay({'id': 7, 'latitude': 1.0})['latitude'] == 1.0
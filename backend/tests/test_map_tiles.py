@@ -0,0 +1,25 @@
+def test_layers_list_tile_url_templates(client):
+    city = next(city for city in client.get('/api/map/layers').get_json()['cities'] if city['slug'] == 'bangalore')
+    assert 'crime' in city['layers']
+    assert city['tiles']['png'].endswith('/api/map/tiles/bangalore/{layer}/{z}/{x}/{y}.png')
+
+
+def test_tiles_are_revalidated_by_etag(client):
+    url = '/api/map/tiles/bangalore/crime/13/5861/3787.png'
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.get_data().startswith(b'\x89PNG')
+
+    cached = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+    assert client.get('/api/map/tiles/bangalore/nope/13/5861/3787.png').status_code == 404
+    assert client.get('/api/map/tiles/bangalore/crime/3/99/0.png').status_code == 404
+
+
+def test_cache_stats_are_admin_only(client, users, admin):
+    assert client.get('/api/map/tiles/stats').status_code == 401
+    assert client.get('/api/map/tiles/stats', headers=users['police']).status_code == 403
+    response = client.get('/api/map/tiles/stats', headers=admin)
+    assert response.status_code == 200
+    assert 'cache' in response.get_json()
@@ -0,0 +1,67 @@
+import gzip
+import json
+from flask import Flask
+from services.response_cache import ResponseCache, cached_response
+
+app = Flask(__name__)
+
+
+def serve(entry, **headers):
+    with app.test_request_context(headers=headers):
+        return cached_response(entry)
+
+
+def test_builds_once_per_version():
+    cache = ResponseCache(maxsize=8)
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {'zones': [1, 2, 3]}
+
+    first = cache.get('zones', 1, build)
+    assert cache.get('zones', 1, build) is first
+    assert json.loads(first.bodies['identity']) == {'zones': [1, 2, 3]}
+    assert len(calls) == 1
+
+    second = cache.get('zones', 2, lambda: {'zones': [1, 2]})
+    assert second.etag != first.etag
+
+
+def test_serves_the_accepted_encoding_with_its_own_etag():
+    entry = ResponseCache().get('zones', 1, lambda: {'zones': list(range(100))})
+
+    plain = serve(entry)
+    assert plain.status_code == 200
+    assert plain.get_etag() == (entry.etag, False)
+    assert 'Content-Encoding' not in plain.headers
+
+    compressed = serve(entry, **{'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.get_etag() == (f'{entry.etag}-gzip', False)
+    assert gzip.decompress(compressed.get_data()) == entry.bodies['identity']
+    assert 'Accept-Encoding' in compressed.vary
+
+
+def test_revalidation_returns_304_with_the_variant_etag():
+    entry = ResponseCache().get('zones', 1, lambda: {'zones': [1]})
+
+    response = serve(entry, **{'Accept-Encoding': 'gzip', 'If-None-Match': f'"{entry.etag}-gzip"'})
+    assert response.status_code == 304
+    assert response.get_etag() == (f'{entry.etag}-gzip', False)
+    assert response.get_data() == b''
+
+    # A proxy may hold the identity body and revalidate on behalf of a gzip client
+    response = serve(entry, **{'Accept-Encoding': 'gzip', 'If-None-Match': f'"{entry.etag}"'})
+    assert response.status_code == 304
+    assert response.get_etag() == (f'{entry.etag}-gzip', False)
+
+
+def test_stale_etag_gets_the_new_body():
+    cache = ResponseCache()
+    old = cache.get('zones', 1, lambda: {'zones': [1]})
+    new = cache.get('zones', 2, lambda: {'zones': [1, 2]})
+
+    response = serve(new, **{'If-None-Match': f'"{old.etag}"'})
+    assert response.status_code == 200
+    assert json.loads(response.get_data()) == {'zones': [1, 2]}
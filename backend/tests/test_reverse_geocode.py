@@ -0,0 +1,27 @@
+from services.gazetteer import Gazetteer, METERS_PER_DEGREE
+
+PLACES = [
+    {'name': 'Koramangala', 'key': 'koramangala', 'lat': 12.935, 'lon': 77.624, 'type': 'area', 'weight': 2},
+    {'name': 'Cubbon Park', 'key': 'cubbon park', 'lat': 12.976, 'lon': 77.592, 'type': 'park', 'weight': 1},
+]
+
+
+def gazetteer():
+    return Gazetteer(PLACES, [12.935, 12.9352, 12.976], [77.624, 77.6242, 77.592], [0, 0, 1])
+
+
+def test_nearest_named_point_answers_within_the_limit():
+    place = gazetteer().nearest(12.9755, 77.592, max_distance=300)
+    assert (place['name'], place['type']) == ('Cubbon Park', 'park')
+    assert abs(place['distance_m'] - 0.0005 * METERS_PER_DEGREE) < 1
+
+
+def test_points_beyond_the_limit_get_no_answer():
+    assert gazetteer().nearest(12.95, 77.60, max_distance=300) is None
+    assert Gazetteer([]).nearest(12.95, 77.60) is None
+
+
+def test_longitude_distance_is_scaled_by_latitude():
+    # 0.0025 degrees of longitude is ~271 m at this latitude, though 278 m on the equator
+    place = gazetteer().nearest(12.976, 77.5945, max_distance=275)
+    assert place is not None and place['distance_m'] < 275
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+from services import shared_layers
+from services.city_registry import CityLayers
+
+BANGALORE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'bangalore')
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    monkeypatch.setattr(shared_layers, '_manifest', None)
+    layers = CityLayers.load(BANGALORE).layers
+    entry = shared_layers.export_layers('test', layers)
+    yield layers, entry
+    shared_layers._attached.pop(entry['segment'], None)
+    shared_layers.release_shared_layers()
+
+
+def test_attached_layers_match_the_exported_ones(exported):
+    layers, entry = exported
+    # Map the segment by name, as a worker started without fork would
+    shared_layers._attached.pop(entry['segment']).close()
+    attached = shared_layers.attach_layers(entry)
+
+    assert set(attached) == set(layers)
+    for name, layer in layers.items():
+        copy = attached[name]
+        assert copy.version == layer.version
+        assert copy.categories == layer.categories
+        for key, array in layer.arrays().items():
+            assert np.array_equal(copy.arrays()[key], array), (name, key)
+        assert not copy.lat.flags.writeable
+        assert np.array_equal(copy.query(12.9716, 77.5946, 0.01), layer.query(12.9716, 77.5946, 0.01))
+
+
+def test_manifest_reaches_processes_through_the_environment(exported, monkeypatch):
+    layers, entry = exported
+    path = shared_layers.publish_manifest({'test': entry})
+    assert os.environ[shared_layers.SHARED_LAYERS_ENV] == path
+
+    # A worker reads it back from JSON and attaches from that
+    monkeypatch.setattr(shared_layers, '_manifest', None)
+    attached = shared_layers.attach_layers(shared_layers.load_manifest()['test'])
+    assert attached['crime'].version == layers['crime'].version
+    assert attached['crime'].count(12.9766, 77.5993, 0.003) == layers['crime'].count(12.9766, 77.5993, 0.003)
+
+    shared_layers.release_shared_layers()
+    assert not os.path.exists(path)
+    assert shared_layers.SHARED_LAYERS_ENV not in os.environ
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from models import db, SOSEvent, LocationUpdate, AlertOutbox
+from services.location_buffer import location_buffer
+
+TRIGGER = {'latitude': 12.97, 'longitude': 77.59, 'battery_percentage': 80}
+
+
+def trigger(client, users, **location):
+    return client.post('/api/women/sos', json={**TRIGGER, **location}, headers=users['woman'])
+
+
+def epoch_ms(at):
+    return int((at - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+def test_repeat_trigger_joins_the_open_sos(app, client, users):
+    first = trigger(client, users)
+    assert first.status_code == 201
+    sos_id = first.get_json()['sos_event']['id']
+
+    repeat = trigger(client, users, latitude=12.99)
+    again = trigger(client, users, latitude=13.01)
+    assert repeat.status_code == again.status_code == 200
+    assert repeat.get_json()['coalesced']
+    assert repeat.get_json()['sos_event']['id'] == sos_id
+    assert repeat.get_json()['dispatch_id'] == again.get_json()['dispatch_id']
+
+    location_buffer.flush()
+    with app.app_context():
+        assert SOSEvent.query.count() == 1
+        assert db.session.get(SOSEvent, sos_id).latitude == 13.01
+        assert LocationUpdate.query.filter_by(sos_event_id=sos_id).count() == 2
+        # Two contacts on two channels: one initial alert and one follow-up each
+        assert AlertOutbox.query.filter_by(kind='SOS').count() == 4
+        assert AlertOutbox.query.filter_by(kind='FOLLOW_UP').count() == 4
+
+
+def test_trigger_after_the_window_opens_a_new_sos(app, client, users):
+    sos_id = trigger(client, users).get_json()['sos_event']['id']
+    with app.app_context():
+        db.session.get(SOSEvent, sos_id).timestamp = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+    response = trigger(client, users)
+    assert response.status_code == 201
+    assert response.get_json()['sos_event']['id'] != sos_id
+
+
+def test_retried_batch_upload_stores_each_fix_once(app, client, users):
+    sos_id = trigger(client, users).get_json()['sos_event']['id']
+    now = datetime.utcnow()
+    fixes = [
+        {'latitude': 12.98, 'longitude': 77.59, 'battery_percentage': 70, 'timestamp': epoch_ms(now)},
+        {'latitude': 12.979, 'longitude': 77.59, 'battery_percentage': 71,
+         'timestamp': (now - timedelta(seconds=5)).isoformat() + 'Z'},
+        {'latitude': 95, 'longitude': 77.59, 'timestamp': epoch_ms(now)},
+        {'latitude': 12.97, 'longitude': 77.59, 'timestamp': epoch_ms(now + timedelta(hours=1))},
+    ]
+    url = f'/api/women/sos/{sos_id}/locations'
+
+    first = client.post(url, json={'fixes': fixes}, headers=users['woman']).get_json()
+    assert (first['accepted'], first['duplicates'], first['rejected']) == (2, 0, [2, 3])
+
+    # Caught while the first upload is still buffered, and again once it is written
+    retry = client.post(url, json={'fixes': fixes}, headers=users['woman']).get_json()
+    assert (retry['accepted'], retry['duplicates']) == (0, 2)
+    assert location_buffer.flush() == 2
+    retry = client.post(url, json={'fixes': fixes}, headers=users['woman']).get_json()
+    assert (retry['accepted'], retry['duplicates']) == (0, 2)
+
+    with app.app_context():
+        assert LocationUpdate.query.filter_by(sos_event_id=sos_id).count() == 2
+        assert db.session.get(SOSEvent, sos_id).latitude == 12.98
+
+
+def test_old_batch_does_not_move_the_sos_behind_a_live_fix(app, client, users):
+    sos_id = trigger(client, users).get_json()['sos_event']['id']
+    old = datetime.utcnow() - timedelta(seconds=30)
+
+    live = client.post(f'/api/women/sos/{sos_id}/location', json={'latitude': 13.05, 'longitude': 77.6},
+                       headers=users['woman'])
+    assert live.status_code == 200
+
+    response = client.post(f'/api/women/sos/{sos_id}/locations', headers=users['woman'], json={
+        'fixes': [{'latitude': 12.9, 'longitude': 77.5, 'timestamp': epoch_ms(old)}]
+    })
+    assert response.get_json()['accepted'] == 1
+
+    location_buffer.flush()
+    with app.app_context():
+        assert db.session.get(SOSEvent, sos_id).latitude == 13.05
+        assert LocationUpdate.query.filter_by(sos_event_id=sos_id).count() == 2
+
+
+def test_batch_ending_in_a_stored_fix_does_not_move_the_sos_back(app, client, users):
+    sos_id = trigger(client, users).get_json()['sos_event']['id']
+    now = datetime.utcnow()
+    url = f'/api/women/sos/{sos_id}/locations'
+    client.post(url, headers=users['woman'], json={'fixes': [
+        {'latitude': 12.98, 'longitude': 77.59, 'timestamp': epoch_ms(now - timedelta(seconds=10))},
+        {'latitude': 12.99, 'longitude': 77.59, 'timestamp': epoch_ms(now)},
+    ]})
+    location_buffer.flush()
+    # A worker started since then has not seen those fixes, so only the stored rows can tell
+    location_buffer.latest.clear()
+
+    # An older fix plus a retry of the newest one: only the older fix is new, so the SOS stays put
+    response = client.post(url, headers=users['woman'], json={'fixes': [
+        {'latitude': 12.95, 'longitude': 77.59, 'timestamp': epoch_ms(now - timedelta(seconds=20))},
+        {'latitude': 12.99, 'longitude': 77.59, 'timestamp': epoch_ms(now)},
+    ]}).get_json()
+    assert (response['accepted'], response['duplicates']) == (1, 1)
+
+    location_buffer.flush()
+    with app.app_context():
+        assert db.session.get(SOSEvent, sos_id).latitude == 12.99
+
+
+def test_batch_upload_is_buffered_with_the_live_fixes(app, client, users):
+    sos_id = trigger(client, users).get_json()['sos_event']['id']
+    location_buffer.flush()
+    response = client.post(f'/api/women/sos/{sos_id}/locations', headers=users['woman'], json={
+        'fixes': [{'latitude': 12.99, 'longitude': 77.59, 'timestamp': epoch_ms(datetime.utcnow())}]
+    })
+    assert response.get_json()['accepted'] == 1
+
+    # Nothing is written on the request path; the feed already shows the new position
+    assert location_buffer.metrics()['pending'] == 1
+    assert location_buffer.overlay({'id': sos_id})['latitude'] == 12.99
+    with app.app_context():
+        assert db.session.get(SOSEvent, sos_id).latitude == 12.97
+
+    assert location_buffer.flush() == 1
+    with app.app_context():
+        assert db.session.get(SOSEvent, sos_id).latitude == 12.99
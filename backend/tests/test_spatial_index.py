@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from services.spatial_index import GridIndex, BruteForceIndex, build_index
+
+rng = np.random.default_rng(7)
+LAT = (12.9 + rng.random(3000) * 0.2).astype(np.float32)
+LON = (77.5 + rng.random(3000) * 0.2).astype(np.float32)
+# Query points inside, on the edge of and well outside the indexed extent
+QUERY_LAT = np.concatenate([12.9 + rng.random(200) * 0.2, [12.9, 13.1, 12.85, 13.5]])
+QUERY_LON = np.concatenate([77.5 + rng.random(200) * 0.2, [77.5, 77.7, 77.45, 77.6]])
+
+
+def brute_force_pairs(lats, lons, radius, metric):
+    dlat = LAT.astype(np.float64)[None, :] - lats[:, None]
+    dlon = LON.astype(np.float64)[None, :] - lons[:, None]
+    if metric == 'box':
+        within = (np.abs(dlat) < radius) & (np.abs(dlon) < radius)
+    else:
+        within = dlat * dlat + dlon * dlon <= radius * radius
+    return set(zip(*np.nonzero(within)))
+
+
+@pytest.mark.parametrize('radius', [0.003, 0.005, 0.012])
+@pytest.mark.parametrize('metric', ['euclidean', 'box'])
+def test_query_many_matches_a_brute_force_scan(radius, metric):
+    index = GridIndex.build(LAT, LON, cell_size=0.005)
+    points, rows = index.query_many(QUERY_LAT, QUERY_LON, radius, metric)
+
+    pairs = list(zip(points.tolist(), rows.tolist()))
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == brute_force_pairs(QUERY_LAT, QUERY_LON, radius, metric)
+
+
+def test_single_point_query_matches_query_many():
+    index = GridIndex.build(LAT, LON, cell_size=0.005)
+    points, rows = index.query_many(QUERY_LAT, QUERY_LON, 0.005)
+
+    for point in (0, 17, 201, 203):
+        expected = np.sort(rows[points == point])
+        assert np.array_equal(index.query(QUERY_LAT[point], QUERY_LON[point], 0.005), expected)
+        assert index.count(QUERY_LAT[point], QUERY_LON[point], 0.005) == len(expected)
+
+
+def test_empty_batch_returns_no_pairs():
+    points, rows = GridIndex.build(LAT, LON).query_many([], [], 0.005)
+    assert len(points) == len(rows) == 0
+
+
+def test_index_type_follows_layer_size():
+    assert build_index(LAT[:0], LON[:0]) is None
+    assert isinstance(build_index(LAT[:10], LON[:10]), BruteForceIndex)
+    assert isinstance(build_index(LAT, LON), GridIndex)
+
+    small = BruteForceIndex(LAT, LON)
+    points, rows = small.query_many(QUERY_LAT[:20], QUERY_LON[:20], 0.005)
+    assert set(zip(points.tolist(), rows.tolist())) == brute_force_pairs(QUERY_LAT[:20], QUERY_LON[:20], 0.005, 'euclidean')
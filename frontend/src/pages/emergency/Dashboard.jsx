@@ -14,7 +14,7 @@ const EmergencyDashboard = () => {
 
         const unsubscribe = subscribeToSOSUpdates((update) => {
             if (update.type === 'NEW_SOS') {
-                setSOSEvents(prev => [update.data, ...prev]);
+                setSOSEvents(prev => prev.some(sos => sos.id === update.data.id) ? prev : [update.data, ...prev]);
             }
         });
 
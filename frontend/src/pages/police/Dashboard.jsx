@@ -15,7 +15,7 @@ const PoliceDashboard = () => {
         // Subscribe to real-time updates
         const unsubscribe = subscribeToSOSUpdates((update) => {
             if (update.type === 'NEW_SOS') {
-                setSOSEvents(prev => [update.data, ...prev]);
+                setSOSEvents(prev => prev.some(sos => sos.id === update.data.id) ? prev : [update.data, ...prev]);
             } else if (update.type === 'LOCATION_UPDATE') {
                 setSOSEvents(prev => prev.map(sos =>
                     sos.id === update.data.sos_id ? { ...sos, latitude: update.data.latitude, longitude: update.data.longitude } : sos
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import { MapContainer, TileLayer, Marker, Popup } from 'react-leaflet';
@@ -14,8 +14,13 @@ L.Icon.Default.mergeOptions({
     shadowUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.7.1/images/marker-shadow.png',
 });
 
+// Fixes kept while offline; the oldest are dropped past this many
+const MAX_BUFFERED_FIXES = 500;
+
 const SOSActive = () => {
     const [sosEvent, setSosEvent] = useState(null);
+    const sosIdRef = useRef(null);
+    const pendingFixes = useRef([]);
     const [location, setLocation] = useState(null);
     const [battery, setBattery] = useState(100);
     const navigate = useNavigate();
@@ -41,6 +46,7 @@ const SOSActive = () => {
                     battery_percentage: batteryLevel
                 });
 
+                sosIdRef.current = response.sos_event.id;
                 setSosEvent(response.sos_event);
             }, (error) => {
                 console.error('Location error:', error);
@@ -54,6 +60,19 @@ const SOSActive = () => {
         }
     };
 
+    const flushFixes = async () => {
+        const fixes = pendingFixes.current;
+        if (!sosIdRef.current || fixes.length === 0) return;
+
+        pendingFixes.current = [];
+        try {
+            await womenAPI.uploadSOSLocations(sosIdRef.current, fixes);
+        } catch (error) {
+            // Keep them for the next attempt; the server skips any it already stored
+            pendingFixes.current = [...fixes, ...pendingFixes.current].slice(-MAX_BUFFERED_FIXES);
+        }
+    };
+
     const startLocationTracking = () => {
         const interval = setInterval(() => {
             if (navigator.geolocation) {
@@ -61,14 +80,14 @@ const SOSActive = () => {
                     const { latitude, longitude } = position.coords;
                     setLocation({ latitude, longitude });
 
-                    if (sosEvent) {
-                        const batteryLevel = await getBatteryPercentage();
-                        await womenAPI.updateSOSLocation(sosEvent.id, {
-                            latitude,
-                            longitude,
-                            battery_percentage: batteryLevel
-                        });
-                    }
+                    const batteryLevel = await getBatteryPercentage();
+                    pendingFixes.current = [...pendingFixes.current, {
+                        latitude,
+                        longitude,
+                        battery_percentage: batteryLevel,
+                        timestamp: position.timestamp
+                    }].slice(-MAX_BUFFERED_FIXES);
+                    await flushFixes();
                 });
             }
         }, 5000); // Update every 5 seconds
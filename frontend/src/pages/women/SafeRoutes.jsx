@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import { MapContainer, TileLayer, Polyline, Marker, Popup } from 'react-leaflet';
-import { womenAPI } from '../../utils/api';
+import { womenAPI, mapAPI } from '../../utils/api';
 import L from 'leaflet';
 
 // Nominatim geocoding service
@@ -23,6 +23,10 @@ const SafeRoutes = () => {
     // Flagged zones
     const [flaggedZones, setFlaggedZones] = useState([]);
 
+    // Safety layer tiles drawn over the map
+    const [tileCities, setTileCities] = useState([]);
+    const [safetyOverlay, setSafetyOverlay] = useState('');
+
     // Preferences
     const [safetyPriority, setSafetyPriority] = useState(70);
     const [preferMainRoads, setPreferMainRoads] = useState(false);
@@ -53,8 +57,25 @@ const SafeRoutes = () => {
 
     useEffect(() => {
         loadFlaggedZones();
+        loadTileLayers();
     }, []);
 
+    const loadTileLayers = async () => {
+        try {
+            const data = await mapAPI.getTileLayers();
+            setTileCities(data.cities || []);
+        } catch (error) {
+            console.error('Failed to load map layers:', error);
+        }
+    };
+
+    // City whose tiles are shown: the one containing the start point, else the first
+    const overlayPoint = selectedStart || currentLocation;
+    const overlayCity = tileCities.find(({ bounds }) => overlayPoint &&
+        parseFloat(overlayPoint.lat) >= bounds.min_lat && parseFloat(overlayPoint.lat) <= bounds.max_lat &&
+        parseFloat(overlayPoint.lon) >= bounds.min_lon && parseFloat(overlayPoint.lon) <= bounds.max_lon
+    ) || tileCities[0];
+
     const loadFlaggedZones = async () => {
         try {
             const data = await womenAPI.getFlaggedZones();
@@ -343,6 +364,23 @@ const SafeRoutes = () => {
                         </div>
                     </div>
 
+                    {/* Safety overlay */}
+                    {overlayCity && (
+                        <div className="form-group" style={{ marginTop: 'var(--space-lg)' }}>
+                            <label className="form-label">🗺️ Safety overlay</label>
+                            <select
+                                value={safetyOverlay}
+                                onChange={(e) => setSafetyOverlay(e.target.value)}
+                                className="form-select"
+                            >
+                                <option value="">None</option>
+                                {overlayCity.layers.map((layer) => (
+                                    <option key={layer} value={layer}>{layer.charAt(0).toUpperCase() + layer.slice(1)}</option>
+                                ))}
+                            </select>
+                        </div>
+                    )}
+
                     {/* Calculate Button */}
                     <button
                         onClick={calculateRoutes}
@@ -374,6 +412,14 @@ const SafeRoutes = () => {
                                 attribution='&copy; OpenStreetMap contributors'
                             />
 
+                            {overlayCity && safetyOverlay && overlayCity.layers.includes(safetyOverlay) && (
+                                <TileLayer
+                                    key={`${overlayCity.slug}-${safetyOverlay}`}
+                                    url={overlayCity.tiles.png.replace('{layer}', safetyOverlay)}
+                                    opacity={0.6}
+                                />
+                            )}
+
                             {/* Draw routes with enhanced highlighting for navigation */}
                             {routes.map((route, idx) => {
                                 const isNavigating = navigatingRoute && navigatingRoute.label === route.label;
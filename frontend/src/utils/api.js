@@ -83,6 +83,11 @@ export const womenAPI = {
         body: JSON.stringify(data),
     }),
 
+    uploadSOSLocations: (id, fixes) => apiRequest(`/women/sos/${id}/locations`, {
+        method: 'POST',
+        body: JSON.stringify({ fixes }),
+    }),
+
     cancelSOS: (id) => apiRequest(`/women/sos/${id}/cancel`, {
         method: 'PUT',
     }),
@@ -233,19 +238,27 @@ export const chatbotAPI = {
     }),
 };
 
+// Map layer API
+export const mapAPI = {
+    getTileLayers: () => apiRequest('/map/layers'),
+};
+
 // SSE for real-time updates
-export const subscribeToSOSUpdates = (onUpdate) => {
+// area (optional): { bbox: 'west,south,east,north' } or { lat, lon, radius } in metres
+export const subscribeToSOSUpdates = (onUpdate, area = {}) => {
     const token = localStorage.getItem('token');
-    const eventSource = new EventSource(`${API_BASE_URL}/sse/sos-updates?token=${token}`);
+    const params = new URLSearchParams({ token, ...area });
+    const eventSource = new EventSource(`${API_BASE_URL}/sse/sos-updates?${params}`);
 
     eventSource.onmessage = (event) => {
         const data = JSON.parse(event.data);
         onUpdate(data);
     };
 
+    // The browser reconnects on its own and sends Last-Event-ID, so the
+    // server replays only what was missed; it gives up if the server refuses
     eventSource.onerror = (error) => {
         console.error('SSE Error:', error);
-        eventSource.close();
     };
 
     return () => eventSource.close();
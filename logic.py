@@ -1,9 +1,11 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-import pandas as pd
 import numpy as np
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+import time
 import os
 from dotenv import load_dotenv
 import geocoder
@@ -133,31 +135,40 @@ def inject_today():
 
 print("\n=== Initializing Safe Routes Backend ===")
 
-try:
-    print("Loading safety data...")
-    import os
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    crime_data = pd.read_csv(os.path.join(base_dir, 'app', 'data', 'bangalore_crimes.csv'))
-    lighting_data = pd.read_csv(os.path.join(base_dir, 'app', 'data', 'bangalore_lighting.csv'))
-    population_data = pd.read_csv(os.path.join(base_dir, 'app', 'data', 'bangalore_population.csv'))
-    print(f"✅ Loaded {len(crime_data)} crime records")
-    print(f"✅ Loaded {len(lighting_data)} lighting points")
-    print(f"✅ Loaded {len(population_data)} population points")
-except Exception as e:
-    print(f"❌ Error loading data: {e}")
-    raise
+# Safety layers are shared with the SafeSpace backend and loaded per city on demand
+import sys
+sys.path.append(os.path.join(base_dir, 'backend'))
+from services.city_registry import city_registry
+from services.heatmap import heatmap, parse_bbox
+from services.response_cache import response_cache, cached_response
+from services.columnar import encode_columns, wants_columnar, MIMETYPE as COLUMNAR_MIMETYPE
+from services.gazetteer import search_places, nominatim_search, reverse_place, nominatim_reverse
+
+print(f"✅ Registered cities: {', '.join(city.name for city in city_registry.cities.values())}")
+
+# OSRM routing: one pooled keep-alive session shared by a small thread pool,
+# so waypoint alternatives are fetched concurrently instead of one by one
+OSRM_SERVER = os.getenv('OSRM_SERVER', 'http://router.project-osrm.org').rstrip('/')
+OSRM_CONCURRENCY = int(os.getenv('OSRM_CONCURRENCY', 8))
+OSRM_TIMEOUT = (3.05, float(os.getenv('OSRM_READ_TIMEOUT', 10)))
+
+# Waypoint exploration stops at whichever budget runs out first; the time budget
+# also bounds the wait for the direct routes
+MAX_WAYPOINT_ROUTES = int(os.getenv('MAX_WAYPOINT_ROUTES', 25))
+WAYPOINT_TIME_BUDGET = float(os.getenv('WAYPOINT_TIME_BUDGET', 8))
+
+osrm_session = requests.Session()
+osrm_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OSRM_CONCURRENCY)
+osrm_session.mount('http://', osrm_adapter)
+osrm_session.mount('https://', osrm_adapter)
+osrm_executor = ThreadPoolExecutor(max_workers=OSRM_CONCURRENCY, thread_name_prefix='osrm')
 
 def validate_coordinates(lat, lon):
-    BANGALORE_BOUNDS = {
-        'min_lat': 12.704192, 'max_lat': 13.173706,
-        'min_lon': 77.269876, 'max_lon': 77.850066
-    }
-    try:
-        lat, lon = float(lat), float(lon)
-        return (BANGALORE_BOUNDS['min_lat'] <= lat <= BANGALORE_BOUNDS['max_lat'] and
-                BANGALORE_BOUNDS['min_lon'] <= lon <= BANGALORE_BOUNDS['max_lon'])
-    except:
-        return False
+    return city_registry.find_city(lat, lon) is not None
+
+def get_request_city():
+    """City named by the ?city= query parameter, or the default city"""
+    return city_registry.get_city(request.args.get('city'))
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     try:
@@ -179,86 +190,69 @@ def calculate_route_hash(route):
     hash_string = ''.join([f"{lat:.4f},{lon:.4f}" for lat, lon in sample_points])
     return hashlib.md5(hash_string.encode()).hexdigest()
 
-def calculate_crime_exposure(lat, lon, radius=0.003):
-    try:
-        nearby_crimes = crime_data[
-            (abs(crime_data['Latitude'] - lat) < radius) &
-            (abs(crime_data['Longitude'] - lon) < radius)
-        ]
-        return len(nearby_crimes)
-    except Exception as e:
-        print(f"❌ Error calculating crime: {e}")
-        return 0
+# Scoring profile of this app on top of the shared layer engine: box-shaped
+# neighbourhoods (the original per-point masks) and per-signal multipliers,
+# boosted when the matching preference is set
+ROUTE_SCORING_PROFILE = {
+    'metric': 'box',
+    'crime_radius': 0.003,
+    'radius': 0.005,
+    # signal: (preference, preferred weight, default weight)
+    'multipliers': {
+        'lighting': ('prefer_well_lit', 2.5, 0.8),
+        'population': ('prefer_populated', 2.0, 0.6),
+        'traffic': ('prefer_populated', 1.5, 0.4),
+        'main_road': ('prefer_main_roads', 2.5, 0.7)
+    }
+}
 
-def calculate_lighting_score(lat, lon, radius=0.005):
-    try:
-        nearby_lighting = lighting_data[
-            (abs(lighting_data['Latitude'] - lat) < radius) &
-            (abs(lighting_data['Longitude'] - lon) < radius)
-        ]
-        return nearby_lighting['lighting_score'].mean() if len(nearby_lighting) > 0 else 5.0
-    except:
-        return 5.0
+def sample_route_signals(points, layers, profile=ROUTE_SCORING_PROFILE):
+    """Crime counts and 0-10 lighting/population/traffic levels for every [lat, lon] point at once"""
+    lats, lons = np.asarray(points, dtype=np.float64).reshape(-1, 2).T
+    n = len(lats)
+    metric, radius = profile['metric'], profile['radius']
 
-def calculate_population_score(lat, lon, radius=0.005):
-    try:
-        nearby_pop = population_data[
-            (abs(population_data['Latitude'] - lat) < radius) &
-            (abs(population_data['Longitude'] - lon) < radius)
-        ]
-        if len(nearby_pop) > 0:
-            return (
-                nearby_pop['population_density'].mean() / 1000,
-                nearby_pop['traffic_level'].mean() / 10,
-                nearby_pop['is_main_road'].mean() > 0.5
-            )
-        return 5.0, 5.0, False
-    except:
-        return 5.0, 5.0, False
-
-def calculate_route_safety_comprehensive(route, preferences=None):
+    def sample(name, *args):
+        if name not in layers:
+            return None
+        return layers[name].sample(lats, lons, *args, metric=metric)
+
+    crime = sample('crime', profile['crime_radius'], 'count')
+    lighting = sample('lighting', radius, 'mean', 'lighting_score', 5.0)
+    population = sample('population', radius, 'mean', 'population_density', 5000.0)
+    traffic = sample('population', radius, 'mean', 'traffic_level', 50.0)
+    main_road = sample('population', radius, 'mean', 'is_main_road', 0.0)
+
+    return {
+        'crime': crime if crime is not None else np.zeros(n, dtype=np.int64),
+        'lighting': lighting if lighting is not None else np.full(n, 5.0),
+        'population': population / 1000 if population is not None else np.full(n, 5.0),
+        'traffic': traffic / 10 if traffic is not None else np.full(n, 5.0),
+        'main_road': main_road > 0.5 if main_road is not None else np.zeros(n, dtype=bool)
+    }
+
+def calculate_route_safety_comprehensive(route, preferences=None, layers=None, profile=ROUTE_SCORING_PROFILE):
     if not route or len(route) < 2:
         return None
     
     if preferences is None:
         preferences = {}
     
+    if layers is None:
+        layers = city_registry.layers_for_point(route[0][0], route[0][1])
+    
     try:
         sample_rate = max(1, len(route) // 50)
-        sampled_route = route[::sample_rate]
-        
-        total_crime = 0
-        max_crime_at_point = 0
-        crime_hotspot_count = 0
-        total_lighting = 0
-        total_population = 0
-        total_traffic = 0
-        main_road_count = 0
-        
-        for lat, lon in sampled_route:
-            crime_count = calculate_crime_exposure(lat, lon, radius=0.003)
-            total_crime += crime_count
-            max_crime_at_point = max(max_crime_at_point, crime_count)
-            if crime_count > 3:
-                crime_hotspot_count += 1
-            
-            light_score = calculate_lighting_score(lat, lon, radius=0.005)
-            total_lighting += light_score
-            
-            pop_score, traffic_score, is_main_road = calculate_population_score(lat, lon, radius=0.005)
-            total_population += pop_score
-            total_traffic += traffic_score
-            if is_main_road:
-                main_road_count += 1
+        signals = sample_route_signals(route[::sample_rate], layers, profile)
+        crime_counts = signals['crime']
         
-        n_points = len(sampled_route)
-        
-        avg_crime = total_crime / n_points
-        avg_lighting = total_lighting / n_points
-        avg_population = total_population / n_points
-        avg_traffic = total_traffic / n_points
-        main_road_pct = (main_road_count / n_points) * 100
-        crime_hotspot_pct = (crime_hotspot_count / n_points) * 100
+        avg_crime = float(crime_counts.mean())
+        max_crime_at_point = int(crime_counts.max())
+        avg_lighting = float(signals['lighting'].mean())
+        avg_population = float(signals['population'].mean())
+        avg_traffic = float(signals['traffic'].mean())
+        main_road_pct = float(signals['main_road'].mean()) * 100
+        crime_hotspot_pct = float((crime_counts > 3).mean()) * 100
         
         base_crime_penalty = min(40, avg_crime ** 1.2 * 5)
         max_crime_penalty = min(40, max_crime_at_point ** 1.4 * 7)
@@ -268,12 +262,17 @@ def calculate_route_safety_comprehensive(route, preferences=None):
         
         base_safety_score = max(0, 100 - total_crime_penalty)
         
-        lighting_multiplier = 1.0 + (avg_lighting / 10) * (2.5 if preferences.get('prefer_well_lit') else 0.8)
-        population_multiplier = 1.0 + (avg_population / 10) * (2.0 if preferences.get('prefer_populated') else 0.6)
-        traffic_multiplier = 1.0 + (avg_traffic / 10) * (1.5 if preferences.get('prefer_populated') else 0.4)
-        main_road_multiplier = 1.0 + (main_road_pct / 100) * (2.5 if preferences.get('prefer_main_roads') else 0.7)
-        
-        total_multiplier = (lighting_multiplier + population_multiplier + traffic_multiplier + main_road_multiplier) / 4
+        levels = {
+            'lighting': avg_lighting / 10,
+            'population': avg_population / 10,
+            'traffic': avg_traffic / 10,
+            'main_road': main_road_pct / 100
+        }
+        multipliers = [
+            1.0 + levels[signal] * (preferred if preferences.get(preference) else default)
+            for signal, (preference, preferred, default) in profile['multipliers'].items()
+        ]
+        total_multiplier = sum(multipliers) / len(multipliers)
         
         final_safety_score = min(100, base_safety_score * total_multiplier)
         
@@ -295,15 +294,15 @@ def calculate_route_safety_comprehensive(route, preferences=None):
         print(f"❌ Error calculating safety: {e}")
         return None
 
-def get_route_from_osrm(start_lat, start_lon, end_lat, end_lon, waypoint=None):
+def get_route_from_osrm(start_lat, start_lon, end_lat, end_lon, waypoint=None, timeout=OSRM_TIMEOUT):
     try:
         if not all(validate_coordinates(x, y) for x, y in [(start_lat, start_lon), (end_lat, end_lon)]):
             return None
         
         if waypoint:
-            url = f"http://router.project-osrm.org/route/v1/driving/{start_lon},{start_lat};{waypoint['lon']},{waypoint['lat']};{end_lon},{end_lat}"
+            url = f"{OSRM_SERVER}/route/v1/driving/{start_lon},{start_lat};{waypoint['lon']},{waypoint['lat']};{end_lon},{end_lat}"
         else:
-            url = f"http://router.project-osrm.org/route/v1/driving/{start_lon},{start_lat};{end_lon},{end_lat}"
+            url = f"{OSRM_SERVER}/route/v1/driving/{start_lon},{start_lat};{end_lon},{end_lat}"
         
         params = {
             'overview': 'full',
@@ -312,7 +311,7 @@ def get_route_from_osrm(start_lat, start_lon, end_lat, end_lon, waypoint=None):
             'steps': 'true'
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = osrm_session.get(url, params=params, timeout=timeout)
         data = response.json()
         
         if data['code'] != 'Ok':
@@ -367,6 +366,50 @@ def get_route_from_osrm(start_lat, start_lon, end_lat, end_lon, waypoint=None):
         print(f"❌ OSRM error: {e}")
         return None
 
+def plan_waypoints(start_lat, start_lon, end_lat, end_lon):
+    """Detour points either side of the straight line, skipping ones outside the city or too far off course"""
+    base_distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
+    
+    lat_diff = end_lat - start_lat
+    lon_diff = end_lon - start_lon
+    
+    perp_lat = -lon_diff
+    perp_lon = lat_diff
+    perp_magnitude = sqrt(perp_lat**2 + perp_lon**2)
+    
+    if perp_magnitude > 0:
+        perp_lat /= perp_magnitude
+        perp_lon /= perp_magnitude
+    
+    positions = [0.25, 0.5, 0.75]
+    offset_distances_km = [0.5, 1.2, 2.5]
+    offsets = [d / 111.0 for d in offset_distances_km]
+    directions = [1, -1]
+    
+    waypoints = []
+    for position in positions:
+        for offset in offsets:
+            for direction in directions:
+                mid_lat = start_lat + lat_diff * position
+                mid_lon = start_lon + lon_diff * position
+                
+                wp_lat = mid_lat + perp_lat * offset * direction
+                wp_lon = mid_lon + perp_lon * offset * direction
+                
+                if not validate_coordinates(wp_lat, wp_lon):
+                    continue
+                
+                wp_dist = (haversine_distance(start_lat, start_lon, wp_lat, wp_lon) + 
+                          haversine_distance(wp_lat, wp_lon, end_lat, end_lon))
+                detour_ratio = wp_dist / base_distance if base_distance > 0 else 999
+                
+                if detour_ratio > 1.8:
+                    continue
+                
+                waypoints.append({'lat': wp_lat, 'lon': wp_lon})
+    
+    return waypoints
+
 def calculate_composite_score(route, preferences):
     safety_weight = preferences.get('safety_weight', 0.7)
     distance_weight = preferences.get('distance_weight', 0.3)
@@ -439,100 +482,74 @@ def optimize_route():
         print(f"  Well lit: {preferences['prefer_well_lit']}")
         print(f"  Populated: {preferences['prefer_populated']}")
         
-        if not all(validate_coordinates(x, y) for x, y in [(start_lat, start_lon), (end_lat, end_lon)]):
-            return jsonify({'success': False, 'error': 'Coordinates outside Bangalore'}), 400
+        city = city_registry.find_city(start_lat, start_lon)
+        if city is None or not city.contains(end_lat, end_lon):
+            return jsonify({'success': False, 'error': 'Coordinates outside supported cities'}), 400
+        
+        layers = city_registry.get_layers(city)
+        print(f"  City: {city.name}")
         
         all_routes = []
         route_hashes = set()
+        started = time.monotonic()
+        
+        waypoints = plan_waypoints(start_lat, start_lon, end_lat, end_lon)
+        
+        # Direct alternatives and every waypoint detour are requested at once
+        direct_future = osrm_executor.submit(get_route_from_osrm, start_lat, start_lon, end_lat, end_lon)
+        waypoint_futures = [
+            osrm_executor.submit(get_route_from_osrm, start_lat, start_lon, end_lat, end_lon, waypoint=waypoint)
+            for waypoint in waypoints
+        ]
+        
+        def add_route(route_data, source, route_type):
+            route_hash = calculate_route_hash(route_data['route'])
+            if not route_hash or route_hash in route_hashes:
+                return None
+            safety = calculate_route_safety_comprehensive(route_data['route'], preferences, layers)
+            if not safety:
+                return None
+            route_data.update(safety)
+            route_data['source'] = source
+            route_data['type'] = route_type
+            all_routes.append(route_data)
+            route_hashes.add(route_hash)
+            return safety
         
         print("\n--- Phase 1: Direct Routes ---")
-        direct_routes = get_route_from_osrm(start_lat, start_lon, end_lat, end_lon, waypoint=None)
+        try:
+            direct_routes = direct_future.result(timeout=max(0.0, WAYPOINT_TIME_BUDGET - (time.monotonic() - started)))
+        except FuturesTimeout:
+            print(f"⏱️ Time budget of {WAYPOINT_TIME_BUDGET:.1f}s exhausted waiting for direct routes")
+            direct_routes = None
         
         if direct_routes:
             print(f"OSRM returned {len(direct_routes)} direct alternatives")
             for idx, route_data in enumerate(direct_routes):
-                route_hash = calculate_route_hash(route_data['route'])
-                if route_hash and route_hash not in route_hashes:
-                    safety = calculate_route_safety_comprehensive(route_data['route'], preferences)
-                    if safety:
-                        route_data.update(safety)
-                        route_data['source'] = f'direct_{idx+1}'
-                        route_data['type'] = 'direct'
-                        all_routes.append(route_data)
-                        route_hashes.add(route_hash)
-                        print(f"✅ Direct route {idx+1}: {route_data['distance_km']:.2f}km, safety={safety['safety_score']:.1f}, crime={safety['crime_density']:.1f}")
-        
-        print("\n--- Phase 2: Strategic Waypoint Exploration ---")
-        
-        base_distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
-        
-        lat_diff = end_lat - start_lat
-        lon_diff = end_lon - start_lon
-        
-        perp_lat = -lon_diff
-        perp_lon = lat_diff
-        perp_magnitude = sqrt(perp_lat**2 + perp_lon**2)
-        
-        if perp_magnitude > 0:
-            perp_lat /= perp_magnitude
-            perp_lon /= perp_magnitude
+                safety = add_route(route_data, f'direct_{idx+1}', 'direct')
+                if safety:
+                    print(f"✅ Direct route {idx+1}: {route_data['distance_km']:.2f}km, safety={safety['safety_score']:.1f}, crime={safety['crime_density']:.1f}")
         
-        positions = [0.25, 0.5, 0.75]
-        offset_distances_km = [0.5, 1.2, 2.5]
-        offsets = [d / 111.0 for d in offset_distances_km]
-        directions = [1, -1]
+        print(f"\n--- Phase 2: Strategic Waypoint Exploration ({len(waypoints)} waypoints) ---")
         
+        # Score each detour as soon as OSRM answers, until the route count or
+        # the time budget is exhausted
         waypoint_count = 0
-        max_waypoints = 25
-        
-        for position in positions:
-            if waypoint_count >= max_waypoints:
-                break
-                
-            for offset in offsets:
-                if waypoint_count >= max_waypoints:
+        remaining = max(0.0, WAYPOINT_TIME_BUDGET - (time.monotonic() - started))
+        try:
+            for future in as_completed(waypoint_futures, timeout=remaining):
+                for route_data in future.result() or []:
+                    if add_route(route_data, f'waypoint_{waypoint_count}', 'waypoint'):
+                        waypoint_count += 1
+                        if waypoint_count >= MAX_WAYPOINT_ROUTES:
+                            break
+                if waypoint_count >= MAX_WAYPOINT_ROUTES:
                     break
-                    
-                for direction in directions:
-                    if waypoint_count >= max_waypoints:
-                        break
-                    
-                    mid_lat = start_lat + lat_diff * position
-                    mid_lon = start_lon + lon_diff * position
-                    
-                    wp_lat = mid_lat + perp_lat * offset * direction
-                    wp_lon = mid_lon + perp_lon * offset * direction
-                    
-                    if not validate_coordinates(wp_lat, wp_lon):
-                        continue
-                    
-                    wp_dist = (haversine_distance(start_lat, start_lon, wp_lat, wp_lon) + 
-                              haversine_distance(wp_lat, wp_lon, end_lat, end_lon))
-                    detour_ratio = wp_dist / base_distance if base_distance > 0 else 999
-                    
-                    if detour_ratio > 1.8:
-                        continue
-                    
-                    waypoint_routes = get_route_from_osrm(start_lat, start_lon, end_lat, end_lon, 
-                                                          waypoint={'lat': wp_lat, 'lon': wp_lon})
-                    
-                    if waypoint_routes:
-                        for route_data in waypoint_routes:
-                            route_hash = calculate_route_hash(route_data['route'])
-                            
-                            if route_hash and route_hash not in route_hashes:
-                                safety = calculate_route_safety_comprehensive(route_data['route'], preferences)
-                                if safety:
-                                    route_data.update(safety)
-                                    route_data['source'] = f'waypoint_{waypoint_count}'
-                                    route_data['type'] = 'waypoint'
-                                    
-                                    all_routes.append(route_data)
-                                    route_hashes.add(route_hash)
-                                    waypoint_count += 1
-                                    
-                                    if waypoint_count >= max_waypoints:
-                                        break
+        except FuturesTimeout:
+            print(f"⏱️ Waypoint time budget of {WAYPOINT_TIME_BUDGET:.1f}s exhausted")
+        finally:
+            for future in waypoint_futures:
+                future.cancel()
         
         print(f"Waypoint routes added: {waypoint_count}")
         print(f"\nTotal routes collected: {len(all_routes)}")
@@ -643,32 +660,11 @@ def search_place():
         return jsonify({'success': False, 'error': 'No query provided'}), 400
 
     try:
-        url = 'https://nominatim.openstreetmap.org/search'
-        params = {
-            'q': q + ', Bangalore, India',
-            'format': 'jsonv2',
-            'addressdetails': 1,
-            'limit': 6,
-            'accept-language': 'en'
-        }
-        headers = {'User-Agent': 'safe-routes-app/1.0'}
-        resp = requests.get(url, params=params, headers=headers, timeout=5)
-        data = resp.json()
-
-        results = []
-        for item in data:
-            try:
-                lat = float(item.get('lat', 0))
-                lon = float(item.get('lon', 0))
-                if validate_coordinates(lat, lon):
-                    results.append({
-                        'display_name': item.get('display_name'),
-                        'lat': lat,
-                        'lon': lon,
-                        'type': item.get('type')
-                    })
-            except:
-                continue
+        city = get_request_city()
+        # Local gazetteer first; Nominatim (cached) only when nothing matches
+        results = search_places(city, q, limit=6)
+        if not results:
+            results = nominatim_search(city, q, limit=6)
 
         return jsonify({'success': True, 'results': results})
     except Exception as e:
@@ -684,72 +680,69 @@ def reverse_geocode():
         if not lat or not lon or not validate_coordinates(lat, lon):
             return jsonify({'success': False, 'error': 'Invalid coordinates'}), 400
 
-        url = 'https://nominatim.openstreetmap.org/reverse'
-        params = {
-            'lat': lat,
-            'lon': lon,
-            'format': 'jsonv2',
-            'accept-language': 'en'
-        }
-        headers = {'User-Agent': 'safe-routes-app/1.0'}
-        resp = requests.get(url, params=params, headers=headers, timeout=5)
-        data = resp.json()
+        lat, lon = float(lat), float(lon)
+        result = reverse_place(city_registry.find_city(lat, lon), lat, lon) or nominatim_reverse(lat, lon)
         
-        return jsonify({
-            'success': True,
-            'address': data.get('display_name')
-        })
+        return jsonify({'success': True, **result})
     except Exception as e:
         print(f"❌ Reverse geocoding error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def viewport_heatmap(name, total_key):
+    """Grid-aggregated heatmap of a layer for the ?bbox=west,south,east,north&zoom= viewport.
+
+    The encoded (and compressed) body is cached per layer version, so repeat
+    polls are answered from bytes or with a 304. ?format=binary returns
+    lat/lon/weight Float32 columns instead of JSON triples.
+    """
+    try:
+        city = get_request_city()
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        zoom = request.args.get('zoom', type=int)
+        layers = city_registry.get_layers(city)
+
+        binary = wants_columnar()
+
+        def build():
+            result = heatmap(city, layers, name, bbox, zoom)
+            meta = {
+                'success': True,
+                'zoom': result['zoom'],
+                'cells': len(result['data']),
+                total_key: len(layers[name]) if name in layers else 0
+            }
+            if binary:
+                cells = np.asarray(result['data'], dtype=float).reshape(-1, 3)
+                return encode_columns({'lat': cells[:, 0], 'lon': cells[:, 1], 'weight': cells[:, 2]}, meta)
+            return {**meta, 'data': result['data']}
+
+        version = layers[name].version if name in layers else None
+        key = ('heatmap', city.slug if city else None, name, bbox, zoom, binary)
+        mimetype = COLUMNAR_MIMETYPE if binary else 'application/json'
+        return cached_response(response_cache.get(key, version, build, mimetype))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/crime-heatmap', methods=['GET'])
 def get_crime_heatmap():
-    heatmap_data = crime_data[['Latitude', 'Longitude']].values.tolist()
-    return jsonify({
-        'success': True,
-        'data': heatmap_data,
-        'total_crimes': len(crime_data)
-    })
+    return viewport_heatmap('crime', 'total_crimes')
 
 @app.route('/api/lighting-heatmap', methods=['GET'])
 def get_lighting_heatmap():
-    try:
-        if 'lighting_score' in lighting_data.columns:
-            points = lighting_data[['Latitude', 'Longitude', 'lighting_score']].values.tolist()
-        else:
-            points = lighting_data[['Latitude', 'Longitude']].assign(lighting_score=5.0).values.tolist()
-        return jsonify({
-            'success': True,
-            'data': points,
-            'total_locations': len(points)
-        })
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return viewport_heatmap('lighting', 'total_locations')
 
 @app.route('/api/population-heatmap', methods=['GET'])
 def get_population_heatmap():
-    try:
-        if 'population_density' in population_data.columns:
-            points = population_data[['Latitude', 'Longitude', 'population_density']].values.tolist()
-        else:
-            points = population_data[['Latitude', 'Longitude']].assign(population_density=1.0).values.tolist()
-        return jsonify({
-            'success': True,
-            'data': points,
-            'total_locations': len(points)
-        })
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return viewport_heatmap('population', 'total_locations')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({
         'success': True,
         'message': 'Backend is running',
-        'crimes_loaded': len(crime_data),
-        'lighting_points': len(lighting_data),
-        'population_points': len(population_data)
+        'cities': city_registry.status()
     })
 
 @app.route('/api/rate-route', methods=['POST'])
@@ -766,9 +759,7 @@ if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 Women's Safety App - FULL APPLICATION (HTTPS)")
     print("="*60)
-    print(f"📊 Crime data: {len(crime_data)} records")
-    print(f"💡 Lighting data: {len(lighting_data)} points")
-    print(f"👥 Population data: {len(population_data)} points")
+    print(f"🏙️  Cities: {', '.join(city.name for city in city_registry.cities.values())} (layers load on first request)")
     print("\nFeatures Available:")
     print("✅ User Authentication (Login/Signup)")
     print("✅ Incident Reporting")